@@ -1,15 +1,21 @@
+import csv
+import hashlib
+import io
+import json
 import os
-from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from collections import defaultdict
-from decimal import InvalidOperation
 
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+import db_pool as pg_pool
+import page_catalog
+import response_cache
+import rollups
+
 
 # =========================
 # TIMEZONE
@@ -34,16 +40,36 @@ API_TOKEN = os.getenv("API_TOKEN")  # set in Railway Variables
 # =========================
 # CONNECTION POOL
 # =========================
-pool = SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    dsn=DATABASE_URL,
+# Endpoints are plain `def`, so they run on FastAPI's threadpool: the pool must be
+# thread-safe and WAIT for a free connection (db_pool.DBPool) instead of failing.
+# Every uvicorn worker process has its own pool, so API_DB_CONNECTIONS (the API's
+# share of Postgres max_connections) is split across WEB_CONCURRENCY workers.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+API_DB_CONNECTIONS = int(os.getenv("API_DB_CONNECTIONS", "20"))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX") or max(2, API_DB_CONNECTIONS // WEB_CONCURRENCY))
+DB_POOL_WAIT_SECONDS = float(os.getenv("DB_POOL_WAIT_SECONDS", "5"))
+
+pool = pg_pool.DBPool(
+    DATABASE_URL,
+    minconn=min(DB_POOL_MIN, DB_POOL_MAX),
+    maxconn=DB_POOL_MAX,
+    wait_timeout=DB_POOL_WAIT_SECONDS,
+    health_idle=float(os.getenv("DB_HEALTH_IDLE_SECONDS", "30")),
     sslmode="require",
 )
 
 
 def get_conn():
-    return pool.getconn()
+    """A pooled connection; 503 (retry later) if none frees up within DB_POOL_WAIT_SECONDS."""
+    try:
+        return pool.getconn()
+    except pg_pool.PoolTimeout:
+        raise HTTPException(
+            status_code=503,
+            detail="Database busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
 
 
 def put_conn(conn):
@@ -104,20 +130,102 @@ def init_db_safe():
                 );
             """)
 
+            # columns the bot migrates in (exported by /sales/export)
+            for column, kind in (("chatter_id", "BIGINT"), ("chatter_name", "TEXT"), ("chatter_username", "TEXT"),
+                                 ("chat_id", "BIGINT"), ("message_id", "BIGINT"), ("line_no", "INT")):
+                cur.execute(f"ALTER TABLE sales ADD COLUMN IF NOT EXISTS {column} {kind};")
+
             cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_team_ts ON sales(team, ts);")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_team_page ON sales(team, page);")
+            # keyset order of /sales/export
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_team_ts_id ON sales(team, ts, id);")
+
+            # rollup tables the bot maintains; created here too so reads never race the bot's first start.
+            # Never backfilled here: a bot that predates a rollup would not keep it up to date.
+            rollups.create_rollup_tables(cur)
+
+            # approved page tags; the bot seeds and edits them, the API only reads
+            page_catalog.ensure_catalog(cur)
 
         conn.commit()
     finally:
         put_conn(conn)
 
 
+# =========================
+# RESPONSE CACHE (/summary)
+# =========================
+SUMMARY_TTL_SECONDS = float(os.getenv("SUMMARY_TTL_SECONDS", "15"))
+SUMMARY_CACHE_MAX = 1024
+SUMMARY_CACHE = response_cache.ResponseCache(DATABASE_URL, SUMMARY_TTL_SECONDS, SUMMARY_CACHE_MAX)
+
+
+def _cached_json(key, if_none_match: str | None, compute, cache_control: str = "no-cache") -> Response:
+    """
+    Serves `compute()` (a JSON-able dict) through SUMMARY_CACHE with an ETag.
+    The ETag covers the data only (not the "from"/"to" stamps), so a client
+    stays on 304 for as long as the numbers are the same.
+    """
+    entry = SUMMARY_CACHE.get(key)
+    if entry is None:
+        token = SUMMARY_CACHE.token(key[0])
+        payload = compute()
+        data = {k: v for k, v in payload.items() if k not in ("from", "to")}
+        etag = '"' + hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=12).hexdigest() + '"'
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        SUMMARY_CACHE.put(key, token, etag, body)
+    else:
+        _, etag, body = entry
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if response_cache.etag_matches(if_none_match, etag):
+        SUMMARY_CACHE.count("not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# =========================
+# TELEGRAM WEBHOOK (OPTIONAL)
+# =========================
+# BOT_IN_API=1: this process also runs the bot, receiving its updates on the
+# webhook route (WEBHOOK_PATH) instead of a separate polling worker.
+# Needs BOT_TOKEN, WEBHOOK_URL (this service's public URL) and WEBHOOK_SECRET,
+# and exactly one worker: each worker would run its own jobs and sale spool.
+bot_application = None
+if os.getenv("BOT_IN_API") == "1":
+    if WEB_CONCURRENCY > 1:
+        raise RuntimeError(f"BOT_IN_API=1 needs WEB_CONCURRENCY=1 (got {WEB_CONCURRENCY})")
+
+    import testsalescheck as bot
+
+    if bot.webhook_url() is None:
+        raise RuntimeError("BOT_IN_API=1 needs WEBHOOK_URL, or Telegram has nowhere to send updates")
+
+    bot_application = bot.build_application()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    SUMMARY_CACHE.start_listener()
+    try:
+        if bot_application is None:
+            yield
+        else:
+            async with bot.webhook_lifespan(bot_application, bot.webhook_url()):
+                yield
+    finally:
+        SUMMARY_CACHE.stop_listener()
+
+
 # =========================
 # APP
 # =========================
-app = FastAPI(title="Sales Bot API")
+app = FastAPI(title="Sales Bot API", lifespan=lifespan)
 init_db_safe()
 
+if bot_application is not None:
+    app.include_router(bot.webhook_router(bot_application))
+
 
 # =========================
 # HEALTH
@@ -127,6 +235,13 @@ def health():
     return {"ok": True}
 
 
+@app.get("/metrics/db")
+def db_metrics(authorization: str | None = Header(default=None)):
+    """Connection pool of THIS worker process (one pool per uvicorn worker)."""
+    require_token(authorization)
+    return {"pid": os.getpid(), "workers": WEB_CONCURRENCY, **pool.metrics(), "summary_cache": SUMMARY_CACHE.stats()}
+
+
 @app.get("/dbtest")
 def dbtest():
     conn = get_conn()
@@ -215,6 +330,7 @@ def set_page_goal(payload: dict, authorization: str | None = Header(default=None
                 """,
                 (team, page, goal_val),
             )
+            rollups.notify_changed(cur, [team])
         conn.commit()
         return {"ok": True}
     finally:
@@ -224,100 +340,667 @@ def set_page_goal(payload: dict, authorization: str | None = Header(default=None
 # =========================
 # SUMMARY
 # =========================
+SUMMARY_MAX_DAYS = 366
+
+
+def parse_ph_time(value: str, name: str) -> datetime:
+    """ISO date or datetime; without an offset it is PH time."""
+    try:
+        dt = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date/datetime (e.g. 2025-01-31)")
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=PH_TZ)
+
+
 @app.get("/summary")
 def summary(
     days: int = 15,
     team: str = "Team 1",
+    from_: str | None = Query(default=None, alias="from"),
+    to: str | None = None,
     authorization: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
 ):
+    """
+    Per-page sales vs goals for the last `days` days, or for [from, to)
+    (either bound alone: the other one is now / from + days).
+    """
     require_token(authorization)
 
-    if days not in (15, 30):
-        raise HTTPException(status_code=400, detail="days must be 15 or 30")
-
     team = (team or "").strip()
     if not team:
         raise HTTPException(status_code=400, detail="team is required")
 
-    now_utc = datetime.now(timezone.utc)
-    cutoff_utc = now_utc - timedelta(days=days)
+    # repeat polls: cached body (no DB round trip) or 304 (no body at all)
+    window, resolve = _summary_window(days, from_, to)
+    return _cached_json((team, *window), if_none_match, lambda: _summary_payload(team, *resolve()))
+
+
+def _summary_window(days: int, from_: str | None, to: str | None):
+    """
+    (cache key part, resolve) for the requested period; resolve() -> (start, end, days or None)
+    is called when the response is computed, so a rolling window ends at that moment.
+    """
+    if not 1 <= days <= SUMMARY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {SUMMARY_MAX_DAYS}")
+
+    if from_ is None and to is None:
+        def resolve():
+            now = now_ph()
+            return now - timedelta(days=days), now, days
+
+        return (days,), resolve
+
+    start = parse_ph_time(from_, "from") if from_ is not None else None
+    end = parse_ph_time(to, "to") if to is not None else None
+
+    def resolve():
+        stop = end or now_ph()
+        begin = start or stop - timedelta(days=days)
+        if begin >= stop:
+            raise HTTPException(status_code=400, detail="from must be before to")
+        if stop - begin > timedelta(days=SUMMARY_MAX_DAYS):
+            raise HTTPException(status_code=400, detail=f"range is limited to {SUMMARY_MAX_DAYS} days")
+        return begin, stop, None
+
+    return (days, start and start.isoformat(), end and end.isoformat()), resolve
+
+
+def _summary_payload(team: str, start: datetime, end: datetime, days: int | None) -> dict:
+    source, params = rollups.period_source(team, start, end)
 
     conn = get_conn()
     try:
         with conn.cursor() as cur:
+            # ONE round trip: period totals (daily rollup + raw edge days) full-joined
+            # with goals, rounded and sorted; overall totals ride along on every row
             cur.execute(
-                """
-                SELECT page, COALESCE(SUM(amount), 0)
-                FROM sales
-                WHERE team = %s AND ts >= %s
-                GROUP BY page
-                ORDER BY page;
+                f"""
+                WITH totals AS (
+                    SELECT page, SUM(total) AS sales
+                    FROM ({source}) AS src
+                    GROUP BY page
+                )
+                SELECT page,
+                       ROUND(sales, 2)::float8 AS sales,
+                       ROUND(goal, 2)::float8,
+                       CASE WHEN goal > 0 THEN ROUND(sales / goal * 100, 1)::float8 END,
+                       ROUND(SUM(sales) OVER (), 2)::float8,
+                       ROUND(SUM(goal) OVER (), 2)::float8,
+                       CASE WHEN SUM(goal) OVER () > 0
+                            THEN ROUND(SUM(sales) OVER () / SUM(goal) OVER () * 100, 1)::float8 END
+                FROM (
+                    SELECT COALESCE(t.page, g.page) AS page,
+                           COALESCE(t.sales, 0) AS sales,
+                           COALESCE(g.goal, 0) AS goal
+                    FROM totals t
+                    FULL OUTER JOIN (
+                        SELECT page, goal FROM page_goals WHERE team = %(team)s
+                    ) AS g ON g.page = t.page
+                ) AS joined
+                ORDER BY sales DESC, page
                 """,
-                (team, cutoff_utc),
+                params,
             )
-            sales_rows = cur.fetchall()
+            result = cur.fetchall()
+    finally:
+        put_conn(conn)
+
+    total_sales, total_goal, overall_pct = result[0][4:] if result else (0.0, 0.0, None)
+    return {
+        "team": team,
+        "days": days if days is not None else round((end - start).total_seconds() / 86400.0, 2),
+        "from": start.astimezone(PH_TZ).isoformat(),
+        "to": end.astimezone(PH_TZ).isoformat(),
+        "total_sales": total_sales,
+        "total_goal": total_goal,
+        "overall_pct": overall_pct,
+        "rows": [
+            {"page": str(page), "sales": sales, "goal": goal, "pct": pct}
+            for page, sales, goal, pct, _, _, _ in result
+        ],
+    }
+
+
+# =========================
+# SUMMARY (SEVERAL TEAMS)
+# =========================
+SUMMARY_MAX_TEAMS = 200
+SUMMARY_FIELDS = ("rows", "totals", "grand")
+
+# GROUPING SETS per requested field; GROUPING(team, page) tells the levels apart
+_GROUPING_SETS = {"rows": "(team, page)", "totals": "(team)", "grand": "()"}
+_LEVEL_ROWS, _LEVEL_TOTALS, _LEVEL_GRAND = 0, 1, 3
+
 
-        totals = defaultdict(float)
-        for page, sales in sales_rows:
-            try:
-                totals[str(page)] = float(sales)
-            except (TypeError, ValueError, InvalidOperation):
-                totals[str(page)] = 0.0
+@app.get("/summary/teams")
+def summary_teams(
+    teams: str = "all",
+    days: int = 15,
+    from_: str | None = Query(default=None, alias="from"),
+    to: str | None = None,
+    fields: str = "totals,grand",
+    top: int | None = None,
+    authorization: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    /summary for several teams (comma-separated names, or "all") in one grouped query.
+
+    `fields` picks what comes back: "rows" (per-team page rows, at most `top` per
+    team), "totals" (per-team totals) and/or "grand" (all requested teams together).
+    """
+    require_token(authorization)
+
+    if teams.strip().lower() == "all":
+        names = None
+    else:
+        names = list(dict.fromkeys(t.strip() for t in teams.split(",") if t.strip()))
+        if not names:
+            raise HTTPException(status_code=400, detail='teams must be a comma-separated list or "all"')
+        if len(names) > SUMMARY_MAX_TEAMS:
+            raise HTTPException(status_code=400, detail=f"at most {SUMMARY_MAX_TEAMS} teams per request")
+
+    wanted = tuple(f for f in SUMMARY_FIELDS if f in {x.strip() for x in fields.split(",")})
+    unknown = {x.strip() for x in fields.split(",") if x.strip()} - set(SUMMARY_FIELDS)
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"fields must be a comma-separated subset of {', '.join(SUMMARY_FIELDS)}")
+    if top is not None and top < 1:
+        raise HTTPException(status_code=400, detail="top must be at least 1")
+
+    window, resolve = _summary_window(days, from_, to)
+    key = (response_cache.MULTI_TEAM_KEY, tuple(names) if names is not None else None, *window, wanted, top)
+    return _cached_json(key, if_none_match, lambda: _summary_teams_payload(names, *resolve(), wanted, top))
+
+
+def _summary_teams_payload(
+    names: list[str] | None, start: datetime, end: datetime, days: int | None, wanted: tuple, top: int | None
+) -> dict:
+    source, params = rollups.period_source_many(names, start, end)
+    team_filter = "team = ANY(%(teams)s)" if names is not None else "TRUE"
+    name_filter = "name = ANY(%(teams)s)" if names is not None else "TRUE"
+    params = {**params, "top": top}
+    # only grouping columns may be selected / passed to GROUPING()
+    if "rows" in wanted:
+        level, team, page = "GROUPING(team, page)", "team", "page"
+    elif "totals" in wanted:
+        level, team, page = f"GROUPING(team) * 2 + {_LEVEL_TOTALS}", "team", "NULL::text"
+    else:
+        level, team, page = str(_LEVEL_GRAND), "NULL::text", "NULL::text"
+
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            # ONE round trip for every team: period totals full-joined with goals, then
+            # page rows, team totals and the grand total as GROUPING SETS of the same
+            # join; registered teams without sales or goals still get a zero total
+            cur.execute(
+                f"""
+                WITH totals AS (
+                    SELECT team, page, SUM(total) AS sales
+                    FROM ({source}) AS src
+                    GROUP BY team, page
+                ),
+                joined AS (
+                    SELECT COALESCE(t.team, g.team) AS team,
+                           COALESCE(t.page, g.page) AS page,
+                           COALESCE(t.sales, 0) AS sales,
+                           COALESCE(g.goal, 0) AS goal
+                    FROM totals t
+                    FULL OUTER JOIN (
+                        SELECT team, page, goal FROM page_goals WHERE {team_filter}
+                    ) AS g ON g.team = t.team AND g.page = t.page
+
+                    UNION ALL
+
+                    SELECT DISTINCT name, NULL, 0, 0 FROM teams WHERE {name_filter}
+                ),
+                grouped AS (
+                    SELECT {level} AS level, {team} AS team, {page} AS page,
+                           SUM(sales) AS sales, SUM(goal) AS goal,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY {level}, {team}
+                               ORDER BY SUM(sales) DESC, {page}
+                           ) AS rank
+                    FROM joined
+                    GROUP BY GROUPING SETS ({", ".join(_GROUPING_SETS[f] for f in wanted)})
+                )
+                SELECT level, team, page,
+                       ROUND(sales, 2)::float8,
+                       ROUND(goal, 2)::float8,
+                       CASE WHEN goal > 0 THEN ROUND(sales / goal * 100, 1)::float8 END
+                FROM grouped
+                WHERE level <> {_LEVEL_ROWS}
+                   OR (page IS NOT NULL AND (%(top)s::int IS NULL OR rank <= %(top)s::int))
+                ORDER BY level DESC, team, sales DESC, page
+                """,
+                params,
+            )
+            result = cur.fetchall()
+    finally:
+        put_conn(conn)
+
+    empty = {"total_sales": 0.0, "total_goal": 0.0, "overall_pct": None}
+    out = {
+        "days": days if days is not None else round((end - start).total_seconds() / 86400.0, 2),
+        "from": start.astimezone(PH_TZ).isoformat(),
+        "to": end.astimezone(PH_TZ).isoformat(),
+    }
+    if "grand" in wanted:
+        out["grand"] = dict(empty)
+    by_team = {name: {"team": name} for name in names or ()}
+
+    for level, team, page, sales, goal, pct in result:
+        if level == _LEVEL_GRAND:
+            out["grand"] = {"total_sales": sales, "total_goal": goal, "overall_pct": pct}
+            continue
+        entry = by_team.setdefault(team, {"team": team})
+        if level == _LEVEL_TOTALS:
+            entry.update(total_sales=sales, total_goal=goal, overall_pct=pct)
+        else:
+            entry.setdefault("rows", []).append({"page": page, "sales": sales, "goal": goal, "pct": pct})
+
+    for entry in by_team.values():
+        if "totals" in wanted:
+            for k, v in empty.items():
+                entry.setdefault(k, v)
+        if "rows" in wanted:
+            entry.setdefault("rows", [])
+    if "rows" in wanted or "totals" in wanted:
+        out["teams"] = list(by_team.values())  # requested order, or by name for "all"
+    return out
+
+
+# =========================
+# SERIES (CHARTS)
+# =========================
+# bucket -> hours; all divide 24, so buckets align to PH midnight (and to shift starts up to 8h)
+SERIES_BUCKETS = {**{f"{h}h": h for h in (1, 2, 3, 4, 6, 8, 12, 24)}, "1d": 24}
+SERIES_DEFAULT_BUCKET = "2h"  # the bot's CHECKPOINT_HOURS: pace checkpoints fall on bucket edges
+SERIES_MAX_POINTS = 5000
+# a fully closed range only changes when an old sale is edited or reset, so browsers may reuse it
+SERIES_CLOSED_MAX_AGE = int(os.getenv("SERIES_CLOSED_MAX_AGE", "300"))
+
+
+@app.get("/series")
+def series(
+    team: str = "Team 1",
+    page: str | None = None,
+    bucket: str = SERIES_DEFAULT_BUCKET,
+    days: int = 1,
+    from_: str | None = Query(default=None, alias="from"),
+    to: str | None = None,
+    authorization: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    Sales per `bucket` (PH time, every bucket present, empty ones 0) for a team
+    or one of its pages, over the last `days` days or [from, to) widened to
+    whole buckets.
+    """
+    require_token(authorization)
+
+    team = (team or "").strip()
+    if not team:
+        raise HTTPException(status_code=400, detail="team is required")
+    page = page.strip() if page is not None else None
+    bucket_hours = SERIES_BUCKETS.get(bucket.strip().lower())
+    if bucket_hours is None:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(SERIES_BUCKETS)}")
+
+    _, resolve = _summary_window(days, from_, to)
+    start, end, _ = resolve()
+    start, end = rollups.bucket_floor(start, bucket_hours), rollups.bucket_ceil(end, bucket_hours)
+    if (end - start) / timedelta(hours=bucket_hours) > SERIES_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"at most {SERIES_MAX_POINTS} buckets per request")
+
+    # the last bucket is still filling whenever the range ends after now (always so
+    # for a rolling window); only fully closed ranges may be reused for SERIES_CLOSED_MAX_AGE
+    closed = end <= now_ph()
+    cache_control = f"private, max-age={SERIES_CLOSED_MAX_AGE}" if closed else "no-cache"
+
+    # keyed by the resolved buckets, so a rolling window moves on at each bucket edge
+    key = (team, "series", page, bucket_hours, start.isoformat(), end.isoformat())
+    return _cached_json(
+        key, if_none_match, lambda: _series_payload(team, page, start, end, bucket_hours, closed), cache_control
+    )
+
+
+def _series_payload(
+    team: str, page: str | None, start: datetime, end: datetime, bucket_hours: int, closed: bool
+) -> dict:
+    source, params = rollups.series_source(team, page, start, end, bucket_hours)
 
+    conn = get_conn()
+    try:
         with conn.cursor() as cur:
+            # rollup buckets (hourly, or daily for 24h) gap-filled by generate_series
             cur.execute(
-                "SELECT page, goal FROM page_goals WHERE team = %s;",
-                (team,),
+                f"""
+                SELECT b.bucket, COALESCE(ROUND(s.total, 2), 0)::float8, COALESCE(s.sale_count, 0)
+                FROM generate_series(
+                    %(start)s::timestamptz,
+                    %(end)s::timestamptz - make_interval(secs => %(bucket_secs)s),
+                    make_interval(secs => %(bucket_secs)s)
+                ) AS b (bucket)
+                LEFT JOIN ({source}) AS s ON s.bucket = b.bucket
+                ORDER BY b.bucket
+                """,
+                {**params, "end": end},
             )
-            goal_rows = cur.fetchall()
+            result = cur.fetchall()
+    finally:
+        put_conn(conn)
+
+    return {
+        "team": team,
+        "page": page,
+        "bucket_hours": bucket_hours,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "closed": closed,  # False: the last point is a partial bucket
+        "total_sales": round(sum(sales for _, sales, _ in result), 2),
+        "points": [
+            {"start": bucket.astimezone(PH_TZ).isoformat(), "sales": sales, "count": int(count)}
+            for bucket, sales, count in result
+        ],
+    }
 
-        goals = {}
-        for page, goal in goal_rows:
-            try:
-                goals[str(page)] = float(goal)
-            except (TypeError, ValueError, InvalidOperation):
-                goals[str(page)] = 0.0
 
+# =========================
+# SALES EXPORT
+# =========================
+EXPORT_PAGE_ROWS = 5000      # rows per keyset page = per pool checkout
+EXPORT_FETCH_ROWS = 1000     # server-side cursor fetch size
+EXPORT_COLUMNS = (
+    "id", "ts", "team", "page", "amount",
+    "chatter_id", "chatter_name", "chatter_username", "chat_id", "message_id", "line_no",
+)
+
+
+@app.get("/sales/export")
+def export_sales(
+    team: str,
+    from_: str = Query(alias="from"),
+    to: str | None = None,
+    format: str = "ndjson",
+    page: str | None = None,
+    chatter_id: int | None = None,
+    after: int | None = None,
+    authorization: str | None = Header(default=None),
+):
+    """
+    Raw sales of one team with from <= ts < to (to defaults to now), oldest first,
+    streamed as NDJSON or CSV. `after` = id of the last row already received:
+    the export resumes right behind it.
+    """
+    require_token(authorization)
+
+    team = (team or "").strip()
+    if not team:
+        raise HTTPException(status_code=400, detail="team is required")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    start = parse_ph_time(from_, "from")
+    end = parse_ph_time(to, "to") if to is not None else now_ph()
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+
+    where = ["team = %(team)s", "ts >= %(start)s", "ts < %(end)s", "(ts, id) > (%(key_ts)s, %(key_id)s)"]
+    params = {"team": team, "start": start, "end": end, "key_ts": start, "key_id": 0}
+    if page is not None:
+        where.append("page = %(page)s")
+        params["page"] = page.strip()
+    if chatter_id is not None:
+        where.append("chatter_id = %(chatter_id)s")
+        params["chatter_id"] = chatter_id
+
+    # first page (and the `after` lookup) before the 200 goes out, so a busy pool is still a 503
+    conn = get_conn()
+    try:
+        if after is not None:
+            with conn.cursor() as cur:
+                cur.execute("SELECT ts FROM sales WHERE id = %s AND team = %s", (after, team))
+                row = cur.fetchone()
+            if row is None:
+                raise HTTPException(status_code=400, detail="after must be the id of a sale of this team")
+            params.update(key_ts=row[0], key_id=after)
+        first = _export_page(conn, " AND ".join(where), params)
     finally:
         put_conn(conn)
 
-    all_pages = set(totals.keys()) | set(goals.keys())
+    encode = _ndjson_lines if format == "ndjson" else _csv_lines
+    name = f"sales-{team}-{start:%Y%m%d}-{end:%Y%m%d}".replace(" ", "_")
+    return StreamingResponse(
+        _export_stream(first, " AND ".join(where), params, encode),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+def _export_page(conn, where: str, params: dict) -> list:
+    """Next EXPORT_PAGE_ROWS rows after (key_ts, key_id), read through a server-side cursor."""
+    with conn.cursor(name="sales_export") as cur:
+        cur.itersize = EXPORT_FETCH_ROWS
+        cur.execute(
+            f"""
+            SELECT {", ".join(EXPORT_COLUMNS)}
+            FROM sales
+            WHERE {where}
+            ORDER BY ts, id
+            LIMIT {EXPORT_PAGE_ROWS}
+            """,
+            params,
+        )
+        rows = list(cur)
+    conn.rollback()
+    return rows
+
+
+def _export_stream(rows: list, where: str, params: dict, encode):
+    """
+    Yields encoded pages until the range is exhausted. Each page is a fresh keyset
+    query on (ts, id) (index idx_sales_team_ts_id, no OFFSET) on a connection that
+    goes back to the pool before the page is sent, so a slow client never holds one
+    and memory stays at one page whatever the range.
+    """
+    yield from encode(rows, header=True)
+    while len(rows) == EXPORT_PAGE_ROWS:
+        params = {**params, "key_ts": rows[-1][1], "key_id": rows[-1][0]}
+        conn = pool.getconn()
+        try:
+            rows = _export_page(conn, where, params)
+        finally:
+            put_conn(conn)
+        yield from encode(rows, header=False)
+
+
+def _export_row(row) -> dict:
+    out = dict(zip(EXPORT_COLUMNS, row))
+    out["ts"] = row[1].astimezone(PH_TZ).isoformat()
+    out["amount"] = float(row[4])
+    return out
+
+
+def _ndjson_lines(rows: list, header: bool):
+    if rows:
+        yield "".join(json.dumps(_export_row(r), ensure_ascii=False) + "\n" for r in rows)
+
+
+def _csv_lines(rows: list, header: bool):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for r in rows:
+        writer.writerow([r[0], r[1].astimezone(PH_TZ).isoformat(), *r[2:]])
+    if buf.tell():
+        yield buf.getvalue()
 
-    rows = []
-    total_sales = 0.0
-    total_goal = 0.0
 
-    for page in all_pages:
-        sales = float(totals.get(page, 0.0))
-        goal = float(goals.get(page, 0.0))
-        pct = (sales / goal * 100.0) if goal > 0 else None
+# =========================
+# LEADERBOARD (LIFETIME)
+# =========================
+@app.get("/leaderboard")
+def leaderboard(
+    team: str = "Team 1",
+    authorization: str | None = Header(default=None),
+):
+    require_token(authorization)
 
-        total_sales += sales
-        total_goal += goal
+    team = (team or "").strip()
+    if not team:
+        raise HTTPException(status_code=400, detail="team is required")
 
-        rows.append({
-            "page": page,
-            "sales": round(sales, 2),
-            "goal": round(goal, 2),
-            "pct": round(pct, 1) if pct is not None else None,
-        })
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            # running totals kept by the bot: O(pages), independent of history size
+            totals = rollups.lifetime_totals(cur, team)
+    finally:
+        put_conn(conn)
 
-    rows.sort(key=lambda r: r["sales"], reverse=True)
+    return {
+        "team": team,
+        "total_sales": round(sum((t for _, t in totals), 0.0), 2),
+        "rows": [
+            {"rank": i, "page": page, "sales": round(total, 2)}
+            for i, (page, total) in enumerate(totals, 1)
+        ],
+    }
 
-    overall_pct = (total_sales / total_goal * 100.0) if total_goal > 0 else None
 
-    now_ph_time = now_ph()
-    cutoff_ph_time = now_ph_time - timedelta(days=days)
+# =========================
+# CHATTERS (TIERS)
+# =========================
+# "name:top percent" from best to worst: S = top 10% of the team's chatters, ...
+CHATTER_TIERS = rollups.parse_tiers(os.getenv("CHATTER_TIERS", "S:10,A:30,B:60,C:100"))
+CHATTER_MAX_ROWS = 1000
+
+
+@app.get("/chatters")
+def chatters(
+    team: str = "Team 1",
+    period: str = "30d",
+    limit: int = 100,
+    authorization: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    Chatters of a team ranked by sales, with their tier, for period "shift"
+    (current shift), "day" (today, PH) or "<N>d" (the last N PH days, today included).
+    """
+    require_token(authorization)
+
+    team = (team or "").strip()
+    if not team:
+        raise HTTPException(status_code=400, detail="team is required")
+
+    period = period.strip().lower()
+    if period == "shift":
+        days = None
+    elif period == "day":
+        days = 1
+    elif period.endswith("d") and period[:-1].isdigit() and 1 <= int(period[:-1]) <= SUMMARY_MAX_DAYS:
+        days = int(period[:-1])
+    else:
+        raise HTTPException(status_code=400, detail=f'period must be "shift", "day" or 1d..{SUMMARY_MAX_DAYS}d')
+    if not 1 <= limit <= CHATTER_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CHATTER_MAX_ROWS}")
+
+    return _cached_json(
+        (team, "chatters", period, limit), if_none_match, lambda: _chatters_payload(team, period, days, limit)
+    )
+
+
+def _chatters_payload(team: str, period: str, days: int | None, limit: int) -> dict:
+    now = now_ph()
+    source, params, start = rollups.chatter_source(team, now, days)
+
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            # ranked from the chatter rollup (chatters x days rows); names are the
+            # latest sale's, one idx_sales_chatter_ts probe per returned chatter
+            cur.execute(
+                f"""
+                WITH ranked AS (
+                    SELECT chatter_id,
+                           SUM(total) AS sales,
+                           SUM(sale_count) AS sale_count,
+                           RANK() OVER (ORDER BY SUM(total) DESC) AS rank,
+                           CUME_DIST() OVER (ORDER BY SUM(total) DESC) AS cume,
+                           COUNT(*) OVER () AS chatters,
+                           SUM(SUM(total)) OVER () AS team_sales
+                    FROM ({source}) AS src
+                    GROUP BY chatter_id
+                    ORDER BY sales DESC, chatter_id
+                    LIMIT %(limit)s
+                )
+                SELECT r.rank, r.chatter_id, who.chatter_name, who.chatter_username,
+                       ROUND(r.sales, 2)::float8, r.sale_count, r.cume,
+                       r.chatters, ROUND(r.team_sales, 2)::float8
+                FROM ranked r
+                LEFT JOIN LATERAL (
+                    SELECT chatter_name, chatter_username
+                    FROM sales
+                    WHERE chatter_id = r.chatter_id
+                    ORDER BY ts DESC
+                    LIMIT 1
+                ) AS who ON TRUE
+                ORDER BY r.rank, r.chatter_id
+                """,
+                {**params, "limit": limit},
+            )
+            result = cur.fetchall()
+    finally:
+        put_conn(conn)
 
     return {
         "team": team,
-        "days": days,
-        "from": cutoff_ph_time.isoformat(),
-        "to": now_ph_time.isoformat(),
-        "total_sales": round(total_sales, 2),
-        "total_goal": round(total_goal, 2),
-        "overall_pct": round(overall_pct, 1) if overall_pct is not None else None,
-        "rows": rows,
+        "period": period,
+        "from": start.isoformat(),
+        "to": now.isoformat(),
+        "chatters": int(result[0][7]) if result else 0,
+        "total_sales": result[0][8] if result else 0.0,
+        "rows": [
+            {
+                "rank": int(rank),
+                "chatter_id": int(chatter_id),
+                "name": name,
+                "username": username,
+                "sales": sales,
+                "sale_count": int(sale_count),
+                "tier": rollups.chatter_tier(cume, CHATTER_TIERS),
+            }
+            for rank, chatter_id, name, username, sales, sale_count, cume, _, _ in result
+        ],
+    }
+
+
+# =========================
+# PAGES (CATALOG)
+# =========================
+# last loaded catalog; reloaded only when the bot bumps the catalog version
+_catalog = None
+
+
+@app.get("/pages")
+def pages(authorization: str | None = Header(default=None)):
+    global _catalog
+    require_token(authorization)
+
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            catalog = _catalog = page_catalog.reload_if_changed(cur, _catalog)
+    finally:
+        put_conn(conn)
+
+    return {
+        "version": catalog.version,
+        "pages": [{"tag": tag, "page": page} for tag, page in sorted(catalog.pages.items())],
     }
 
 
@@ -360,6 +1043,7 @@ def upsert_page_goal(
                 """,
                 (team, page, goal),
             )
+            rollups.notify_changed(cur, [team])
         conn.commit()
     finally:
         put_conn(conn)
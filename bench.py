@@ -0,0 +1,1074 @@
+"""
+Local benchmarks for the sales bot + API.
+
+    DATABASE_URL=postgres://... python bench.py ingest
+    DATABASE_URL=postgres://... python bench.py burst
+    DATABASE_URL=postgres://... python bench.py webhook
+    DATABASE_URL=postgres://... python bench.py summary --rows 1000000 10000000
+    DATABASE_URL=postgres://... python bench.py summary-teams
+    DATABASE_URL=postgres://... python bench.py export --rows 1000000
+    DATABASE_URL=postgres://... python bench.py chatters
+    DATABASE_URL=postgres://... python bench.py series
+    python bench.py parser
+
+Benchmarks only write to throwaway teams named "__bench__..." and delete
+them again when they finish, so they are safe to point at a dev database.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from urllib.parse import parse_qs
+
+# the bot module refuses to import without a token; benchmarks never talk to Telegram
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+BENCH_TEAM = "__bench__"
+
+
+# ----------------- HELPERS -----------------
+def _timeit(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+
+def _cleanup(bot, team: str):
+    import rollups
+
+    with bot.db_cursor() as cur:
+        cur.execute("DELETE FROM sales WHERE team=%s", (team,))
+        cur.execute("DELETE FROM team_pages WHERE team=%s", (team,))
+        for table in rollups.ROLLUPS:
+            cur.execute(f"DELETE FROM {table} WHERE team=%s", (team,))
+
+
+# ----------------- INGEST -----------------
+def _legacy_ingest(bot, team: str, sales, ts_iso: str):
+    # what handle_sales used to do: INSERT + team_pages upsert per line, each its own commit
+    for page, amount in sales:
+        with bot.db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO sales (team, page, amount, ts) VALUES (%s, %s, %s, %s)",
+                (team, page, amount, ts_iso),
+            )
+        with bot.db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO team_pages (team, page) VALUES (%s, %s) ON CONFLICT (team, page) DO NOTHING",
+                (team, page),
+            )
+
+
+def bench_ingest(args):
+    import testsalescheck as bot
+
+    bot.init_db()
+    team = BENCH_TEAM + "ingest"
+    pages = sorted(set(bot.ALLOWED_PAGES.values()))
+    ts_iso = bot.now_ph().isoformat()
+
+    print("per-message latency (median ms) vs lines per message")
+    print(f"{'lines':>6} {'per-line':>10} {'batched':>10} {'speedup':>8}")
+    try:
+        for n in args.lines:
+            sales = [(pages[i % len(pages)], 10.0) for i in range(n)]
+            legacy = _timeit(lambda: _legacy_ingest(bot, team, sales, ts_iso), args.repeat)
+            batched = _timeit(
+                lambda: bot.db_add_sales(team, sales, ts_iso, None, None, None), args.repeat
+            )
+            print(f"{n:>6} {legacy:>10.2f} {batched:>10.2f} {legacy / batched:>7.1f}x")
+    finally:
+        _cleanup(bot, team)
+
+
+# ----------------- SCHEDULED GOALBOARD -----------------
+def _legacy_goalboard(bot, teams, start):
+    # old send_scheduled_goalboard: raw SUM + team_pages query per team (2N queries)
+    out = []
+    for team in teams:
+        with bot.db_cursor() as cur:
+            cur.execute(
+                "SELECT page, COALESCE(SUM(amount), 0) FROM sales WHERE team=%s AND ts >= %s GROUP BY page",
+                (team, start),
+            )
+            rows = [(str(p), float(t)) for (p, t) in cur.fetchall()]
+        with bot.db_cursor() as cur:
+            cur.execute("SELECT page FROM team_pages WHERE team=%s", (team,))
+            pages = [str(r[0]) for r in cur.fetchall()]
+        header_text, lines = bot._build_goalboard_table_lines(team, start, rows, pages)
+        out.append((team, bot._chunk_team_table_messages(team, header_text, lines)))
+    return out
+
+
+def _batch_goalboard(bot, teams, start):
+    batch = bot.db_get_goalboard_batch(teams, start)
+    return bot._build_goalboard_batch_messages(teams, start, batch)
+
+
+def bench_goalboard(args):
+    import testsalescheck as bot
+
+    bot.init_db()
+    now = bot.now_ph()
+    start = bot.shift_start(now)
+    all_pages = sorted(set(bot.ALLOWED_PAGES.values()))
+    teams = [f"{BENCH_TEAM}gb{i:03d}" for i in range(args.teams)]
+
+    try:
+        for n, team in enumerate(teams):
+            sales = [(all_pages[(n + i) % len(all_pages)], 5.0) for i in range(args.sales)]
+            for i in range(0, len(sales), 40):
+                bot.db_add_sales(team, sales[i:i + 40], now.isoformat(), None, None, None)
+
+        legacy = _timeit(lambda: _legacy_goalboard(bot, teams, start), args.repeat)
+        batched = _timeit(lambda: _batch_goalboard(bot, teams, start), args.repeat)
+        print(f"scheduled goalboard for {args.teams} teams ({args.sales} sales each this shift), median ms")
+        print(f"  per-team (2N queries): {legacy:>9.2f}")
+        print(f"  batched  (2 queries):  {batched:>9.2f}   {legacy / batched:.1f}x")
+    finally:
+        for team in teams:
+            _cleanup(bot, team)
+
+
+# ----------------- SPOOL -----------------
+def bench_spool(args):
+    import tempfile
+
+    import sale_spool
+    import testsalescheck as bot
+
+    bot.init_db()
+    team = BENCH_TEAM + "spool"
+    pages = sorted(set(bot.ALLOWED_PAGES.values()))
+    sales = [(pages[i % len(pages)], 10.0) for i in range(args.lines)]
+    lines = [(i + 1, page, amount) for i, (page, amount) in enumerate(sales)]
+    ts_iso = bot.now_ph().isoformat()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spool = sale_spool.SaleSpool(os.path.join(tmp, "bench_spool.db"))
+        mids = iter(range(1, 10**9))
+        try:
+            direct = _timeit(lambda: bot.db_add_sales(team, sales, ts_iso, None, None, None), args.repeat)
+            spooled = _timeit(
+                lambda: spool.append(-1, next(mids), team, ts_iso, None, None, None, lines), args.repeat
+            )
+            entries = spool.pending(limit=-1)
+            t0 = time.perf_counter()
+            for i in range(0, len(entries), bot.SPOOL_BATCH):
+                bot.db_replay_spool(entries[i:i + bot.SPOOL_BATCH])
+            replay = (time.perf_counter() - t0) * 1000.0
+            t0 = time.perf_counter()
+            bot.db_replay_spool(entries)  # everything already stored: all skipped
+            dup = (time.perf_counter() - t0) * 1000.0
+        finally:
+            spool.close()
+            _cleanup(bot, team)
+
+    print(f"time to acknowledge a {args.lines}-line sale message (median ms)")
+    print(f"  direct Postgres write:   {direct:>8.2f}")
+    print(f"  SQLite spool (fsync):    {spooled:>8.2f}")
+    print(f"replay {len(entries)} spooled messages: {replay:.1f} ms, again (all unchanged): {dup:.1f} ms")
+
+
+# ----------------- PARSER -----------------
+def _legacy_parse(allowed_pages, text: str):
+    # old handle_sales loop: strip/split/float per line + lowercase first-token lookup
+    sales, unknown_tags = [], set()
+    for raw in text.splitlines():
+        line = raw.strip().lstrip("*•- ").strip()
+        if not line.startswith("+"):
+            continue
+        parts = line[1:].split(maxsplit=1)
+        if len(parts) < 2:
+            continue
+        try:
+            amount = float(parts[0])
+        except ValueError:
+            continue
+        page = allowed_pages.get(parts[1].strip().split()[0].lower())
+        if not page:
+            unknown_tags.add(parts[1].strip().split()[0])
+            continue
+        sales.append((page, amount))
+    return sales, unknown_tags
+
+
+def _sample_message(tags, n: int) -> str:
+    # mix of bullets, multi-word tags, trailing notes and the odd typo, like real chat traffic
+    lines = []
+    for i in range(n):
+        tag = tags[i % len(tags)]
+        if i % 17 == 16:
+            tag = tag + "x"
+        bullet = ("", "• ", "- ", "* ")[i % 4]
+        note = " tip" if i % 5 == 0 else ""
+        lines.append(f"{bullet}+{(i % 90) + 10}.50 {tag}{note}")
+    return "\n".join(lines)
+
+
+def bench_parser(args):
+    # only ALLOWED_PAGES is needed; the bot's DB pool is lazy and never connects here
+    os.environ.setdefault("DATABASE_URL", "postgres://unused")
+    import sale_parser
+    import testsalescheck as bot
+
+    t0 = time.perf_counter()
+    index = sale_parser.TagIndex(bot.ALLOWED_PAGES)
+    build_ms = (time.perf_counter() - t0) * 1000.0
+    print(f"tag index: {len(index)} tags, max {index.max_words} words, built in {build_ms:.2f} ms")
+
+    tags = list(bot.ALLOWED_PAGES)
+    print("parse time per message (median µs) vs lines per message")
+    print(f"{'lines':>6} {'legacy':>10} {'parser':>10} {'speedup':>8}")
+    for n in args.lines:
+        text = _sample_message(tags, n)
+        legacy = _timeit(lambda: _legacy_parse(bot.ALLOWED_PAGES, text), args.repeat) * 1000.0
+        parsed = _timeit(lambda: sale_parser.parse_sales(text, index), args.repeat) * 1000.0
+        print(f"{n:>6} {legacy:>10.1f} {parsed:>10.1f} {legacy / parsed:>7.1f}x")
+
+    typos = [t[:-1] if i % 2 else t + "x" for i, t in enumerate(tags)]
+    per_token = _timeit(lambda: [index.suggest(t) for t in typos], args.repeat // 10 or 1) * 1000.0 / len(typos)
+    print(f"did-you-mean (top 3, trigram index): {per_token:.1f} µs per unknown tag")
+
+
+# ----------------- BURST (CONCURRENT UPDATES) -----------------
+def _fake_telegram(latency: float):
+    from telegram.request import BaseRequest
+
+    class FakeTelegram(BaseRequest):
+        """Answers Bot API calls locally after `latency` s; records when each reply went out."""
+
+        def __init__(self):
+            self.replied = {}  # (chat_id, replied-to message_id) -> perf_counter()
+            self.ids = itertools.count(1)
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, **timeouts):
+            await asyncio.sleep(latency)
+            endpoint = url.rsplit("/", 1)[-1]
+            params = request_data.parameters if request_data else {}
+            if endpoint == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            elif endpoint == "sendMessage":
+                chat_id = int(params["chat_id"])
+                self.replied.setdefault((chat_id, params.get("reply_to_message_id")), time.perf_counter())
+                result = {
+                    "message_id": next(self.ids), "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "supergroup"}, "text": params.get("text", ""),
+                }
+            else:
+                result = True
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    return FakeTelegram()
+
+
+def _burst_updates(bot, chats: list[int], per_chat: int, reports: int):
+    # /quotamonth from the first groups lands first, then every group's sales interleaved
+    user = {"id": bot.OWNER_ID, "is_bot": False, "first_name": "Bench"}
+    tags = list(bot.ALLOWED_PAGES)
+    update_ids = itertools.count(1)
+
+    def message(chat_id, message_id, text, command=False):
+        msg = {
+            "message_id": message_id, "date": int(time.time()), "text": text, "from": user,
+            "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+        }
+        if command:
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"update_id": next(update_ids), "message": msg}
+
+    updates = [message(chats[i % len(chats)], 1, "/quotamonth", command=True) for i in range(reports)]
+    for n in range(per_chat):
+        for i, chat_id in enumerate(chats):
+            updates.append(message(chat_id, 100 + n, f"+{10 + n}.50 {tags[(i + n) % len(tags)]}"))
+    return updates
+
+
+async def _run_burst(bot, raw_updates: list, concurrency: int, args) -> dict:
+    from telegram import Update
+
+    fake = _fake_telegram(args.api_ms / 1000.0)
+    app = bot.build_application(token="0:bench", concurrency=concurrency, request=fake)
+    async with app:
+        await app.start()
+        sent = {}
+        t0 = time.perf_counter()
+        for raw in raw_updates:
+            msg = raw["message"]
+            sent[(msg["chat"]["id"], msg["message_id"])] = time.perf_counter()
+            await app.update_queue.put(Update.de_json(raw, app.bot))
+        deadline = t0 + args.timeout
+        while len(fake.replied) < len(sent) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        wall = time.perf_counter() - t0
+        await app.stop()
+
+    latency = lambda key: (fake.replied[key] - sent[key]) * 1000.0
+    sales = sorted(latency(k) for k in sent if k[1] >= 100 and k in fake.replied)
+    reports = [latency(k) for k in sent if k[1] < 100 and k in fake.replied]
+    pct = lambda p: sales[min(len(sales) - 1, int(p * len(sales)))] if sales else float("nan")
+    return {
+        "wall": wall, "missing": len(sent) - len(fake.replied),
+        "p50": pct(0.50), "p95": pct(0.95), "max": pct(1.0),
+        "report": max(reports) if reports else float("nan"),
+    }
+
+
+def _burst_order_ok(bot, teams: list[str]) -> bool:
+    # every group's sales must be stored in the order they were sent
+    with bot.db_cursor() as cur:
+        cur.execute(
+            "SELECT team, message_id FROM sales WHERE team = ANY(%s) ORDER BY id",
+            (teams,),
+        )
+        last = {}
+        for team, message_id in cur.fetchall():
+            if message_id < last.get(team, 0):
+                return False
+            last[team] = message_id
+    return True
+
+
+def bench_burst(args):
+    import tempfile
+
+    import testsalescheck as bot
+
+    bot.init_db()
+    bot.load_from_db()
+    chats = [-(10**12) - i for i in range(args.chats)]
+    teams = [f"{BENCH_TEAM}burst{i}" for i in range(args.chats)]
+    raw_updates = _burst_updates(bot, chats, args.messages, args.reports)
+
+    # /quotamonth made slow on purpose: a long report query holding a DB connection
+    real_period_totals = bot.db_get_period_totals
+
+    def slow_period_totals(team, cutoff, now):
+        with bot.db_cursor() as cur:
+            cur.execute("SELECT pg_sleep(%s)", (args.report_ms / 1000.0,))
+        return real_period_totals(team, cutoff, now)
+
+    async def run_all():
+        results = []
+        for concurrency in (1, args.concurrency):
+            for team in teams:
+                _cleanup(bot, team)
+            results.append((concurrency, await _run_burst(bot, raw_updates, concurrency, args)))
+            await bot.flush_spool()
+            results[-1][1]["ordered"] = _burst_order_ok(bot, teams)
+        return results
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.SALE_SPOOL_PATH = os.path.join(tmp, "bench_spool.db")
+        bot.db_get_period_totals = slow_period_totals
+        for chat_id, team in zip(chats, teams):
+            bot.GROUP_TEAMS[chat_id] = team
+            bot.CHAT_ADMINS[chat_id][bot.OWNER_ID] = 1
+        try:
+            results = asyncio.run(run_all())
+        finally:
+            bot.db_get_period_totals = real_period_totals
+            for chat_id in chats:
+                bot.GROUP_TEAMS.pop(chat_id, None)
+                bot.CHAT_ADMINS.pop(chat_id, None)
+            for team in teams:
+                _cleanup(bot, team)
+            if bot.spool is not None:
+                bot.spool.close()
+
+    print(
+        f"burst: {args.reports} x /quotamonth ({args.report_ms} ms query) then "
+        f"{args.chats} groups x {args.messages} sales; Telegram API {args.api_ms} ms per call"
+    )
+    print(f"{'updates at once':>16} {'wall s':>8} {'sale p50':>9} {'p95':>8} {'max':>8} {'report':>8}  in order")
+    for concurrency, r in results:
+        missing = f"  ({r['missing']} unanswered)" if r["missing"] else ""
+        print(
+            f"{concurrency:>16} {r['wall']:>8.2f} {r['p50']:>8.0f}ms {r['p95']:>6.0f}ms {r['max']:>6.0f}ms "
+            f"{r['report']:>6.0f}ms  {'yes' if r['ordered'] else 'NO'}{missing}"
+        )
+
+
+# ----------------- WEBHOOK VS POLLING (FAKE TELEGRAM SERVER) -----------------
+class _FakeBotAPI:
+    """
+    Minimal local Bot API server. Updates "sent by users" go out through getUpdates
+    (long poll) or are pushed to the registered webhook; replies are timestamped.
+    Every hop between Telegram and the bot costs `net_ms` (one way).
+    """
+
+    def __init__(self, net_ms: float):
+        from fastapi import FastAPI, Request
+
+        self.net = net_ms / 1000.0
+        self.queue = asyncio.Queue()  # updates waiting for getUpdates
+        self.webhook = None           # (url, secret_token) once setWebhook was called
+        self.sent = {}                # (chat_id, message_id) -> perf_counter() when the user sent it
+        self.replied = {}             # (chat_id, replied-to message_id) -> perf_counter()
+        self.ids = itertools.count(1)
+        self.pushes = set()
+        self.client = None
+
+        self.app = FastAPI()
+
+        @self.app.post("/bot{token}/{method}")
+        async def call(token: str, method: str, request: Request):
+            params = {k: v[-1] for k, v in parse_qs((await request.body()).decode()).items()}
+            result = await self._handle(method, params)
+            await asyncio.sleep(self.net)
+            return {"ok": True, "result": result}
+
+    async def _handle(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method == "setWebhook":
+            self.webhook = (params["url"], params.get("secret_token"))
+            return True
+        if method == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method == "getUpdates":
+            try:
+                updates = [await asyncio.wait_for(self.queue.get(), float(params.get("timeout", 0)) or 0.001)]
+            except asyncio.TimeoutError:
+                return []
+            while not self.queue.empty():
+                updates.append(self.queue.get_nowait())
+            return updates
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            reply_to = params.get("reply_to_message_id")
+            self.replied.setdefault((chat_id, int(reply_to) if reply_to else None), time.perf_counter())
+            return {
+                "message_id": next(self.ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup"}, "text": params.get("text", ""),
+            }
+        return True
+
+    def send(self, update: dict):
+        msg = update["message"]
+        self.sent[(msg["chat"]["id"], msg["message_id"])] = time.perf_counter()
+        if self.webhook is None:
+            self.queue.put_nowait(update)
+        else:
+            task = asyncio.create_task(self._push(update))
+            self.pushes.add(task)
+            task.add_done_callback(self.pushes.discard)
+
+    async def _push(self, update: dict):
+        await asyncio.sleep(self.net)
+        url, secret = self.webhook
+        resp = await self.client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+        resp.raise_for_status()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _serve(asgi_app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def _stop_server(server_task):
+    server, task = server_task
+    server.should_exit = True
+    await task
+
+
+async def _drive(fake: _FakeBotAPI, updates: list, gap: float, timeout: float) -> list[float]:
+    """Sends `updates` one every `gap` s; returns update->reply latencies in ms."""
+    fake.sent.clear()
+    fake.replied.clear()
+    for update in updates:
+        fake.send(update)
+        await asyncio.sleep(gap)
+    deadline = time.perf_counter() + timeout
+    while len(fake.replied) < len(fake.sent) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.005)
+    return sorted((fake.replied[k] - t) * 1000.0 for k, t in fake.sent.items() if k in fake.replied)
+
+
+async def _webhook_vs_polling(bot, updates: list, args, reset) -> dict:
+    import httpx
+    from fastapi import FastAPI
+
+    fake = _FakeBotAPI(args.net_ms)
+    api_port, hook_port = _free_port(), _free_port()
+    fake_server = await _serve(fake.app, api_port)
+    base_url = f"http://127.0.0.1:{api_port}/bot"
+    secret = "bench-secret"
+    results = {}
+
+    async with httpx.AsyncClient() as client:
+        fake.client = client
+
+        # long polling (what the worker does today)
+        application = bot.build_application(token="0:bench", base_url=base_url)
+        async with application:
+            await application.start()
+            await application.updater.start_polling(poll_interval=0.0, timeout=10)
+            results["polling"] = await _drive(fake, updates, args.gap_ms / 1000.0, args.timeout)
+            await application.updater.stop()
+            await application.stop()
+        await bot.flush_spool()
+        reset()  # same messages again below: start from an empty table
+
+        # webhook: the bot's route served by its own ASGI server
+        application = bot.build_application(token="0:bench", base_url=base_url)
+        web = FastAPI()
+        web.include_router(bot.webhook_router(application, secret=secret))
+        hook_server = await _serve(web, hook_port)
+        hook_url = f"http://127.0.0.1:{hook_port}{bot.WEBHOOK_PATH}"
+        try:
+            async with application:
+                await application.start()
+                await application.bot.set_webhook(url=hook_url, secret_token=secret)
+                results["webhook"] = await _drive(fake, updates, args.gap_ms / 1000.0, args.timeout)
+
+                bad = await client.post(hook_url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+                missing = await client.post(hook_url, json=updates[0])
+                results["rejected"] = (bad.status_code, missing.status_code)
+                await application.stop()
+        finally:
+            await _stop_server(hook_server)
+            await _stop_server(fake_server)
+    return results
+
+
+def bench_webhook(args):
+    import tempfile
+
+    import testsalescheck as bot
+
+    bot.init_db()
+    bot.load_from_db()
+    chats = [-(10**12) - i for i in range(args.chats)]
+    teams = [f"{BENCH_TEAM}hook{i}" for i in range(args.chats)]
+    per_chat = -(-args.updates // args.chats)
+    updates = _burst_updates(bot, chats, per_chat, 0)[: args.updates]
+
+    def reset():
+        for team in teams:
+            _cleanup(bot, team)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.SALE_SPOOL_PATH = os.path.join(tmp, "bench_spool.db")
+        for chat_id, team in zip(chats, teams):
+            bot.GROUP_TEAMS[chat_id] = team
+        try:
+            results = asyncio.run(_webhook_vs_polling(bot, updates, args, reset))
+        finally:
+            for chat_id in chats:
+                bot.GROUP_TEAMS.pop(chat_id, None)
+            reset()
+            if bot.spool is not None:
+                bot.spool.close()
+
+    print(
+        f"{args.updates} sale messages from {args.chats} groups, one every {args.gap_ms} ms; "
+        f"Telegram <-> bot {args.net_ms} ms each way (local fake Bot API server)"
+    )
+    print(f"{'mode':>8} {'p50':>8} {'p95':>8} {'max':>8}  answered   (update sent -> ack received)")
+    for mode in ("polling", "webhook"):
+        lat = results[mode]
+        pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] if lat else float("nan")
+        print(f"{mode:>8} {pct(0.5):>6.1f}ms {pct(0.95):>6.1f}ms {pct(1.0):>6.1f}ms  {len(lat)}/{args.updates}")
+    print(f"wrong / missing secret token -> HTTP {results['rejected'][0]} / {results['rejected'][1]}")
+
+
+# ----------------- SUMMARY -----------------
+def _legacy_summary(api, team: str, days: int):
+    # old /summary: period totals, then goals (2 queries), merged / rounded / sorted in Python
+    import rollups
+
+    now = api.now_ph()
+    conn = api.get_conn()
+    try:
+        with conn.cursor() as cur:
+            totals = dict(rollups.period_totals(cur, team, now - timedelta(days=days), now))
+        with conn.cursor() as cur:
+            cur.execute("SELECT page, goal FROM page_goals WHERE team = %s;", (team,))
+            goals = {str(p): float(g) for p, g in cur.fetchall()}
+    finally:
+        api.put_conn(conn)
+
+    rows, total_sales, total_goal = [], 0.0, 0.0
+    for page in set(totals) | set(goals):
+        sales, goal = float(totals.get(page, 0.0)), float(goals.get(page, 0.0))
+        total_sales += sales
+        total_goal += goal
+        pct = sales / goal * 100.0 if goal > 0 else None
+        rows.append({"page": page, "sales": round(sales, 2), "goal": round(goal, 2),
+                     "pct": round(pct, 1) if pct is not None else None})
+    rows.sort(key=lambda r: r["sales"], reverse=True)
+    return {"total_sales": round(total_sales, 2), "total_goal": round(total_goal, 2), "rows": rows}
+
+
+def _raw_range_summary(api, team: str, start, end):
+    # an arbitrary range the old way, without the daily rollup: SUM over every raw sale, then goals
+    conn = api.get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT page, SUM(amount) FROM sales WHERE team = %s AND ts >= %s AND ts < %s GROUP BY page",
+                (team, start, end),
+            )
+            totals = cur.fetchall()
+            cur.execute("SELECT page, goal FROM page_goals WHERE team = %s;", (team,))
+            return totals, cur.fetchall()
+    finally:
+        api.put_conn(conn)
+
+
+def _grow_sales(api, teams: list[str], pages: list[str], rows: int, days: int, chatters: int = 0):
+    # bulk rows spread over `days` days, then the daily rollups rebuilt for the bench teams only
+    import rollups
+
+    with api.pool.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO sales (team, page, amount, ts, chatter_id, chatter_name)
+            SELECT (%(teams)s::text[])[1 + i %% %(n_teams)s],
+                   (%(pages)s::text[])[1 + (i / %(n_teams)s) %% %(n_pages)s],
+                   round((5 + random() * 95)::numeric, 2),
+                   now() - random() * make_interval(days => %(days)s),
+                   c, 'Chatter ' || c
+            FROM generate_series(1, %(rows)s) AS i,
+                 LATERAL (SELECT CASE WHEN %(chatters)s > 0 THEN -1 - (i::bigint * 7919) %% %(chatters)s END AS c) AS x
+            """,
+            {"teams": teams, "n_teams": len(teams), "pages": pages, "n_pages": len(pages),
+             "rows": rows, "days": days, "chatters": chatters},
+        )
+    with api.pool.cursor() as cur:
+        cur.execute("DELETE FROM sales_daily WHERE team = ANY(%s)", (teams,))
+        cur.execute(
+            f"""
+            INSERT INTO sales_daily (team, page, day, total, sale_count)
+            SELECT team, page, {rollups.SQL_DAY}, SUM(amount), COUNT(*)
+            FROM sales WHERE team = ANY(%s)
+            GROUP BY 1, 2, 3
+            """,
+            (teams,),
+        )
+        cur.execute("DELETE FROM sales_hourly WHERE team = ANY(%s)", (teams,))
+        cur.execute(
+            f"""
+            INSERT INTO sales_hourly (team, page, hour, total, sale_count)
+            SELECT team, page, {rollups.SQL_HOUR}, SUM(amount), COUNT(*)
+            FROM sales WHERE team = ANY(%s)
+            GROUP BY 1, 2, 3
+            """,
+            (teams,),
+        )
+        cur.execute("DELETE FROM sales_chatter_daily WHERE team = ANY(%s)", (teams,))
+        cur.execute(
+            f"""
+            INSERT INTO sales_chatter_daily (team, chatter_id, day, total, sale_count)
+            SELECT team, chatter_id, {rollups.SQL_DAY}, SUM(amount), COUNT(*)
+            FROM sales WHERE team = ANY(%s) AND chatter_id IS NOT NULL
+            GROUP BY 1, 2, 3
+            """,
+            (teams,),
+        )
+    with api.pool.cursor() as cur:
+        cur.execute("ANALYZE sales")
+        cur.execute("ANALYZE sales_daily")
+
+
+def bench_summary(args):
+    import api
+    import rollups
+
+    teams = [f"{BENCH_TEAM}sum{i:02d}" for i in range(args.teams)]
+    team = teams[0]
+    pages = [f"Page {i:02d}" for i in range(args.pages)]
+
+    def cleanup():
+        with api.pool.cursor() as cur:
+            cur.execute("DELETE FROM sales WHERE team = ANY(%s)", (teams,))
+            cur.execute("DELETE FROM page_goals WHERE team = ANY(%s)", (teams,))
+            for table in rollups.ROLLUPS:
+                cur.execute(f"DELETE FROM {table} WHERE team = ANY(%s)", (teams,))
+
+    cleanup()
+    try:
+        with api.pool.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO page_goals (team, page, goal) VALUES (%s, %s, %s)",
+                [(team, page, 1000.0) for page in pages[: len(pages) // 2]],
+            )
+
+        stored = 0
+        for target in sorted(args.rows):
+            t0 = time.perf_counter()
+            _grow_sales(api, teams, pages, target - stored, args.days)
+            stored = target
+            print(f"\n{stored:,} sales rows ({stored // len(teams):,} for the measured team), "
+                  f"loaded in {time.perf_counter() - t0:.0f}s; median ms")
+            rtt = f"+{args.rtt_ms:g}ms RTT"
+            print(f"  {'query':<26} {'before':>9} {'single SQL':>11}   {rtt + ' before':>16} {'after':>7}")
+
+            def row(label, old, new):
+                # 2 round trips before, 1 after: what a non-local database adds on top
+                print(f"  {label:<26} {old:>9.2f} {new:>11.2f}   "
+                      f"{old + 2 * args.rtt_ms:>16.2f} {new + args.rtt_ms:>7.2f}")
+
+            now = api.now_ph()
+            for days in (15, 30):
+                old = _timeit(lambda: _legacy_summary(api, team, days), args.repeat)
+                new = _timeit(lambda: api._summary_payload(team, now - timedelta(days=days), now, days), args.repeat)
+                row(f"days={days}", old, new)
+
+            for span in (90, 365):
+                start, end = now - timedelta(days=span, hours=5), now - timedelta(hours=3)
+                old = _timeit(lambda: _raw_range_summary(api, team, start, end), args.repeat)
+                new = _timeit(lambda: api._summary_payload(team, start, end, None), args.repeat)
+                row(f"from/to {span}d (raw SUM)", old, new)
+    finally:
+        cleanup()
+
+
+def bench_summary_teams(args):
+    import api
+    import rollups
+
+    teams = [f"{BENCH_TEAM}multi{i:02d}" for i in range(max(args.teams))]
+    pages = [f"Page {i:02d}" for i in range(args.pages)]
+
+    def cleanup():
+        with api.pool.cursor() as cur:
+            cur.execute("DELETE FROM sales WHERE team = ANY(%s)", (teams,))
+            cur.execute("DELETE FROM page_goals WHERE team = ANY(%s)", (teams,))
+            for table in rollups.ROLLUPS:
+                cur.execute(f"DELETE FROM {table} WHERE team = ANY(%s)", (teams,))
+
+    cleanup()
+    try:
+        with api.pool.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO page_goals (team, page, goal) VALUES (%s, %s, %s)",
+                [(team, page, 1000.0) for team in teams for page in pages[: len(pages) // 2]],
+            )
+        t0 = time.perf_counter()
+        _grow_sales(api, teams, pages, args.rows, args.days)
+        print(f"{args.rows:,} sales rows over {len(teams)} teams, loaded in {time.perf_counter() - t0:.0f}s")
+
+        now = api.now_ph()
+        start, end = now - timedelta(days=args.window), now
+        fields = ("rows", "totals", "grand")
+        rtt = f"+{args.rtt_ms:g}ms RTT"
+        print(f"/summary x N vs /summary/teams, days={args.window}, median ms")
+        print(f"{'teams':>6} {'N calls':>9} {'1 grouped':>10}   {rtt + ' N calls':>18} {'grouped':>8}")
+        for n in sorted(args.teams):
+            batch = teams[:n]
+            old = _timeit(lambda: [api._summary_payload(t, start, end, args.window) for t in batch], args.repeat)
+            new = _timeit(lambda: api._summary_teams_payload(batch, start, end, args.window, fields, None), args.repeat)
+            # one pool checkout + round trip per team before, one in total after
+            print(f"{n:>6} {old:>9.2f} {new:>10.2f}   {old + n * args.rtt_ms:>18.2f} {new + args.rtt_ms:>8.2f}")
+    finally:
+        cleanup()
+
+
+# ----------------- EXPORT -----------------
+def _peak_mb(fn) -> float:
+    """Peak Python allocations of fn() in MB (separate run: tracing slows it down several times)."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def bench_export(args):
+    import api
+    import rollups
+
+    team = f"{BENCH_TEAM}export"
+
+    def cleanup():
+        with api.pool.cursor() as cur:
+            cur.execute("DELETE FROM sales WHERE team = %s", (team,))
+            for table in rollups.ROLLUPS:
+                cur.execute(f"DELETE FROM {table} WHERE team = %s", (team,))
+
+    cleanup()
+    try:
+        t0 = time.perf_counter()
+        _grow_sales(api, [team], [f"Page {i:02d}" for i in range(40)], args.rows, args.days)
+        print(f"{args.rows:,} sales rows over {args.days} days, loaded in {time.perf_counter() - t0:.0f}s")
+
+        now = api.now_ph()
+        start = now - timedelta(days=args.days + 1)
+        columns = ", ".join(api.EXPORT_COLUMNS)
+        page_rows = api.EXPORT_PAGE_ROWS
+
+        def fetchall():
+            # ad-hoc SQL: the whole range in one client-side result
+            with api.pool.cursor() as cur:
+                cur.execute(f"SELECT {columns} FROM sales WHERE team = %s AND ts >= %s ORDER BY ts, id",
+                            (team, start))
+                sum(len(line) for line in api._ndjson_lines(cur.fetchall(), header=True))
+
+        last_page = []
+
+        def offset_pages():
+            # LIMIT/OFFSET paging: every page re-walks all rows before it
+            offset = 0
+            while True:
+                t1 = time.perf_counter()
+                with api.pool.cursor() as cur:
+                    cur.execute(
+                        f"SELECT {columns} FROM sales WHERE team = %s AND ts >= %s "
+                        f"ORDER BY ts, id LIMIT %s OFFSET %s",
+                        (team, start, page_rows, offset),
+                    )
+                    rows = cur.fetchall()
+                last_page.append((time.perf_counter() - t1) * 1000.0)
+                sum(len(line) for line in api._ndjson_lines(rows, header=False))
+                offset += page_rows
+                if len(rows) < page_rows:
+                    break
+
+        def keyset_stream():
+            where = "team = %(team)s AND ts >= %(start)s AND ts < %(end)s AND (ts, id) > (%(key_ts)s, %(key_id)s)"
+            params = {"team": team, "start": start, "end": now, "key_ts": start, "key_id": 0}
+            conn = api.pool.getconn()
+            try:
+                first = api._export_page(conn, where, params)
+            finally:
+                api.put_conn(conn)
+            sum(len(chunk) for chunk in api._export_stream(first, where, params, api._ndjson_lines))
+
+        print(f"NDJSON export of the whole range ({page_rows} rows per page)")
+        print(f"  {'method':<22} {'total s':>8} {'peak MB':>8} {'last page ms':>13}")
+        for label, fn, trace in (("fetchall (ad-hoc SQL)", fetchall, True),
+                                 ("LIMIT/OFFSET pages", offset_pages, False),
+                                 ("keyset stream", keyset_stream, True)):
+            last_page.clear()
+            t0 = time.perf_counter()
+            fn()
+            seconds = time.perf_counter() - t0
+            peak = f"{_peak_mb(fn):>8.1f}" if trace else f"{'-':>8}"
+            tail = f"{last_page[-1]:>13.1f}" if last_page else f"{'-':>13}"
+            print(f"  {label:<22} {seconds:>8.2f} {peak} {tail}")
+    finally:
+        cleanup()
+
+
+# ----------------- CHATTERS -----------------
+def _raw_chatters(api, team: str, start):
+    # what the website did: group raw sales per chatter, latest name per chatter
+    conn = api.get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT chatter_id, SUM(amount), COUNT(*), (array_agg(chatter_name ORDER BY ts DESC))[1]
+                FROM sales
+                WHERE team = %s AND ts >= %s AND chatter_id IS NOT NULL
+                GROUP BY chatter_id
+                ORDER BY 2 DESC
+                """,
+                (team, start),
+            )
+            return cur.fetchall()
+    finally:
+        api.put_conn(conn)
+
+
+def bench_chatters(args):
+    import api
+    import rollups
+
+    team = f"{BENCH_TEAM}chatters"
+
+    def cleanup():
+        with api.pool.cursor() as cur:
+            cur.execute("DELETE FROM sales WHERE team = %s", (team,))
+            for table in rollups.ROLLUPS:
+                cur.execute(f"DELETE FROM {table} WHERE team = %s", (team,))
+
+    cleanup()
+    try:
+        t0 = time.perf_counter()
+        _grow_sales(api, [team], [f"Page {i:02d}" for i in range(40)], args.rows, args.days, args.chatters)
+        print(f"{args.rows:,} sales rows, {args.chatters} chatters over {args.days} days, "
+              f"loaded in {time.perf_counter() - t0:.0f}s; median ms")
+        print(f"  {'period':<8} {'raw GROUP BY':>13} {'rollup':>8}")
+        now = api.now_ph()
+        for label, days in (("day", 1), ("15d", 15), ("30d", 30)):
+            _, _, start = rollups.chatter_source(team, now, days)
+            old = _timeit(lambda: _raw_chatters(api, team, start), args.repeat)
+            new = _timeit(lambda: api._chatters_payload(team, label, days, args.chatters), args.repeat)
+            print(f"  {label:<8} {old:>13.2f} {new:>8.2f}")
+    finally:
+        cleanup()
+
+
+# ----------------- SERIES -----------------
+def _raw_series(api, team: str, start, end, bucket_hours: int):
+    # bucketed SUM straight over raw sales, gap-filled the same way
+    conn = api.get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT b.bucket, COALESCE(SUM(s.amount), 0)
+                FROM generate_series(%(start)s::timestamptz, %(end)s::timestamptz - %(step)s, %(step)s) AS b (bucket)
+                LEFT JOIN sales s
+                  ON s.team = %(team)s AND s.ts >= b.bucket AND s.ts < b.bucket + %(step)s
+                GROUP BY b.bucket
+                ORDER BY b.bucket
+                """,
+                {"team": team, "start": start, "end": end, "step": timedelta(hours=bucket_hours)},
+            )
+            return cur.fetchall()
+    finally:
+        api.put_conn(conn)
+
+
+def bench_series(args):
+    import api
+    import rollups
+
+    team = f"{BENCH_TEAM}series"
+
+    def cleanup():
+        with api.pool.cursor() as cur:
+            cur.execute("DELETE FROM sales WHERE team = %s", (team,))
+            for table in rollups.ROLLUPS:
+                cur.execute(f"DELETE FROM {table} WHERE team = %s", (team,))
+
+    cleanup()
+    try:
+        t0 = time.perf_counter()
+        _grow_sales(api, [team], [f"Page {i:02d}" for i in range(40)], args.rows, args.days)
+        print(f"{args.rows:,} sales rows over {args.days} days, loaded in {time.perf_counter() - t0:.0f}s; median ms")
+        print(f"  {'series':<16} {'points':>6} {'raw sales':>10} {'rollup':>8}")
+        now = api.now_ph()
+        for bucket, days in (("2h", 1), ("1h", 7), ("2h", 30), ("1d", 90), ("1d", 365)):
+            hours = api.SERIES_BUCKETS[bucket]
+            start = rollups.bucket_floor(now - timedelta(days=days), hours)
+            end = rollups.bucket_ceil(now, hours)
+            old = _timeit(lambda: _raw_series(api, team, start, end, hours), args.repeat)
+            new = _timeit(lambda: api._series_payload(team, None, start, end, hours, True), args.repeat)
+            points = int((end - start) / timedelta(hours=hours))
+            print(f"  {bucket + ' x ' + str(days) + 'd':<16} {points:>6} {old:>10.2f} {new:>8.2f}")
+    finally:
+        cleanup()
+
+
+# ----------------- CLI -----------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ingest", help="multi-line sale message: per-line vs batched writes")
+    p.add_argument("--lines", type=int, nargs="+", default=[1, 5, 10, 20, 40])
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(fn=bench_ingest)
+
+    p = sub.add_parser("goalboard", help="scheduled all-teams goalboard: per-team vs batched fetch")
+    p.add_argument("--teams", type=int, default=60)
+    p.add_argument("--sales", type=int, default=200, help="sales per team in the current shift")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(fn=bench_goalboard)
+
+    p = sub.add_parser("spool", help="sale ack latency: direct Postgres write vs SQLite spool + replay")
+    p.add_argument("--lines", type=int, default=5, help="lines per sale message")
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(fn=bench_spool)
+
+    p = sub.add_parser("burst", help="shift-change burst through the bot: sequential vs concurrent updates")
+    p.add_argument("--chats", type=int, default=20)
+    p.add_argument("--messages", type=int, default=10, help="sale messages per group")
+    p.add_argument("--reports", type=int, default=3, help="slow /quotamonth requests ahead of the sales")
+    p.add_argument("--report-ms", type=int, default=2000)
+    p.add_argument("--api-ms", type=int, default=30, help="simulated Telegram API latency per call")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--timeout", type=float, default=120.0)
+    p.set_defaults(fn=bench_burst)
+
+    p = sub.add_parser("webhook", help="update -> ack latency: long polling vs webhook (fake Telegram server)")
+    p.add_argument("--updates", type=int, default=200)
+    p.add_argument("--chats", type=int, default=20)
+    p.add_argument("--gap-ms", type=float, default=10.0, help="time between incoming updates")
+    p.add_argument("--net-ms", type=float, default=25.0, help="simulated one-way Telegram <-> bot latency")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.set_defaults(fn=bench_webhook)
+
+    p = sub.add_parser("summary", help="/summary: two queries + Python merge vs one SQL query, at scale")
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000], help="total sales rows")
+    p.add_argument("--teams", type=int, default=20)
+    p.add_argument("--pages", type=int, default=40)
+    p.add_argument("--days", type=int, default=400, help="history spread")
+    p.add_argument("--rtt-ms", type=float, default=1.0, help="network round trip added to the modelled columns")
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(fn=bench_summary)
+
+    p = sub.add_parser("summary-teams", help="dashboard: /summary once per team vs one GROUPING SETS query")
+    p.add_argument("--teams", type=int, nargs="+", default=[1, 5, 20, 50])
+    p.add_argument("--pages", type=int, default=40)
+    p.add_argument("--rows", type=int, default=2_000_000, help="sales rows over all teams")
+    p.add_argument("--days", type=int, default=60, help="history spread")
+    p.add_argument("--window", type=int, default=15, help="summary days")
+    p.add_argument("--rtt-ms", type=float, default=1.0, help="network round trip added to the modelled columns")
+    p.add_argument("--repeat", type=int, default=10)
+    p.set_defaults(fn=bench_summary_teams)
+
+    p = sub.add_parser("export", help="raw sales export: fetchall vs OFFSET pages vs keyset stream")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--days", type=int, default=365, help="history spread")
+    p.set_defaults(fn=bench_export)
+
+    p = sub.add_parser("chatters", help="ranked chatters: raw GROUP BY over sales vs chatter rollup")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--chatters", type=int, default=200)
+    p.add_argument("--days", type=int, default=365, help="history spread")
+    p.add_argument("--repeat", type=int, default=10)
+    p.set_defaults(fn=bench_chatters)
+
+    p = sub.add_parser("series", help="chart series: bucketed SUM over raw sales vs hourly / daily rollup")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--days", type=int, default=365, help="history spread")
+    p.add_argument("--repeat", type=int, default=10)
+    p.set_defaults(fn=bench_series)
+
+    p = sub.add_parser("parser", help="sale message parsing: legacy loop vs sale_parser (no DB)")
+    p.add_argument("--lines", type=int, nargs="+", default=[1, 10, 50, 100, 250, 500])
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(fn=bench_parser)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
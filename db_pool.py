@@ -0,0 +1,211 @@
+"""
+Postgres connection pool shared by the bot and api.py.
+
+    pool = DBPool(dsn, minconn=1, maxconn=5, wait_timeout=10)
+    with pool.cursor() as cur:          # one transaction
+        cur.execute(...)
+    rows = pool.retry(read_fn, ...)     # idempotent reads only
+
+Compared to psycopg2.pool.ThreadedConnectionPool:
+  - getconn() WAITS (up to wait_timeout) for a free connection instead of
+    raising as soon as the pool is exhausted, and raises PoolTimeout after;
+  - connections idle for longer than health_idle seconds get a "SELECT 1"
+    before they are handed out; dead ones are replaced transparently;
+  - connections that broke while in use are discarded on return;
+  - every acquisition's wait time is recorded (see metrics()) so the pool
+    can be sized from real numbers.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# errors that mean "this connection (or the server) is gone", worth a retry on a fresh one
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's wait limit."""
+
+
+class DBPool:
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = 1,
+        maxconn: int = 5,
+        wait_timeout: float = 10.0,
+        health_idle: float = 30.0,
+        **connect_kwargs,
+    ):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self.health_idle = health_idle
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []   # [(conn, returned_at)], most recently used last
+        self._size = 0    # open connections, idle + in use
+        self._waiting = 0
+        self._waits = deque(maxlen=1000)  # seconds waited, recent acquisitions
+        self.counters = {"acquired": 0, "timeouts": 0, "reconnects": 0, "discarded": 0}
+        self.closed = False
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, **self.connect_kwargs)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _healthy(conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ----------------- CHECKOUT -----------------
+    def getconn(self, timeout: float | None = None):
+        """
+        A live connection, waiting up to `timeout` (default wait_timeout) for one
+        to be returned when all maxconn are in use. Raises PoolTimeout.
+        """
+        timeout = self.wait_timeout if timeout is None else timeout
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self.closed:
+                        raise PoolTimeout("pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        conn, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timeouts"] += 1
+                        raise PoolTimeout(f"no DB connection free within {timeout:.1f}s (pool max {self.maxconn})")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        # connect / health-check outside the lock
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif conn.closed or (
+                time.monotonic() - returned_at > self.health_idle and not self._healthy(conn)
+            ):
+                self._close(conn)
+                self.counters["reconnects"] += 1
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.counters["acquired"] += 1
+            self._waits.append(time.monotonic() - t0)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Returns a connection; broken ones (or close=True) are discarded."""
+        if not close and not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                close = True
+
+        close = close or bool(conn.closed) or self.closed
+        with self._cond:
+            if close:
+                self._size -= 1
+                self.counters["discarded"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if close:
+            self._close(conn)
+
+    @contextmanager
+    def cursor(self, timeout: float | None = None):
+        """
+        Borrows a connection for ONE transaction:
+        commits on success, rolls back on error, always hands the connection back.
+        """
+        conn = self.getconn(timeout)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    yield cur
+        finally:
+            self.putconn(conn, close=bool(conn.closed))
+
+    def retry(self, fn, *args, attempts: int = 3, backoff: float = 0.2, **kwargs):
+        """
+        Calls fn(*args, **kwargs), retrying on a fresh connection when the
+        connection drops. ONLY for idempotent work (reads): a write may have
+        committed before the error reached us.
+        """
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except CONNECTION_ERRORS:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(backoff * (2 ** attempt))
+
+    # ----------------- METRICS -----------------
+    def metrics(self) -> dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            out = {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min": self.minconn,
+                "max": self.maxconn,
+                **self.counters,
+            }
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000.0, 2) if waits else 0.0
+
+        out.update(wait_ms_p50=pct(0.50), wait_ms_p95=pct(0.95), wait_ms_max=pct(1.0))
+        return out
+
+    def closeall(self):
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
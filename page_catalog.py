@@ -0,0 +1,201 @@
+"""
+Page catalog: the approved "#tag" -> page mapping, stored in Postgres.
+
+    page_catalog       (tag)  -> page, active flag (retired tags are kept)
+    page_catalog_meta  (id=1) -> version, bumped in the same transaction as
+                                 every catalog change
+
+Readers (bot + api.py) keep an immutable Catalog built for one version and
+swap it for a new one only when the stored version moves, so a reload costs
+one tiny SELECT while nothing has changed.
+
+The bot seeds the table from its built-in ALLOWED_PAGES the first time it
+starts against an empty catalog.
+"""
+
+from types import MappingProxyType
+
+from psycopg2.extras import execute_values
+
+import sale_parser
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_catalog (
+    tag TEXT PRIMARY KEY,
+    page TEXT NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    added_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    retired_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS page_catalog_meta (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+"""
+
+# SQL twin of sale_parser.normalize_tag(): tags that differ only in case/spacing are one tag
+_TAG_KEY_SQL = "lower(regexp_replace(btrim(tag), '\\s+', ' ', 'g'))"
+
+# arbitrary constant for pg_advisory_xact_lock so two processes never seed (or add a tag) at the same time
+_CATALOG_LOCK_KEY = 7302
+
+
+class Catalog:
+    """
+    One catalog version, compiled once: active tags, TagIndex, /pages listing.
+    Never mutated; reload by building a new one.
+    """
+
+    __slots__ = ("version", "pages", "index", "listing")
+
+    def __init__(self, version: int, pages: dict):
+        self.version = version
+        self.pages = MappingProxyType(dict(pages))
+        self.index = sale_parser.TagIndex(self.pages)
+        self.listing = "\n".join(f"{tag} → {self.pages[tag]}" for tag in sorted(self.pages))
+
+    def __len__(self):
+        return len(self.pages)
+
+
+# ----------------- SCHEMA / SEED -----------------
+def ensure_catalog(cur, seed: dict | None = None):
+    """
+    Creates the catalog tables. If `seed` is given (the writer, i.e. the bot)
+    and the catalog has never held a tag, inserts it as version 1. The writer
+    then merges active tags that differ only in case/spacing (see
+    merge_case_duplicates). Safe to call on every startup.
+    """
+    cur.execute(SCHEMA)
+    cur.execute("INSERT INTO page_catalog_meta (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+    if not seed:
+        return
+
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_CATALOG_LOCK_KEY,))
+    cur.execute("SELECT 1 FROM page_catalog LIMIT 1")
+    if not cur.fetchone():
+        execute_values(
+            cur,
+            "INSERT INTO page_catalog (tag, page) VALUES %s ON CONFLICT (tag) DO NOTHING",
+            list(seed.items()),
+            page_size=len(seed),
+        )
+        _bump_version(cur)
+
+    merge_case_duplicates(cur)
+
+
+def merge_case_duplicates(cur) -> int:
+    """
+    Retires active tags that normalize to the same key as another active tag
+    (left over from before add_tag matched case-insensitively). The survivor is
+    the row TagIndex already resolves: the one written in lowercase, else the
+    oldest. Returns how many rows were retired (the version is bumped if any).
+    """
+    cur.execute(
+        f"""
+        UPDATE page_catalog AS c SET active = FALSE, retired_at = now()
+        FROM (
+            SELECT tag, row_number() OVER (PARTITION BY key ORDER BY tag = key DESC, added_at, tag) AS n
+            FROM (SELECT tag, added_at, {_TAG_KEY_SQL} AS key FROM page_catalog WHERE active) AS a
+        ) AS d
+        WHERE c.tag = d.tag AND d.n > 1
+        """
+    )
+    merged = cur.rowcount
+    if merged:
+        _bump_version(cur)
+    return merged
+
+
+def _bump_version(cur) -> int:
+    cur.execute("UPDATE page_catalog_meta SET version = version + 1 WHERE id=1 RETURNING version")
+    return int(cur.fetchone()[0])
+
+
+# ----------------- READS -----------------
+def catalog_version(cur) -> int:
+    cur.execute("SELECT version FROM page_catalog_meta WHERE id=1")
+    row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def load_catalog(cur) -> Catalog:
+    """Active tags + the version they belong to (one snapshot)."""
+    cur.execute(
+        """
+        SELECT m.version, c.tag, c.page
+        FROM page_catalog_meta m
+        LEFT JOIN page_catalog c ON c.active
+        WHERE m.id=1
+        ORDER BY c.added_at, c.tag
+        """
+    )
+    rows = cur.fetchall()
+    version = int(rows[0][0]) if rows else 0
+    return Catalog(version, {str(tag): str(page) for _, tag, page in rows if tag is not None})
+
+
+def reload_if_changed(cur, current: Catalog | None) -> Catalog:
+    """`current` if the stored version hasn't moved, else a freshly loaded Catalog."""
+    if current is not None and catalog_version(cur) == current.version:
+        return current
+    return load_catalog(cur)
+
+
+# ----------------- WRITES -----------------
+def add_tag(cur, tag: str, page: str) -> int:
+    """
+    Adds (or re-activates / renames) a tag. If a stored tag differs only in
+    case/spacing, that row is updated instead (its spelling is kept), and any
+    other active spelling of it is retired. Returns the new catalog version.
+    """
+    key = sale_parser.normalize_tag(tag)
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_CATALOG_LOCK_KEY,))
+    cur.execute(
+        f"""
+        SELECT tag FROM page_catalog WHERE {_TAG_KEY_SQL} = %s
+        ORDER BY tag = %s DESC, active DESC, added_at, tag
+        LIMIT 1
+        """,
+        (key, tag),
+    )
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(
+            """
+            INSERT INTO page_catalog (tag, page) VALUES (%s, %s)
+            ON CONFLICT (tag) DO UPDATE
+            SET page = EXCLUDED.page, active = TRUE, retired_at = NULL
+            """,
+            (tag, page),
+        )
+    else:
+        cur.execute(
+            "UPDATE page_catalog SET page = %s, active = TRUE, retired_at = NULL WHERE tag = %s",
+            (page, row[0]),
+        )
+        cur.execute(
+            f"""
+            UPDATE page_catalog SET active = FALSE, retired_at = now()
+            WHERE active AND {_TAG_KEY_SQL} = %s AND tag <> %s
+            """,
+            (key, row[0]),
+        )
+    return _bump_version(cur)
+
+
+def retire_tag(cur, tag: str) -> int | None:
+    """
+    Retires an active tag (matched case-insensitively). Sales already recorded
+    under its page are untouched. Returns the new version, or None if no
+    active tag matched.
+    """
+    cur.execute(
+        f"UPDATE page_catalog SET active = FALSE, retired_at = now() WHERE active AND {_TAG_KEY_SQL} = %s",
+        (sale_parser.normalize_tag(tag),),
+    )
+    if cur.rowcount == 0:
+        return None
+    return _bump_version(cur)
@@ -0,0 +1,138 @@
+"""
+Rendered API responses with ETags, cached per worker process and dropped on
+the bot's NOTIFY. Used by api.py for /summary, /summary/teams, /series and
+/chatters.
+"""
+
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+
+import rollups
+
+MULTI_TEAM_KEY = "*"  # key[0] of responses covering several teams (/summary/teams)
+
+
+class ResponseCache:
+    """
+    (team, ...) -> (expires_at, etag, body) for this worker process;
+    ("*", ...) for responses spanning several teams.
+
+    An entry lives at most `ttl` seconds and is dropped as soon as the bot's
+    NOTIFY (rollups.SALES_CHANNEL) says that team's sales changed. Nothing is
+    served while the LISTEN connection is down: a NOTIFY could have been missed.
+    """
+
+    def __init__(self, dsn: str, ttl: float, max_entries: int = 1024):
+        self.dsn = dsn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.live = False  # LISTEN connection up
+        self.counters = {"hits": 0, "not_modified": 0, "misses": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._epoch = 0                # bumped when everything is dropped
+        self._gen = defaultdict(int)   # team -> bumped when that team is invalidated
+        self._stop = threading.Event()
+        self._thread = None
+
+    def token(self, team: str):
+        """Taken BEFORE computing a response; put() refuses it if an invalidation came in since."""
+        with self._lock:
+            return (self._epoch, self._gen[team])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key) if self.live else None
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            self.counters["misses" if entry is None else "hits"] += 1
+            return entry
+
+    def put(self, key, token, etag: str, body: bytes):
+        with self._lock:
+            if not self.live or token != (self._epoch, self._gen[key[0]]):
+                return
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: e for k, e in self._entries.items() if e[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    return
+            self._entries[key] = (time.monotonic() + self.ttl, etag, body)
+
+    def invalidate(self, team: str | None = None):
+        """Drops `team`'s entries and every multi-team ("*") entry; None drops everything."""
+        with self._lock:
+            self.counters["invalidations"] += 1
+            if team is None:
+                self._epoch += 1
+                self._entries.clear()
+                return
+            for name in (team, MULTI_TEAM_KEY):
+                self._gen[name] += 1
+            for key in [k for k in self._entries if k[0] in (team, MULTI_TEAM_KEY)]:
+                del self._entries[key]
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"live": self.live, "entries": len(self._entries), "ttl": self.ttl, **self.counters}
+
+    # ----------------- LISTEN -----------------
+    def start_listener(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name="summary-cache-listen", daemon=True)
+            self._thread.start()
+
+    def stop_listener(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _set_live(self, live: bool):
+        self.invalidate()  # whatever was cached before (re)subscribing may already be stale
+        with self._lock:
+            self.live = live
+
+    def _listen(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn, sslmode="require", connect_timeout=5)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {rollups.SALES_CHANNEL}")
+                self._set_live(True)
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self.invalidate(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"⚠️ summary cache: LISTEN connection lost ({e!r}); cache off, retry in {backoff:.0f}s")
+            finally:
+                self._set_live(False)
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(backoff)
+            backoff = min(30.0, backoff * 2)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match header (a list, weak tags or "*") against our strong `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,557 @@
+"""
+Sales rollup tables.
+
+    sales_shift_totals  (team, shift_start, page)  -> goalboard / redpages
+    sales_daily         (team, day, page)          -> quotas / /summary
+    sales_hourly        (team, hour, page)         -> api.py /series
+    sales_lifetime      (team, page)               -> /leaderboard
+    sales_chatter_shift (team, shift_start, chatter_id) -> api.py /chatters
+    sales_chatter_daily (team, day, chatter_id)         -> api.py /chatters
+
+Chatter rollups only count sales with a chatter_id.
+
+Every write to `sales` also updates these aggregates inside the SAME
+transaction (see apply_sales), so read paths can serve shift views from
+O(pages) rows instead of rescanning raw sales. The same transaction sends
+NOTIFY sales_changed <team>, delivered on commit, so readers caching
+responses (api.py /summary) know when to drop them.
+
+Shared by the bot (the only writer) and api.py (reader).
+
+Backfill / rebuild from the full sales history:
+
+    DATABASE_URL=postgres://... python rollups.py backfill [--only sales_daily]
+"""
+
+import argparse
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from psycopg2.extras import execute_values
+
+PH_TZ = ZoneInfo("Asia/Manila")
+
+# Every INSERT/DELETE on sales must RETURN these columns (in this order)
+# so apply_sales() can fold the affected rows into the rollups.
+SALE_RETURNING = "team, page, amount, ts, chatter_id"
+
+# Shift buckets: 00:00, 08:00, 16:00 PH (same boundaries as testsalescheck.shift_start).
+SQL_SHIFT_START = (
+    "((date_trunc('day', ts AT TIME ZONE 'Asia/Manila')"
+    " + floor(extract(hour FROM ts AT TIME ZONE 'Asia/Manila') / 8) * interval '8 hours')"
+    " AT TIME ZONE 'Asia/Manila')"
+)
+SQL_DAY = "(ts AT TIME ZONE 'Asia/Manila')::date"
+SQL_HOUR = "(date_trunc('hour', ts AT TIME ZONE 'Asia/Manila') AT TIME ZONE 'Asia/Manila')"
+
+# LISTEN/NOTIFY channel; payload = team whose sales (or goals) changed
+SALES_CHANNEL = "sales_changed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales_shift_totals (
+    team TEXT NOT NULL,
+    page TEXT NOT NULL,
+    shift_start TIMESTAMPTZ NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, shift_start, page)
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+    team TEXT NOT NULL,
+    page TEXT NOT NULL,
+    day DATE NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, day, page)
+);
+
+CREATE TABLE IF NOT EXISTS sales_hourly (
+    team TEXT NOT NULL,
+    page TEXT NOT NULL,
+    hour TIMESTAMPTZ NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, hour, page)
+);
+
+CREATE TABLE IF NOT EXISTS sales_lifetime (
+    team TEXT NOT NULL,
+    page TEXT NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, page)
+);
+
+CREATE TABLE IF NOT EXISTS sales_chatter_shift (
+    team TEXT NOT NULL,
+    chatter_id BIGINT NOT NULL,
+    shift_start TIMESTAMPTZ NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, shift_start, chatter_id)
+);
+
+CREATE TABLE IF NOT EXISTS sales_chatter_daily (
+    team TEXT NOT NULL,
+    chatter_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    sale_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team, day, chatter_id)
+);
+
+-- which rollups have been backfilled from sales history
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# rollup table -> (key columns, backfill SELECT producing key columns + total + sale_count)
+ROLLUPS = {
+    "sales_shift_totals": (
+        ("team", "page", "shift_start"),
+        f"""
+        SELECT team, page, {SQL_SHIFT_START}, SUM(amount), COUNT(*)
+        FROM sales
+        GROUP BY 1, 2, 3
+        """,
+    ),
+    "sales_daily": (
+        ("team", "page", "day"),
+        f"""
+        SELECT team, page, {SQL_DAY}, SUM(amount), COUNT(*)
+        FROM sales
+        GROUP BY 1, 2, 3
+        """,
+    ),
+    "sales_hourly": (
+        ("team", "page", "hour"),
+        f"""
+        SELECT team, page, {SQL_HOUR}, SUM(amount), COUNT(*)
+        FROM sales
+        GROUP BY 1, 2, 3
+        """,
+    ),
+    "sales_lifetime": (
+        ("team", "page"),
+        """
+        SELECT team, page, SUM(amount), COUNT(*)
+        FROM sales
+        GROUP BY 1, 2
+        """,
+    ),
+    "sales_chatter_shift": (
+        ("team", "chatter_id", "shift_start"),
+        f"""
+        SELECT team, chatter_id, {SQL_SHIFT_START}, SUM(amount), COUNT(*)
+        FROM sales
+        WHERE chatter_id IS NOT NULL
+        GROUP BY 1, 2, 3
+        """,
+    ),
+    "sales_chatter_daily": (
+        ("team", "chatter_id", "day"),
+        f"""
+        SELECT team, chatter_id, {SQL_DAY}, SUM(amount), COUNT(*)
+        FROM sales
+        WHERE chatter_id IS NOT NULL
+        GROUP BY 1, 2, 3
+        """,
+    ),
+}
+
+# arbitrary constant for pg_advisory_xact_lock so bot + api never backfill at the same time
+_ROLLUP_LOCK_KEY = 7301
+
+
+def shift_bucket(ts: datetime) -> datetime:
+    ts = ts.astimezone(PH_TZ)
+    return datetime(ts.year, ts.month, ts.day, (ts.hour // 8) * 8, 0, 0, tzinfo=PH_TZ)
+
+
+def day_bucket(ts: datetime):
+    return ts.astimezone(PH_TZ).date()
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.astimezone(PH_TZ).replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_floor(ts: datetime, hours: int) -> datetime:
+    """Start of the `hours`-wide PH bucket holding `ts` (hours divides 24)."""
+    ts = ts.astimezone(PH_TZ)
+    return ts.replace(hour=ts.hour - ts.hour % hours, minute=0, second=0, microsecond=0)
+
+
+def bucket_ceil(ts: datetime, hours: int) -> datetime:
+    """End of that bucket, or `ts` itself if it is already a bucket edge."""
+    floor = bucket_floor(ts, hours)
+    return floor if floor == ts else floor + timedelta(hours=hours)
+
+
+# ----------------- SCHEMA / BACKFILL -----------------
+def create_rollup_tables(cur):
+    """
+    Creates the rollup tables only. For read-only processes (api.py): backfill and
+    rollup_state belong to the writer, which must also maintain what it marks built.
+    """
+    cur.execute(SCHEMA)
+
+
+def ensure_rollups(cur):
+    """
+    Creates the rollup tables and backfills any rollup that has never been built.
+    Safe to call on every startup of the process that writes sales.
+    """
+    create_rollup_tables(cur)
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ROLLUP_LOCK_KEY,))
+    cur.execute("SELECT name FROM rollup_state")
+    built = {str(r[0]) for r in cur.fetchall()}
+
+    missing = [name for name in ROLLUPS if name not in built]
+    if missing:
+        rebuild_rollups(cur, missing)
+
+
+def rebuild_rollups(cur, names=None):
+    """
+    Recomputes rollups from the full sales history.
+    Holds a SHARE lock on sales so no sale can land between the wipe and the refill.
+    """
+    names = list(names or ROLLUPS)
+    cur.execute("LOCK TABLE sales IN SHARE MODE")
+    for name in names:
+        keys, select_sql = ROLLUPS[name]
+        cols = ", ".join(keys)
+        cur.execute(f"DELETE FROM {name}")
+        cur.execute(f"INSERT INTO {name} ({cols}, total, sale_count) {select_sql}")
+        cur.execute(
+            """
+            INSERT INTO rollup_state (name) VALUES (%s)
+            ON CONFLICT (name) DO UPDATE SET built_at = now()
+            """,
+            (name,),
+        )
+
+
+# ----------------- INCREMENTAL MAINTENANCE -----------------
+def _fold(cur, table: str, keys: tuple, deltas: dict):
+    """
+    Adds {key_tuple: [total, count]} deltas into `table`, then drops rows whose
+    count reached zero. Keys are written in sorted order so concurrent
+    transactions always lock rollup rows in the same order (no deadlocks).
+    """
+    if not deltas:
+        return
+
+    cols = ", ".join(keys)
+    rows = [(*k, v[0], v[1]) for k, v in sorted(deltas.items())]
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {table} AS t ({cols}, total, sale_count)
+        VALUES %s
+        ON CONFLICT ({cols}) DO UPDATE
+        SET total = t.total + EXCLUDED.total,
+            sale_count = t.sale_count + EXCLUDED.sale_count
+        """,
+        rows,
+        page_size=len(rows),
+    )
+
+    if any(v[1] < 0 for v in deltas.values()):
+        match = " AND ".join(f"t.{c} = v.{c}" for c in keys)
+        execute_values(
+            cur,
+            f"""
+            DELETE FROM {table} AS t
+            USING (VALUES %s) AS v({cols})
+            WHERE {match} AND t.sale_count <= 0
+            """,
+            sorted(deltas.keys()),
+            page_size=len(deltas),
+        )
+
+
+def apply_sales(cur, rows, sign: int = 1):
+    """
+    Folds sales rows (as RETURNed with SALE_RETURNING) into every rollup.
+    sign=+1 after an INSERT, sign=-1 after a DELETE.
+    Amounts must be exact (Decimal as read back from Postgres, or int): a float
+    like 30.1 would fold in as 30.1000000000000014... and drift from `sales`.
+    """
+    shift = defaultdict(lambda: [Decimal(0), 0])
+    daily = defaultdict(lambda: [Decimal(0), 0])
+    hourly = defaultdict(lambda: [Decimal(0), 0])
+    lifetime = defaultdict(lambda: [Decimal(0), 0])
+    chatter_shift = defaultdict(lambda: [Decimal(0), 0])
+    chatter_daily = defaultdict(lambda: [Decimal(0), 0])
+
+    for team, page, amount, ts, chatter_id in rows:
+        if isinstance(amount, float):
+            raise TypeError(f"apply_sales() needs exact amounts, got float {amount!r}")
+        amount = Decimal(amount) * sign
+        shift_start, day = shift_bucket(ts), day_bucket(ts)
+
+        acc = shift[(team, page, shift_start)]
+        acc[0] += amount
+        acc[1] += sign
+
+        acc = daily[(team, page, day)]
+        acc[0] += amount
+        acc[1] += sign
+
+        acc = hourly[(team, page, hour_bucket(ts))]
+        acc[0] += amount
+        acc[1] += sign
+
+        acc = lifetime[(team, page)]
+        acc[0] += amount
+        acc[1] += sign
+
+        if chatter_id is not None:
+            acc = chatter_shift[(team, chatter_id, shift_start)]
+            acc[0] += amount
+            acc[1] += sign
+
+            acc = chatter_daily[(team, chatter_id, day)]
+            acc[0] += amount
+            acc[1] += sign
+
+    _fold(cur, "sales_shift_totals", ROLLUPS["sales_shift_totals"][0], shift)
+    _fold(cur, "sales_daily", ROLLUPS["sales_daily"][0], daily)
+    _fold(cur, "sales_hourly", ROLLUPS["sales_hourly"][0], hourly)
+    _fold(cur, "sales_lifetime", ROLLUPS["sales_lifetime"][0], lifetime)
+    _fold(cur, "sales_chatter_shift", ROLLUPS["sales_chatter_shift"][0], chatter_shift)
+    _fold(cur, "sales_chatter_daily", ROLLUPS["sales_chatter_daily"][0], chatter_daily)
+    notify_changed(cur, {team for team, _ in lifetime})
+
+
+def notify_changed(cur, teams):
+    """One NOTIFY per team; Postgres delivers them only if the transaction commits."""
+    for team in sorted(teams):
+        cur.execute("SELECT pg_notify(%s, %s)", (SALES_CHANNEL, team))
+
+
+# ----------------- READS -----------------
+def shift_rows(cur, start: datetime, team: str | None = None):
+    """
+    [(team, page, total)] for one shift, all teams (or just `team`).
+    """
+    if team is None:
+        cur.execute("SELECT team, page, total FROM sales_shift_totals WHERE shift_start=%s", (start,))
+    else:
+        cur.execute(
+            "SELECT team, page, total FROM sales_shift_totals WHERE shift_start=%s AND team=%s",
+            (start, team),
+        )
+    return [(str(t), str(p), float(v)) for (t, p, v) in cur.fetchall()]
+
+
+def shift_totals_many(cur, teams, start: datetime):
+    """
+    Shift totals for many teams in ONE query: {team: [(page, total)]}.
+    """
+    out = {team: [] for team in teams}
+    if not out:
+        return out
+
+    cur.execute(
+        """
+        SELECT team, page, total
+        FROM sales_shift_totals
+        WHERE shift_start=%s AND team = ANY(%s)
+        """,
+        (start, list(out)),
+    )
+    for team, page, total in cur.fetchall():
+        out[str(team)].append((str(page), float(total)))
+    return out
+
+
+def lifetime_totals(cur, team: str):
+    cur.execute(
+        """
+        SELECT page, total
+        FROM sales_lifetime
+        WHERE team=%s
+        ORDER BY total DESC
+        """,
+        (team,),
+    )
+    return [(str(p), float(t)) for (p, t) in cur.fetchall()]
+
+
+def _midnight(day) -> datetime:
+    return datetime.combine(day, datetime.min.time(), tzinfo=PH_TZ)
+
+
+_PERIOD_SQL = """
+    SELECT {cols}, total
+    FROM sales_daily
+    WHERE {where} AND day >= %(first_whole)s AND day < %(end_day)s
+
+    UNION ALL
+
+    SELECT {cols}, amount
+    FROM sales
+    WHERE {where} AND ts >= %(start)s AND ts < %(head_end)s
+
+    UNION ALL
+
+    SELECT {cols}, amount
+    FROM sales
+    WHERE {where} AND ts >= %(tail_start)s AND ts < %(end)s
+"""
+
+
+def _period_params(start: datetime, end: datetime) -> dict:
+    start_day, end_day = day_bucket(start), day_bucket(end)
+    first_whole = start_day if start == _midnight(start_day) else start_day + timedelta(days=1)
+    return {
+        "first_whole": first_whole,
+        "end_day": end_day,
+        "start": start,
+        "head_end": min(_midnight(first_whole), end),
+        "tail_start": max(_midnight(end_day), _midnight(first_whole)),
+        "end": end,
+    }
+
+
+def period_source(team: str, start: datetime, end: datetime):
+    """
+    (sql, params) for a subquery of (page, total) rows whose per-page sums are
+    the team's sales with start <= ts < end.
+
+    Whole PH days inside the range come from sales_daily (days x pages rows);
+    the partial first and last day are summed from raw sales, which the
+    (team, ts) index keeps to at most two days of rows, whatever the range.
+    """
+    sql = _PERIOD_SQL.format(cols="page", where="team = %(team)s")
+    return sql, {"team": team, **_period_params(start, end)}
+
+
+def period_source_many(teams: list[str] | None, start: datetime, end: datetime):
+    """Same as period_source(), as (team, page, total) rows for several teams (None = every team)."""
+    where = "team = ANY(%(teams)s)" if teams is not None else "TRUE"
+    sql = _PERIOD_SQL.format(cols="team, page", where=where)
+    return sql, {"teams": teams, **_period_params(start, end)}
+
+
+def period_totals(cur, team: str, cutoff: datetime, now: datetime):
+    """Per-page totals for sales with cutoff <= ts < now, sorted by total DESC."""
+    source, params = period_source(team, cutoff, now)
+    cur.execute(
+        f"""
+        SELECT page, SUM(total) AS total
+        FROM ({source}) AS x
+        GROUP BY page
+        ORDER BY total DESC
+        """,
+        params,
+    )
+    return [(str(p), float(t)) for (p, t) in cur.fetchall()]
+
+
+def chatter_source(team: str, now: datetime, days: int | None):
+    """
+    (sql, params, start) for a subquery of (chatter_id, total, sale_count) rows
+    from the chatter rollups: the current shift (days=None), or the last `days`
+    PH calendar days, today included.
+    """
+    if days is None:
+        start = shift_bucket(now)
+        sql = """
+            SELECT chatter_id, total, sale_count
+            FROM sales_chatter_shift
+            WHERE team = %(team)s AND shift_start = %(start)s
+        """
+        return sql, {"team": team, "start": start}, start
+
+    first_day = day_bucket(now) - timedelta(days=days - 1)
+    sql = """
+        SELECT chatter_id, total, sale_count
+        FROM sales_chatter_daily
+        WHERE team = %(team)s AND day >= %(first_day)s
+    """
+    return sql, {"team": team, "first_day": first_day}, _midnight(first_day)
+
+
+def parse_tiers(spec: str) -> list[tuple[str, float]]:
+    """"S:10,A:30,B:60,C:100" -> [("S", 10.0), ...]: tier name and top percent, best first."""
+    return [(name.strip(), float(pct)) for name, pct in (t.split(":") for t in spec.split(","))]
+
+
+def chatter_tier(cume: float, tiers: list[tuple[str, float]]) -> str:
+    """
+    Tier for a chatter whose CUME_DIST() by sales is `cume` (0..1], i.e. who
+    sells at least as much as (1 - cume) of the team's chatters.
+    """
+    for name, pct in tiers:
+        if cume * 100.0 <= pct + 1e-9:
+            return name
+    return tiers[-1][0]
+
+
+def series_source(team: str, page: str | None, start: datetime, end: datetime, bucket_hours: int):
+    """
+    (sql, params) for a subquery of (bucket, total, sale_count) rows, one per
+    non-empty bucket of `bucket_hours` in [start, end). start and end must be
+    bucket boundaries (whole PH hours; whole PH days when bucket_hours is 24,
+    which is then served from sales_daily instead of sales_hourly).
+    """
+    if bucket_hours % 24 == 0:
+        slot, table, col = "(day::timestamp AT TIME ZONE 'Asia/Manila')", "sales_daily", "day"
+        lo, hi = day_bucket(start), day_bucket(end)
+    else:
+        slot, table, col = "hour", "sales_hourly", "hour"
+        lo, hi = start, end
+    sql = f"""
+        SELECT %(start)s::timestamptz
+                   + floor(extract(epoch FROM {slot} - %(start)s::timestamptz) / %(bucket_secs)s)
+                   * make_interval(secs => %(bucket_secs)s) AS bucket,
+               SUM(total) AS total,
+               SUM(sale_count) AS sale_count
+        FROM {table}
+        WHERE team = %(team)s AND {col} >= %(lo)s AND {col} < %(hi)s
+          AND (%(page)s::text IS NULL OR page = %(page)s)
+        GROUP BY 1
+    """
+    params = {"team": team, "page": page, "start": start, "lo": lo, "hi": hi, "bucket_secs": bucket_hours * 3600}
+    return sql, params
+
+
+# ----------------- CLI -----------------
+def main():
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="Sales rollup maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("backfill", help="rebuild rollups from the full sales history")
+    p.add_argument("--only", nargs="+", choices=sorted(ROLLUPS), help="rebuild just these rollups")
+    args = parser.parse_args()
+
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL not set")
+
+    conn = psycopg2.connect(dsn, sslmode="require")
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SCHEMA)
+                rebuild_rollups(cur, args.only)
+                for name in args.only or ROLLUPS:
+                    cur.execute(f"SELECT COUNT(*) FROM {name}")
+                    print(f"✅ {name}: {cur.fetchone()[0]} rows")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Sale message parser.
+
+    +50 #haven
+    • +20.5 #Alexa Lana/Scarlette Moon  tip
+
+One sale per line: optional bullet ("*", "•", "-"), "+", amount, page tag.
+Anything after the tag is ignored. Lines that don't start with "+" are
+skipped, so a sale can sit inside a longer message.
+
+Tags are matched case-insensitively with whitespace collapsed, and may span
+several words: the longest registered tag that prefixes the text wins.
+The index is built once per page mapping (see TagIndex); parse_sales()
+then handles a whole message in a single pass.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from operator import itemgetter
+from typing import NamedTuple
+
+# leading bullets a chatter may put before "+" (after any whitespace, NBSP included)
+_BULLETS = " \t*•-"
+
+
+class ParsedSale(tuple):
+    """
+    ParsedSale((line_no, amount, page, tag)): a plain tuple with named fields.
+
+    Not a NamedTuple: its generated Python __new__ cost about as much as the
+    rest of a line's parsing, while tuple's own constructor runs in C.
+    """
+
+    __slots__ = ()
+
+    line_no = property(itemgetter(0), doc="1-based line in the message")
+    amount = property(itemgetter(1))
+    page = property(itemgetter(2), doc="canonical page name")
+    tag = property(itemgetter(3), doc="tag as the chatter typed it")
+
+    def __repr__(self):
+        return "ParsedSale(line_no=%r, amount=%r, page=%r, tag=%r)" % self
+
+
+class ParsedMessage(NamedTuple):
+    sales: list
+    unknown_tags: list  # first token of every unmatched tag, in message order, no duplicates
+
+    def pairs(self):
+        """[(page, amount)], the shape db_add_sales() / LiveShiftCounters.add() take."""
+        return [(s.page, s.amount) for s in self.sales]
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(tag.split()).lower()
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a tag without its '#', padded so short tags still get some."""
+    s = "  " + text.lower().lstrip("#").replace(" ", "") + " "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+# ----------------- TAG INDEX -----------------
+class TagIndex:
+    """
+    Normalized tag -> canonical page, built once from a {"#tag": "Page"} mapping.
+
+    When two tags normalize to the same key (e.g. "#zoe" and "#Zoe"), the one
+    already written in lowercase wins, so existing lowercase tags keep the
+    page they have always resolved to.
+    """
+
+    def __init__(self, pages: dict):
+        self.tags = {}
+        self.display = {}  # normalized key -> tag as registered (for suggestions)
+        for tag, page in pages.items():
+            key = normalize_tag(tag)
+            if not key.startswith("#"):
+                continue
+            if key in self.tags and tag != key:
+                continue
+            self.tags[key] = page
+            self.display[key] = " ".join(tag.split())
+        self.max_words = max((k.count(" ") + 1 for k in self.tags), default=1)
+        # first words of multi-word tags: only these need the longest-prefix search
+        self.multi_heads = {k.split(" ", 1)[0] for k in self.tags if " " in k}
+        # single-word tags exactly as registered or normalized -> page, so the
+        # common case is one dict hit without lowercasing
+        self.exact = {}
+        for tag in pages:
+            key = normalize_tag(tag)
+            if key in self.tags and " " not in key and key not in self.multi_heads:
+                self.exact[tag.strip()] = self.exact[key] = self.tags[key]
+
+        # trigram -> keys containing it, for did-you-mean suggestions
+        self.grams = {}
+        self.postings = defaultdict(list)
+        for key in self.tags:
+            self.grams[key] = trigrams(key)
+            for g in self.grams[key]:
+                self.postings[g].append(key)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def match(self, text: str):
+        """
+        (page, tag_words) for the longest tag that prefixes `text`,
+        else (None, first_word).
+        """
+        first, _, rest = text.strip().partition(" ")
+        return self.match_words(first, rest)
+
+    def match_words(self, first: str, rest: str):
+        head = first.lower()
+        if head not in self.multi_heads:
+            return self.tags.get(head), first
+
+        words = [first] + rest.split(None, self.max_words - 1)[: self.max_words - 1]
+        for n in range(len(words), 0, -1):
+            page = self.tags.get(" ".join(words[:n]).lower())
+            if page is not None:
+                return page, " ".join(words[:n])
+        return None, first
+
+    def lookup(self, text: str):
+        """Canonical page for a tag (leading words of `text`), or None."""
+        return self.match(text)[0]
+
+    def suggest(self, token: str, limit: int = 3, min_score: float = 0.3):
+        """
+        Up to `limit` registered tags closest to `token`, best first.
+        Score is the Dice coefficient over trigrams; only tags sharing at
+        least one trigram with the token are ever looked at.
+        """
+        grams = trigrams(token)
+        if not grams:
+            return []
+
+        shared = defaultdict(int)
+        for g in grams:
+            for key in self.postings.get(g, ()):
+                shared[key] += 1
+
+        scored = []
+        for key, n in shared.items():
+            score = 2.0 * n / (len(grams) + len(self.grams[key]))
+            if score >= min_score:
+                scored.append((score, key))
+
+        best = heapq.nlargest(limit, scored, key=lambda x: (x[0], -len(x[1])))
+        return [self.display[key] for _, key in best]
+
+
+# ----------------- PARSER -----------------
+def parse_sales(text: str, index: TagIndex) -> ParsedMessage:
+    """
+    Parses a whole message in one pass. Each sale line is split exactly once
+    into amount / first tag word / rest; only tags whose first word starts a
+    multi-word tag look at the rest.
+    """
+    sales = []
+    unknown = {}
+    exact = index.exact
+    tags = index.tags
+    multi_heads = index.multi_heads
+    isfinite = math.isfinite
+
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if "+" not in line:
+            continue
+        line = line.strip().lstrip(_BULLETS).lstrip()
+        if not line.startswith("+"):
+            continue
+
+        parts = line[1:].split(None, 2)
+        if len(parts) < 2:
+            continue
+
+        try:
+            amount = float(parts[0])
+        except ValueError:
+            continue
+        if not isfinite(amount):
+            continue
+
+        first = parts[1]
+        page, tag = exact.get(first), first
+        if page is None:
+            head = first.lower()
+            if head in multi_heads:
+                page, tag = index.match_words(first, parts[2] if len(parts) > 2 else "")
+            else:
+                page = tags.get(head)
+
+        if page is None:
+            unknown[tag] = None
+            continue
+
+        sales.append(ParsedSale((line_no, amount, page, tag)))
+
+    return ParsedMessage(sales, list(unknown))
@@ -0,0 +1,153 @@
+"""
+Local write-behind spool for sale messages (SQLite).
+
+The bot acknowledges a sale once it is in the spool: the SQLite write is
+committed with synchronous=FULL, so it survives a crash or a Postgres
+outage. A background flusher replays pending entries into Postgres in
+batches and removes them only after that commit.
+
+One entry = the latest full set of parsed lines of one Telegram message
+(a replace-set). Editing a message spools its new set, which supersedes any
+unflushed entry for the same message; the flusher turns it into a delta
+against the rows already stored for (chat_id, message_id). Replaying an
+entry twice therefore changes nothing the second time.
+
+An entry that is an edit, or that superseded an unflushed entry, is marked
+`replaces`: the bot's live counters cannot be bumped for it incrementally,
+so the flusher rebuilds its team's counters instead.
+
+Not thread-safe on its own: the bot drives it from a single worker thread.
+"""
+
+import json
+import sqlite3
+from typing import NamedTuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    team TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    chatter_id INTEGER,
+    chatter_name TEXT,
+    chatter_username TEXT,
+    lines TEXT NOT NULL,            -- JSON [[line_no, page, amount], ...]
+    replaces INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_spool_message ON spool (chat_id, message_id);
+"""
+
+
+class SpoolEntry(NamedTuple):
+    id: int
+    chat_id: int
+    message_id: int
+    team: str
+    ts: str  # ISO, PH time
+    chatter_id: int | None
+    chatter_name: str | None
+    chatter_username: str | None
+    lines: list  # [(line_no, page, amount)]
+    replaces: bool = False  # edit, or superseded an unflushed entry
+
+    def sale_rows(self):
+        """Rows for the sales INSERT, in testsalescheck.SALE_COLUMNS order."""
+        return [
+            (self.team, page, amount, self.ts, self.chatter_id, self.chatter_name,
+             self.chatter_username, self.chat_id, self.message_id, line_no)
+            for line_no, page, amount in self.lines
+        ]
+
+
+class SaleSpool:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(spool)")}
+        if "replaces" not in columns:  # spool files written before the column existed
+            self.conn.execute("ALTER TABLE spool ADD COLUMN replaces INTEGER NOT NULL DEFAULT 0")
+
+    def append(self, chat_id: int, message_id: int, team: str, ts: str,
+               chatter_id, chatter_name, chatter_username, lines, edited: bool = False) -> int:
+        """
+        Durably stores the current lines of one message, `lines` = [(line_no, page, amount)],
+        replacing any unflushed entry for the same message. Returns the entry id.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            superseded = self.conn.execute(
+                "DELETE FROM spool WHERE chat_id=? AND message_id=?", (chat_id, message_id)
+            ).rowcount
+            cur = self.conn.execute(
+                """
+                INSERT INTO spool (chat_id, message_id, team, ts, chatter_id, chatter_name, chatter_username,
+                                   lines, replaces)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (chat_id, message_id, team, ts, chatter_id, chatter_name, chatter_username,
+                 json.dumps([list(line) for line in lines]), int(edited or superseded > 0)),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return cur.lastrowid
+
+    def pending(self, limit: int = 500) -> list[SpoolEntry]:
+        """Oldest entries first."""
+        rows = self.conn.execute(
+            """
+            SELECT id, chat_id, message_id, team, ts, chatter_id, chatter_name, chatter_username,
+                   lines, replaces
+            FROM spool ORDER BY id LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        return [
+            SpoolEntry(*row[:8], [tuple(line) for line in json.loads(row[8])], bool(row[9]))
+            for row in rows
+        ]
+
+    def has(self, chat_id: int, message_id: int) -> bool:
+        """True if an unflushed entry exists for this message."""
+        row = self.conn.execute(
+            "SELECT 1 FROM spool WHERE chat_id=? AND message_id=? LIMIT 1", (chat_id, message_id)
+        ).fetchone()
+        return row is not None
+
+    def done(self, ids: list[int]):
+        """Removes entries whose rows are committed in Postgres (one statement, one fsync)."""
+        marks = ",".join("?" * len(ids))
+        self.conn.execute(f"DELETE FROM spool WHERE id IN ({marks})", ids)
+
+    def failed(self, ids: list[int], error: str):
+        marks = ",".join("?" * len(ids))
+        self.conn.execute(
+            f"UPDATE spool SET attempts = attempts + 1, last_error = ? WHERE id IN ({marks})",
+            [error, *ids],
+        )
+
+    def stats(self) -> dict:
+        """{'pending', 'oldest_ts', 'max_attempts', 'last_error'}"""
+        count, oldest, attempts = self.conn.execute(
+            "SELECT COUNT(*), MIN(ts), MAX(attempts) FROM spool"
+        ).fetchone()
+        row = self.conn.execute(
+            "SELECT last_error FROM spool WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return {
+            "pending": int(count),
+            "oldest_ts": oldest,
+            "max_attempts": int(attempts or 0),
+            "last_error": row[0] if row else None,
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,240 @@
+"""Pure tests for the bot (testsalescheck) pieces that need neither Postgres nor Telegram: python -m pytest -q"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from sale_spool import SpoolEntry
+
+# the bot refuses to import without these; its pool only connects on first use
+os.environ.setdefault("DATABASE_URL", "postgres://unused")
+os.environ.setdefault("BOT_TOKEN", "0:test")
+
+import testsalescheck as bot  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class FakeBot:
+    """
+    Records every call; `fail` maps a text to the exceptions its next sends raise,
+    `gone` holds message ids that were deleted in the chat.
+    """
+
+    def __init__(self, fail=None, gone=()):
+        self.calls = []
+        self.fail = fail or {}
+        self.gone = set(gone)
+        self.next_id = 100
+
+    async def send_message(self, chat_id, text, parse_mode=None, message_thread_id=None):
+        errors = self.fail.get(text)
+        if errors:
+            raise errors.pop(0)
+        self.calls.append(("send", chat_id, text))
+        self.next_id += 1
+        return FakeMessage(self.next_id)
+
+    async def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
+        if message_id in self.gone:
+            raise BadRequest("Message to edit not found")
+        self.calls.append(("edit", chat_id, message_id, text))
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", chat_id, message_id))
+
+
+@pytest.fixture(autouse=True)
+def unthrottled(monkeypatch):
+    monkeypatch.setattr(bot, "GLOBAL_BUCKET", bot.TokenBucket(1000, 1000))
+    monkeypatch.setattr(bot, "chat_bucket", lambda chat_id: bot.TokenBucket(1000, 1000))
+
+
+# ----------------- DELIVERY -----------------
+def test_retry_after_requeues_at_the_head_of_its_chat():
+    fake = FakeBot(fail={"a1": [RetryAfter(0)]})
+    done = []
+    deliveries = [
+        bot.Delivery(-1, None, "a1", on_done=done.append),
+        bot.Delivery(-1, None, "a2", on_done=done.append),
+        bot.Delivery(-2, None, "b1", on_done=done.append),
+    ]
+    stats = asyncio.run(bot.deliver(fake, deliveries, label="test"))
+
+    assert [c[2] for c in fake.calls if c[1] == -1] == ["a1", "a2"]
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (3, 1, 0)
+    assert len(done) == 3 and deliveries[0].attempts == 1
+
+
+def test_delivery_gives_up_after_max_attempts():
+    fake = FakeBot(fail={"a1": [RetryAfter(0) for _ in range(bot.DELIVERY_MAX_ATTEMPTS)]})
+    done = []
+    stats = asyncio.run(bot.deliver(fake, [
+        bot.Delivery(-1, None, "a1", on_done=done.append),
+        bot.Delivery(-1, None, "a2", on_done=done.append),
+    ]))
+
+    assert [c[2] for c in fake.calls] == ["a2"]
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (1, bot.DELIVERY_MAX_ATTEMPTS - 1, 1)
+    assert len(done) == 1
+
+
+# ----------------- GOALBOARD EDIT-IN-PLACE -----------------
+def _run_plan(fake, msgs, posted):
+    saved = {}
+    deliveries = bot._plan_goalboard_deliveries("Team 1", -1, 5, msgs, posted, saved)
+    asyncio.run(bot.deliver(fake, deliveries))
+    return saved[("Team 1", -1, 5)]
+
+
+def test_first_post_of_the_shift_sends_every_part():
+    fake = FakeBot()
+    parts = _run_plan(fake, ["part 0", "```part 1```"], {})
+    assert [c[0] for c in fake.calls] == ["send", "send"]
+    assert parts == {0: 101, 1: 102}
+
+
+def test_posted_parts_are_edited_and_extra_parts_deleted():
+    fake = FakeBot()
+    parts = _run_plan(fake, ["new 0", "new 1"], {0: 11, 1: 12, 2: 13})
+    assert fake.calls == [("edit", -1, 11, "new 0"), ("edit", -1, 12, "new 1"), ("delete", -1, 13)]
+    assert parts == {0: 11, 1: 12}
+
+
+def test_new_part_is_sent_after_the_edited_ones():
+    fake = FakeBot()
+    parts = _run_plan(fake, ["new 0", "new 1"], {0: 11})
+    assert fake.calls == [("edit", -1, 11, "new 0"), ("send", -1, "new 1")]
+    assert parts == {0: 11, 1: 101}
+
+
+def test_part_deleted_by_someone_is_posted_again():
+    fake = FakeBot(gone={11})
+    parts = _run_plan(fake, ["new 0"], {0: 11})
+    assert fake.calls == [("send", -1, "new 0")]
+    assert parts == {0: 101}
+
+
+# ----------------- LIVE SHIFT COUNTERS -----------------
+SHIFT = datetime(2026, 1, 1, 8, tzinfo=bot.PH_TZ)
+IN_SHIFT = SHIFT + timedelta(hours=1)
+
+
+def test_add_counts_into_the_current_shift_only():
+    live = bot.LiveShiftCounters()
+    live.add("Team 1", [("Haven", 50), ("Haven", 2.5), ("Zoe", 5)], IN_SHIFT)
+    live.add("Team 1", [("Haven", 100)], IN_SHIFT - timedelta(hours=2))  # previous shift: ignored
+    assert sorted(live.rows("Team 1", IN_SHIFT)) == [("Haven", 52.5), ("Zoe", 5.0)]
+
+    next_shift = SHIFT + timedelta(hours=8)
+    version = live.version("Team 1")
+    assert live.rows("Team 1", next_shift) == []
+    assert live.version("Team 1") != version
+
+
+def test_add_and_load_change_only_that_teams_version():
+    live = bot.LiveShiftCounters()
+    live.snapshot(SHIFT)
+    before = live.version("Team 1"), live.version("Team 2")
+    live.add("Team 1", [("Haven", 1)], IN_SHIFT)
+    assert live.version("Team 1") != before[0] and live.version("Team 2") == before[1]
+
+    live.load(SHIFT, [], teams={"Team 2"})
+    assert live.version("Team 2") != before[1]
+
+
+def test_load_replaces_totals_and_counts_differences():
+    live = bot.LiveShiftCounters()
+    live.add("Team 1", [("Haven", 50), ("Zoe", 5)], IN_SHIFT)
+    live.add("Team 2", [("Haven", 7)], IN_SHIFT)
+
+    diffs, busy = live.load(SHIFT, [("Team 1", "Haven", 30), ("Team 1", "Haven", 20), ("Team 1", "Alexa", 1)])
+    assert (diffs, busy) == (3, set())  # Zoe and Alexa on Team 1, Haven on Team 2
+    assert sorted(live.rows("Team 1", IN_SHIFT)) == [("Alexa", 1.0), ("Haven", 50.0)]
+    assert live.rows("Team 2", IN_SHIFT) == []
+
+
+def test_load_leaves_a_team_alone_if_it_changed_since_the_snapshot():
+    live = bot.LiveShiftCounters()
+    seen = live.snapshot(SHIFT)
+    live.add("Team 1", [("Haven", 50)], IN_SHIFT)  # lands while the DB is being read
+
+    diffs, busy = live.load(SHIFT, [("Team 1", "Haven", 10), ("Team 2", "Zoe", 4)], seen)
+    assert busy == {"Team 1"}
+    assert live.rows("Team 1", IN_SHIFT) == [("Haven", 50.0)]
+    assert live.rows("Team 2", IN_SHIFT) == [("Zoe", 4.0)]
+
+
+def test_load_leaves_a_team_alone_while_a_sale_write_is_in_flight():
+    live = bot.LiveShiftCounters()
+    live.add("Team 1", [("Haven", 50)], IN_SHIFT)
+    seen = live.snapshot(SHIFT)
+    with live.write("Team 1"):
+        assert live.load(SHIFT, [], seen, {"Team 1"}) == (0, {"Team 1"})
+    assert live.load(SHIFT, [], seen, {"Team 1"}) == (1, set())
+    assert live.rows("Team 1", IN_SHIFT) == []
+
+
+def test_load_is_refused_if_a_new_shift_started_mid_read():
+    live = bot.LiveShiftCounters()
+    seen = live.snapshot(SHIFT)
+    live.rows("Team 1", SHIFT + timedelta(hours=8))  # the shift rolls over
+
+    assert live.load(SHIFT, [("Team 1", "Haven", 10)], seen, {"Team 1"}) == (0, {"Team 1"})
+    assert live.rows("Team 1", SHIFT + timedelta(hours=8)) == []
+
+
+# ----------------- SPOOL REPLAY -----------------
+TS = "2026-01-01T09:00:00+08:00"
+
+
+def _entry(message_id, lines, replaces=False, team="Team 1"):
+    return SpoolEntry(1, -100, message_id, team, TS, 7, "Chatter", "@chatter", lines, replaces)
+
+
+def _delta(entries, stored):
+    result = {"unchanged": 0, "touched": set()}
+    return bot._spool_delta(entries, stored, result), result
+
+
+def test_new_message_is_inserted_untouched():
+    (inserts, updates, deletes, removed), result = _delta([_entry(1, [(1, "Haven", 50.0)])], {})
+    assert inserts == [("Team 1", "Haven", 50.0, TS, 7, "Chatter", "@chatter", -100, 1, 1)]
+    assert (updates, deletes, removed) == ([], [], [])
+    assert result == {"unchanged": 0, "touched": set()}
+
+
+def test_edit_is_applied_as_a_delta_against_stored_lines():
+    stored = {(-100, 1): {
+        1: ("Team 1", "Haven", Decimal("50.10"), TS, 7),
+        2: ("Team 1", "Zoe", Decimal("20"), TS, 7),
+        3: ("Team 1", "Alexa", Decimal("5"), TS, 7),
+    }}
+    entry = _entry(1, [(1, "Haven", 50.1), (2, "Zoe", 25.0), (4, "Alexa", 1.0)], replaces=True)
+    (inserts, updates, deletes, removed), result = _delta([entry], stored)
+
+    assert [row[-1] for row in inserts] == [4]
+    assert updates == [(-100, 1, 2, "Zoe", 25.0)]
+    assert deletes == [(-100, 1, 3)]
+    # rollups lose exactly the stored rows that changed or went away
+    assert removed == [stored[(-100, 1)][2], stored[(-100, 1)][3]]
+    assert result == {"unchanged": 1, "touched": {"Team 1"}}
+
+
+def test_replayed_message_changes_nothing():
+    stored = {(-100, 1): {1: ("Team 1", "Haven", Decimal("50"), TS, 7)}}
+    (inserts, updates, deletes, removed), result = _delta([_entry(1, [(1, "Haven", 50.0)])], stored)
+    assert (inserts, updates, deletes, removed) == ([], [], [], [])
+    assert result == {"unchanged": 1, "touched": {"Team 1"}}  # already stored: counters get rebuilt
+
+
+def test_superseded_entry_touches_its_team():
+    _, result = _delta([_entry(1, [], replaces=True, team="Team 2")], {})
+    assert result["touched"] == {"Team 2"}
@@ -0,0 +1,90 @@
+"""Pure tests for response_cache (no Postgres, no LISTEN thread): python -m pytest -q"""
+
+import pytest
+
+from response_cache import MULTI_TEAM_KEY, ResponseCache, etag_matches
+
+
+@pytest.fixture
+def cache():
+    c = ResponseCache("postgres://unused", ttl=60, max_entries=4)
+    c.live = True  # as if the LISTEN connection were up
+    return c
+
+
+def _put(cache, key, body=b"{}"):
+    cache.put(key, cache.token(key[0]), '"e"', body)
+
+
+def test_put_then_get(cache):
+    _put(cache, ("Team 1", 7), b"x")
+    assert cache.get(("Team 1", 7))[1:] == ('"e"', b"x")
+    assert cache.get(("Team 1", 30)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_nothing_is_cached_or_served_while_not_listening(cache):
+    _put(cache, ("Team 1", 7))
+    cache.live = False
+    assert cache.get(("Team 1", 7)) is None
+    _put(cache, ("Team 2", 7))
+    cache.live = True
+    assert cache.get(("Team 2", 7)) is None
+
+
+def test_invalidate_drops_the_team_and_every_multi_team_entry(cache):
+    for key in (("Team 1", 7), ("Team 1", 30), ("Team 2", 7), (MULTI_TEAM_KEY, None)):
+        _put(cache, key)
+    cache.invalidate("Team 1")
+    assert cache.get(("Team 1", 7)) is None and cache.get(("Team 1", 30)) is None
+    assert cache.get((MULTI_TEAM_KEY, None)) is None
+    assert cache.get(("Team 2", 7)) is not None
+
+
+def test_response_computed_across_an_invalidation_is_not_stored(cache):
+    token = cache.token("Team 1")
+    cache.invalidate("Team 1")  # a sale lands while the response is computed
+    cache.put(("Team 1", 7), token, '"e"', b"stale")
+    assert cache.get(("Team 1", 7)) is None
+
+    token = cache.token(MULTI_TEAM_KEY)
+    cache.invalidate("Team 2")
+    cache.put((MULTI_TEAM_KEY, None), token, '"e"', b"stale")
+    assert cache.get((MULTI_TEAM_KEY, None)) is None
+
+
+def test_invalidate_all(cache):
+    _put(cache, ("Team 1", 7))
+    token = cache.token("Team 2")
+    cache.invalidate()
+    cache.put(("Team 2", 7), token, '"e"', b"stale")
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entry_is_a_miss():
+    cache = ResponseCache("postgres://unused", ttl=-1)
+    cache.live = True
+    _put(cache, ("Team 1", 7))
+    assert cache.get(("Team 1", 7)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_full_cache_stores_nothing_more(cache):
+    for days in range(5):
+        _put(cache, ("Team 1", days))
+    assert cache.stats()["entries"] == 4
+    assert cache.get(("Team 1", 4)) is None
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"old", "abc"', True),
+    ('"old"', False),
+    ("abc", False),
+    (" * ", True),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
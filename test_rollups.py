@@ -0,0 +1,94 @@
+"""Pure tests for the rollups helpers that build queries (no Postgres): python -m pytest -q"""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import rollups
+
+PH = rollups.PH_TZ
+
+
+def _at(day, hour=0, minute=0):
+    return datetime(2026, 1, day, hour, minute, tzinfo=PH)
+
+
+# ----------------- PERIODS -----------------
+def _pieces(params):
+    """The [from, to) ranges the three parts of _PERIOD_SQL read, empty ones left out."""
+    out = [(params["start"], params["head_end"])]
+    day = params["first_whole"]
+    while day < params["end_day"]:
+        out.append((rollups._midnight(day), rollups._midnight(day + timedelta(days=1))))
+        day += timedelta(days=1)
+    out.append((params["tail_start"], params["end"]))
+    return [(a, b) for a, b in out if a < b]
+
+
+@pytest.mark.parametrize("start, end", [
+    (_at(1), _at(4)),                  # whole days only
+    (_at(1, 9, 30), _at(4, 14)),       # partial first and last day
+    (_at(1), _at(4, 14)),
+    (_at(1, 9, 30), _at(4)),
+    (_at(1, 9, 30), _at(1, 14)),       # inside one day
+    (_at(1, 9, 30), _at(2, 3)),        # across one midnight, no whole day
+    (_at(1, 23, 59), _at(2)),
+])
+def test_period_pieces_cover_the_range_exactly_once(start, end):
+    pieces = _pieces(rollups._period_params(start, end))
+    assert pieces[0][0] == start and pieces[-1][1] == end
+    assert all(a[1] == b[0] for a, b in zip(pieces, pieces[1:]))
+
+
+def test_whole_days_come_from_the_daily_rollup():
+    params = rollups._period_params(_at(1, 9, 30), _at(4, 14))
+    assert (params["first_whole"], params["end_day"]) == (_at(2).date(), _at(4).date())
+    assert (params["head_end"], params["tail_start"]) == (_at(2), _at(4))
+
+
+def test_start_in_another_timezone_is_split_at_ph_midnight():
+    start = datetime(2026, 1, 1, 1, 30, tzinfo=ZoneInfo("UTC"))  # 09:30 PH
+    params = rollups._period_params(start, _at(3))
+    assert params["first_whole"] == _at(2).date() and params["head_end"] == _at(2)
+
+
+# ----------------- CHATTER TIERS -----------------
+TIERS = rollups.parse_tiers("S:10, A:30 ,B:60,C:100")
+
+
+def test_parse_tiers():
+    assert TIERS == [("S", 10.0), ("A", 30.0), ("B", 60.0), ("C", 100.0)]
+
+
+def test_tier_cutoffs_for_ten_chatters():
+    # CUME_DIST of the n-th best of 10 chatters is n/10
+    assert [rollups.chatter_tier(n / 10, TIERS) for n in range(1, 11)] == list("SAABBBCCCC")
+
+
+def test_tied_chatters_share_the_lower_tier():
+    # two chatters tied for 3rd-4th of 10 both get CUME_DIST 0.4
+    assert rollups.chatter_tier(0.4, TIERS) == "B"
+
+
+def test_cume_past_the_last_cutoff_gets_the_last_tier():
+    assert rollups.chatter_tier(0.9, rollups.parse_tiers("S:10,A:50")) == "A"
+
+
+# ----------------- SERIES BUCKETS -----------------
+@pytest.mark.parametrize("ts, hours, floor, ceil", [
+    (_at(1, 9, 30), 1, _at(1, 9), _at(1, 10)),
+    (_at(1, 9, 30), 6, _at(1, 6), _at(1, 12)),
+    (_at(1, 12), 6, _at(1, 12), _at(1, 12)),   # already on an edge
+    (_at(1, 23, 59), 8, _at(1, 16), _at(2)),   # ceil rolls into the next day
+    (_at(1, 9, 30), 24, _at(1), _at(2)),
+])
+def test_bucket_floor_and_ceil(ts, hours, floor, ceil):
+    assert rollups.bucket_floor(ts, hours) == floor
+    assert rollups.bucket_ceil(ts, hours) == ceil
+
+
+def test_buckets_follow_ph_time():
+    utc = datetime(2026, 1, 1, 17, 30, tzinfo=ZoneInfo("UTC"))  # Jan 2, 01:30 PH
+    assert rollups.bucket_floor(utc, 24) == _at(2)
+    assert rollups.bucket_ceil(utc, 2) == _at(2, 2)
@@ -0,0 +1,105 @@
+"""Pure tests for sale_parser (no Postgres): python -m pytest -q"""
+
+import pytest
+
+from sale_parser import ParsedSale, TagIndex, normalize_tag, parse_sales
+
+PAGES = {
+    "#haven": "Haven",
+    "#zoe": "Zoe",
+    "#alexa": "Alexa",
+    "#alexa lana": "Alexa Lana",
+    "#alexa lana/scarlette moon": "Alexa Lana/Scarlette Moon",
+}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return TagIndex(PAGES)
+
+
+def test_one_sale_per_line_with_bullets_and_trailing_text(index):
+    parsed = parse_sales("shift notes\n+50 #haven\n• +20.5 #Zoe tip\n* +3 #HAVEN thanks\n- +1 #zoe", index)
+    assert parsed.sales == [
+        ParsedSale((2, 50.0, "Haven", "#haven")),
+        ParsedSale((3, 20.5, "Zoe", "#Zoe")),
+        ParsedSale((4, 3.0, "Haven", "#HAVEN")),
+        ParsedSale((5, 1.0, "Zoe", "#zoe")),
+    ]
+    assert parsed.unknown_tags == []
+    assert parsed.pairs() == [("Haven", 50.0), ("Zoe", 20.5), ("Haven", 3.0), ("Zoe", 1.0)]
+
+
+def test_unicode_whitespace_around_bullets(index):
+    parsed = parse_sales("\xa0+50 #haven\n\u2003•\xa0+5 #zoe\n\t* - +1 #haven", index)
+    assert [(s.line_no, s.amount, s.page) for s in parsed.sales] == [(1, 50.0, "Haven"), (2, 5.0, "Zoe"), (3, 1.0, "Haven")]
+    assert parsed.unknown_tags == []
+
+
+def test_longest_multi_word_tag_wins(index):
+    parsed = parse_sales(
+        "+10 #Alexa Lana/Scarlette   Moon tip\n+5 #alexa LANA\n+1 #alexa something", index
+    )
+    assert [(s.page, s.tag) for s in parsed.sales] == [
+        ("Alexa Lana/Scarlette Moon", "#Alexa Lana/Scarlette Moon"),
+        ("Alexa Lana", "#alexa LANA"),
+        ("Alexa", "#alexa"),
+    ]
+
+
+def test_lines_that_are_not_sales_are_skipped(index):
+    text = "no plus here\n50 #haven\n+ #haven\n+abc #haven\n+nan #haven\n+inf #haven\n+5"
+    parsed = parse_sales(text, index)
+    assert parsed.sales == []
+    assert parsed.unknown_tags == []
+
+
+def test_unknown_tags_are_reported_once_in_message_order(index):
+    parsed = parse_sales("+5 #havn\n+6 #nobody here\n+7 #havn\n+8 #haven", index)
+    assert parsed.unknown_tags == ["#havn", "#nobody"]
+    assert parsed.sales == [ParsedSale((4, 8.0, "Haven", "#haven"))]
+
+
+def test_normalize_tag_collapses_case_and_spacing():
+    assert normalize_tag("  #Alexa   LANA ") == "#alexa lana"
+
+
+# ----------------- TAG INDEX -----------------
+@pytest.mark.parametrize("pages", [
+    {"#Zoe": "Upper", "#zoe": "Lower"},
+    {"#zoe": "Lower", "#Zoe": "Upper"},
+])
+def test_case_only_duplicates_resolve_to_the_lowercase_tag(pages):
+    index = TagIndex(pages)
+    assert len(index) == 1
+    for typed in ("#zoe", "#Zoe", "#ZOE"):
+        assert index.lookup(typed) == "Lower"
+        assert parse_sales(f"+1 {typed}", index).sales[0].page == "Lower"
+
+
+def test_mixed_case_tag_matches_any_case():
+    index = TagIndex({"#juliaS": "Julia S"})
+    assert index.lookup("#julias") == index.lookup("#JULIAS") == "Julia S"
+
+
+def test_non_hash_keys_are_ignored():
+    index = TagIndex({"haven": "Haven", "#zoe": "Zoe"})
+    assert len(index) == 1
+    assert index.lookup("haven") is None
+
+
+
+# ----------------- SUGGESTIONS -----------------
+def test_suggest_ranks_closest_tags_first(index):
+    assert index.suggest("#havn")[0] == "#haven"
+    assert index.suggest("#alexa lan", limit=2) == ["#alexa lana", "#alexa"]
+    assert len(index.suggest("#a", limit=10, min_score=0.0)) <= 10
+
+
+def test_suggest_shows_tags_as_registered():
+    assert TagIndex({"#juliaS": "Julia S"}).suggest("#julia") == ["#juliaS"]
+
+
+def test_suggest_without_shared_trigrams_is_empty(index):
+    assert index.suggest("#qqqqqq") == []
+    assert index.suggest("#") == []
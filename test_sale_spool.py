@@ -0,0 +1,89 @@
+"""Pure tests for sale_spool (SQLite only, no Postgres): python -m pytest -q"""
+
+import pytest
+
+from sale_spool import SaleSpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    s = SaleSpool(str(tmp_path / "spool.db"))
+    yield s
+    s.close()
+
+
+def _append(spool, message_id, lines, chat_id=-100, edited=False, ts="2026-01-01T09:00:00+08:00"):
+    return spool.append(chat_id, message_id, "Team 1", ts, 7, "Chatter", "@chatter", lines, edited)
+
+
+def test_new_message_is_pending_with_its_lines(spool):
+    _append(spool, 1, [(1, "Haven", 50.0), (2, "Zoe", 20.0)])
+    (entry,) = spool.pending()
+    assert entry.lines == [(1, "Haven", 50.0), (2, "Zoe", 20.0)]
+    assert not entry.replaces
+    assert entry.sale_rows()[0] == ("Team 1", "Haven", 50.0, entry.ts, 7, "Chatter", "@chatter", -100, 1, 1)
+
+
+def test_pending_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "spool.db")
+    spool = SaleSpool(path)
+    _append(spool, 1, [(1, "Haven", 5.0)])
+    spool.close()
+
+    spool = SaleSpool(path)
+    try:
+        (entry,) = spool.pending()
+        assert (entry.message_id, entry.lines) == (1, [(1, "Haven", 5.0)])
+    finally:
+        spool.close()
+
+
+def test_done_and_failed(spool):
+    _append(spool, 1, [(1, "Haven", 1.0)])
+    _append(spool, 2, [(1, "Haven", 2.0)])
+    first, second = spool.pending()
+
+    spool.failed([first.id, second.id], "db down")
+    stats = spool.stats()
+    assert stats["pending"] == 2 and stats["max_attempts"] == 1 and stats["last_error"] == "db down"
+
+    spool.done([first.id])
+    assert [e.id for e in spool.pending()] == [second.id]
+    assert [e.id for e in spool.pending(limit=-1)] == [second.id]
+
+
+
+# ----------------- EDITS -----------------
+def test_edit_replaces_the_unflushed_entry(spool):
+    _append(spool, 1, [(1, "Haven", 50.0)])
+    _append(spool, 2, [(1, "Zoe", 5.0)])
+    _append(spool, 1, [(1, "Haven", 30.0), (3, "Zoe", 7.0)], edited=True)
+
+    entries = spool.pending()
+    assert [(e.message_id, e.lines, e.replaces) for e in entries] == [
+        (2, [(1, "Zoe", 5.0)], False),
+        (1, [(1, "Haven", 30.0), (3, "Zoe", 7.0)], True),
+    ]
+
+
+def test_edit_of_a_flushed_message_is_marked(spool):
+    _append(spool, 1, [(1, "Haven", 50.0)])
+    spool.done([e.id for e in spool.pending()])
+    _append(spool, 1, [], edited=True)  # all sale lines removed
+
+    (entry,) = spool.pending()
+    assert entry.lines == [] and entry.replaces
+
+
+def test_redelivery_before_flush_replaces_and_is_marked(spool):
+    _append(spool, 1, [(1, "Haven", 50.0)])
+    _append(spool, 1, [(1, "Haven", 50.0)])
+    (entry,) = spool.pending()
+    assert entry.replaces
+
+
+def test_same_message_id_in_another_chat_is_separate(spool):
+    _append(spool, 1, [(1, "Haven", 1.0)], chat_id=-100)
+    _append(spool, 1, [(1, "Haven", 2.0)], chat_id=-200)
+    assert len(spool.pending()) == 2
+    assert spool.has(-100, 1) and spool.has(-200, 1) and not spool.has(-300, 1)
@@ -12,9 +12,29 @@
 #     - One GOALBOARD message per team
 #     - If a team table is huge: that team becomes Part 1/2, Part 2/2 (still per team)
 #
+#   ✅ EDIT-IN-PLACE GOALBOARD
+#     - first scheduled run of a shift posts; later runs in the same shift edit
+#       those messages (parts are added/removed only when the chunk count changes)
+#
+#   ✅ /goalboard (command)
+#     - replies are cached per (team, shift, pace check, live counters, goals version);
+#       repeat calls with nothing new reuse the text (hits/misses in /stats)
+#
 #   ✅ /resetdaily
 #     - deletes TODAY’s sales for the current team (00:00 PH -> now)
 #     - shift "reset" still works automatically (because goalboard filters by shift start)
+#     - rollup tables (rollups.py) are decremented in the same transaction
+#
+#   ✅ SALE PARSER (sale_parser.py)
+#     - tags match case-insensitively (#juliaS, #JULIAS, #julias)
+#     - multi-word tags work (#Alexa Lana/Scarlette Moon)
+#     - nan / inf amounts are ignored
+#     - unknown tag -> replies with the 3 closest tags, not the whole list
+#
+#   ✅ PAGE CATALOG (page_catalog.py)
+#     - approved tags live in Postgres (seeded from ALLOWED_PAGES on first start)
+#     - /addpage #tag = Page Name, /retirepage #tag (owner) — no redeploy needed
+#     - bot + API pick up changes without a restart (version poll)
 #
 #   ✅ NEW (AUTO TEAM PAGES)
 #     - Scheduled GOALBOARD will ONLY show pages that exist for that team.
@@ -24,25 +44,66 @@
 #
 #   ✅ NO MORE SILENT FAILURES
 #     - logs RetryAfter (flood control), message-too-long, etc. in Railway logs
+#     - scheduled reports go through a rate-limited delivery engine
+#       (global + per-chat token buckets); RetryAfter requeues instead of dropping
+#     - /stats (owner) shows the last delivery run
+#
+#   ✅ SALES SURVIVE DB OUTAGES (sale_spool.py)
+#     - a sale is acknowledged once it is in a local SQLite spool (SALE_SPOOL_PATH)
+#     - a background job replays the spool into Postgres as soon as it is reachable
+#     - each line is stored once per (chat, message, line), so replays never double count
+#
+#   ✅ EDITED SALE MESSAGES
+#     - editing a sale message re-parses it; changed / removed / added lines are
+#       applied as a delta in one transaction (totals + rollups follow the edit)
+#     - the sale keeps the time the message was first posted
+#
+#   ✅ NON-BLOCKING DB
+#     - connection pool (db_pool.py, DB_POOL_MIN / DB_POOL_MAX env): bounded wait,
+#       health check on idle connections, dead ones replaced transparently,
+#       read helpers retried on a fresh connection; wait times in /stats
+#     - every db_* helper runs on a bounded executor via run_db(), so one slow
+#       query never stalls sale ingestion in other groups
+#     - updates are handled concurrently (UPDATE_CONCURRENCY env); sales of one
+#       group are still applied in the order they arrived
+#
+#   ✅ WEBHOOK MODE (optional, instead of long polling)
+#     - WEBHOOK_URL + WEBHOOK_SECRET set -> the worker serves its own ASGI endpoint
+#       on $PORT; or BOT_IN_API=1 mounts it in api.py (one web dyno, no worker)
+#     - requests without the right secret token are rejected
 #
 #   ✅ NEW FOR TIERS (Chatter Sales)
 #     - Adds columns to sales table automatically (no manual DB edits):
 #         chatter_id, chatter_name, chatter_username
 #     - Saves Telegram chatter identity for every sale recorded
-#     - Website can compute tiers by grouping per chatter_id
+#     - Per-chatter shift / daily totals kept in rollups (sales_chatter_*),
+#       served ranked with tiers by api.py /chatters
 # ==========================================
 
+import asyncio
+import hmac
 import time as pytime
 import os
+import threading
 import traceback
 import math
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial, wraps
 from datetime import datetime, timedelta, time
 from zoneinfo import ZoneInfo
 
-import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.extras import execute_values
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
 from telegram import Update
+
+import db_pool as pg_pool
+import page_catalog
+import rollups
+import sale_parser
+import sale_spool
 from telegram.constants import ParseMode
 from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest
 from telegram.ext import (
@@ -65,19 +126,41 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN environment variable not set")
 
+# webhook mode (optional): set WEBHOOK_URL to the public https base URL of this service
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
 
-def connect_db_with_retry(dsn: str, tries: int = 40, delay: int = 2):
+
+# DB pool size (bot side). Handlers never touch a connection directly:
+# blocking db_* helpers run on a bounded executor of the same size, so a slow
+# query only ties up one worker instead of the whole event loop.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_WAIT_SECONDS = float(os.getenv("DB_POOL_WAIT_SECONDS", "10"))  # max wait for a free connection
+DB_HEALTH_IDLE_SECONDS = float(os.getenv("DB_HEALTH_IDLE_SECONDS", "30"))  # ping connections idle longer
+
+
+def connect_db_with_retry(dsn: str, tries: int = 40, delay: int = 2) -> pg_pool.DBPool:
     """
     Railway sometimes restarts Postgres or it takes time to be reachable.
     This prevents your bot from crash-looping on startup.
+    (After startup the pool itself replaces dead connections.)
     """
     last = None
     for i in range(tries):
         try:
-            conn = psycopg2.connect(dsn, sslmode="require", connect_timeout=5)
-            conn.autocommit = True
-            print("✅ DB connected")
-            return conn
+            pool = pg_pool.DBPool(
+                dsn,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                wait_timeout=DB_POOL_WAIT_SECONDS,
+                health_idle=DB_HEALTH_IDLE_SECONDS,
+                sslmode="require",
+                connect_timeout=5,
+            )
+            print(f"✅ DB connected (pool {DB_POOL_MIN}-{DB_POOL_MAX})")
+            return pool
         except OperationalError as e:
             last = e
             print(f"⏳ DB not ready (attempt {i+1}/{tries}): {e}")
@@ -85,13 +168,54 @@ def connect_db_with_retry(dsn: str, tries: int = 40, delay: int = 2):
     raise last
 
 
-db = connect_db_with_retry(DATABASE_URL)
+db_pool: pg_pool.DBPool | None = None
+_db_pool_lock = threading.Lock()
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+
+
+def get_db_pool() -> pg_pool.DBPool:
+    global db_pool
+    if db_pool is None:
+        with _db_pool_lock:
+            if db_pool is None:
+                db_pool = connect_db_with_retry(DATABASE_URL)
+    return db_pool
+
+
+def db_cursor():
+    """
+    Borrows a pooled connection for ONE transaction:
+    commits on success, rolls back on error, always hands the connection back.
+    """
+    return get_db_pool().cursor()
+
+
+def db_read(fn):
+    """
+    Marks a db_* helper as read-only: if its connection drops mid-query it is
+    retried on a fresh one (never use on writes).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return get_db_pool().retry(fn, *args, **kwargs)
+    return wrapper
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Runs a blocking db_* helper on the DB executor so handlers yield while it runs.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(fn, *args, **kwargs))
+
 
 # Telegram hard limit is 4096 chars/message
 TG_MAX = 4096
 TG_SAFE = 3900  # leave room for headers/markdown
 
 # ----------------- PAGES -----------------
+# built-in seed for the page_catalog table (used once, on the first start against an empty catalog);
+# add / retire tags with /addpage and /retirepage instead of editing this
 ALLOWED_PAGES = {
     "#haven": "Haven",
     "#juliaS": "Julia S",
@@ -238,10 +362,23 @@ ALLOWED_PAGES = {
     
 }
 
+# active catalog: tags + compiled lookup (CATALOG.index) + /pages listing.
+# Immutable; refresh_catalog() swaps in a new one when the DB version moves.
+CATALOG = page_catalog.Catalog(0, ALLOWED_PAGES)
+
 # ----------------- IN-MEM CACHE (loaded from DB) -----------------
 GROUP_TEAMS = {}  # chat_id -> team name
 CHAT_ADMINS = defaultdict(dict)  # chat_id -> {user_id: level}
 
+# Updates are handled concurrently, so handlers interleave at every await.
+# Whoever changes GROUP_TEAMS / CHAT_ADMINS holds STATE_LOCK across "save to DB,
+# then update memory", so a reload (apply_access_state) never lands in between and
+# drops the change. Readers need no lock: lookups never see a half-applied change.
+STATE_LOCK = asyncio.Lock()
+
+# one lock per team chat: its sale messages (and edits) are spooled in arrival order
+SALE_CHAT_LOCKS = defaultdict(asyncio.Lock)
+
 shift_goals = defaultdict(float)  # page -> goal (global per page in this DB schema)
 page_goals = defaultdict(float)  # page -> goal (global per page in this DB schema)
 
@@ -270,17 +407,14 @@ def day_start_ph(dt: datetime) -> datetime:
 def normalize_page(raw_page: str):
     if not raw_page:
         return None
-    token = raw_page.strip().split()[0].lower()
-    if not token.startswith("#"):
-        return None
-    return ALLOWED_PAGES.get(token)
+    return CATALOG.index.lookup(raw_page)
 
 def canonicalize_page_name(page_str: str):
     page_str = clean(page_str)
     if not page_str:
         return None
-    if page_str.lower().startswith("#"):
-        return ALLOWED_PAGES.get(page_str.lower())
+    if page_str.startswith("#"):
+        return CATALOG.index.lookup(page_str)
     return page_str
 
 def current_shift_label(dt: datetime) -> str:
@@ -336,7 +470,7 @@ def pace_checkpoint(now: datetime, start: datetime):
 
 # ----------------- DB SCHEMA + HELPERS -----------------
 def init_db():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("""
         CREATE TABLE IF NOT EXISTS teams (
             chat_id BIGINT PRIMARY KEY,
@@ -394,6 +528,18 @@ def init_db():
             page TEXT NOT NULL,
             PRIMARY KEY (team, page)
         );
+
+        -- scheduled GOALBOARD messages already posted this shift (edited in place)
+        -- thread_id 0 = no topic
+        CREATE TABLE IF NOT EXISTS goalboard_posts (
+            team TEXT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            thread_id BIGINT NOT NULL DEFAULT 0,
+            part INT NOT NULL,
+            shift_start TIMESTAMPTZ NOT NULL,
+            message_id BIGINT NOT NULL,
+            PRIMARY KEY (team, chat_id, thread_id, part)
+        );
         """)
 
         # safety migrations
@@ -408,8 +554,20 @@ def init_db():
         cur.execute("""ALTER TABLE sales ADD COLUMN IF NOT EXISTS chatter_username TEXT;""")
         cur.execute("""CREATE INDEX IF NOT EXISTS idx_sales_chatter_ts ON sales (chatter_id, ts DESC);""")
 
+        # ✅ source message of every sale: spool replays are idempotent per line
+        cur.execute("""ALTER TABLE sales ADD COLUMN IF NOT EXISTS chat_id BIGINT;""")
+        cur.execute("""ALTER TABLE sales ADD COLUMN IF NOT EXISTS message_id BIGINT;""")
+        cur.execute("""ALTER TABLE sales ADD COLUMN IF NOT EXISTS line_no INT;""")
+        cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS uq_sales_message_line ON sales (chat_id, message_id, line_no);""")
+
+        # ✅ rollup tables (shift / daily / lifetime totals), backfilled from history on first run
+        rollups.ensure_rollups(cur)
+
+        # ✅ page catalog (seeded from ALLOWED_PAGES when empty)
+        page_catalog.ensure_catalog(cur, seed=ALLOWED_PAGES)
+
 def db_register_team(chat_id: int, team_name: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO teams (chat_id, name)
@@ -421,13 +579,13 @@ def db_register_team(chat_id: int, team_name: str):
         )
 
 def db_delete_team(chat_id: int):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         # remove team + admins; keep sales/history by default
         cur.execute("DELETE FROM teams WHERE chat_id=%s", (chat_id,))
         cur.execute("DELETE FROM admins WHERE chat_id=%s", (chat_id,))
 
 def db_upsert_admin(chat_id: int, user_id: int, level: int):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO admins (chat_id, user_id, level)
@@ -439,30 +597,188 @@ def db_upsert_admin(chat_id: int, user_id: int, level: int):
         )
 
 def db_delete_admin(chat_id: int, user_id: int):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("DELETE FROM admins WHERE chat_id=%s AND user_id=%s", (chat_id, user_id))
 
-# ✅ UPDATED: now saves chatter_id/name/username for tiers
-def db_add_sale(
+# every INSERT INTO sales: (chat_id, message_id, line_no) identifies a line of a
+# Telegram message, so writing the same message twice only stores it once
+SALE_COLUMNS = "team, page, amount, ts, chatter_id, chatter_name, chatter_username, chat_id, message_id, line_no"
+
+def _insert_sales(cur, sale_rows):
+    """
+    One multi-row INSERT of SALE_COLUMNS rows. Lines already stored are skipped;
+    rollups + team_pages are updated for the rows actually inserted (same transaction).
+    """
+    inserted = execute_values(
+        cur,
+        f"""
+        INSERT INTO sales ({SALE_COLUMNS})
+        VALUES %s
+        ON CONFLICT (chat_id, message_id, line_no) DO NOTHING
+        RETURNING {rollups.SALE_RETURNING}
+        """,
+        sale_rows,
+        page_size=len(sale_rows),
+        fetch=True,
+    )
+    rollups.apply_sales(cur, inserted)
+    _add_team_pages(cur, inserted)
+    return inserted
+
+def _add_team_pages(cur, rows):
+    """Makes every (team, page, ...) in `rows` available for its team (one upsert)."""
+    page_rows = sorted({(row[0], row[1]) for row in rows})
+    if page_rows:
+        execute_values(
+            cur,
+            """
+            INSERT INTO team_pages (team, page)
+            VALUES %s
+            ON CONFLICT (team, page) DO NOTHING
+            """,
+            page_rows,
+            page_size=len(page_rows),
+        )
+
+# ✅ UPDATED: one message = one transaction (saves chatter_id/name/username for tiers)
+def db_add_sales(
     team: str,
-    page: str,
-    amount: float,
+    sales: list[tuple[str, float]],
     ts_iso: str,
     chatter_id: int | None,
     chatter_name: str | None,
     chatter_username: str | None,
 ):
-    with db.cursor() as cur:
+    """
+    Writes every parsed (page, amount) line of ONE message straight to Postgres
+    in a single round trip (no source message, so never deduplicated).
+    The bot itself goes through the spool (db_replay_spool); this is for tools / bench.py.
+    """
+    if not sales:
+        return
+
+    sale_rows = [
+        (team, page, amount, ts_iso, chatter_id, chatter_name, chatter_username, None, None, None)
+        for page, amount in sales
+    ]
+    with db_cursor() as cur:
+        _insert_sales(cur, sale_rows)
+
+def _message_keys(entries) -> tuple[list[int], list[int]]:
+    """(chat_ids, message_ids) arrays for the unnest() lookups below."""
+    keys = sorted({(e.chat_id, e.message_id) for e in entries})
+    return [k[0] for k in keys], [k[1] for k in keys]
+
+def _spool_delta(entries, stored: dict, result: dict):
+    """
+    Diffs spooled messages against `stored` ((chat_id, message_id) -> line_no ->
+    (team, page, amount, ts, chatter_id)). Returns (inserts, updates, deletes, removed):
+    SALE_COLUMNS rows to insert, (chat_id, message_id, line_no, page, amount) to update,
+    (chat_id, message_id, line_no) to delete, and the stored rows that updates and
+    deletes take out of the rollups. Counts "unchanged" and "touched" into `result`.
+    """
+    inserts, updates, deletes, removed = [], [], [], []
+    for e in entries:
+        old = stored.get((e.chat_id, e.message_id), {})
+        result["touched"] |= {row[0] for row in old.values()}
+        if e.replaces:
+            result["touched"].add(e.team)
+
+        new_rows = {row[-1]: row for row in e.sale_rows()}  # line_no -> SALE_COLUMNS row
+        for line_no, row in new_rows.items():
+            page, amount = row[1], row[2]
+            prev = old.get(line_no)
+            if prev is None:
+                inserts.append(row)
+            elif prev[1] != page or float(prev[2]) != float(amount):
+                updates.append((e.chat_id, e.message_id, line_no, page, amount))
+                removed.append(prev)
+            else:
+                result["unchanged"] += 1
+
+        for line_no, prev in old.items():
+            if line_no not in new_rows:
+                deletes.append((e.chat_id, e.message_id, line_no))
+                removed.append(prev)
+    return inserts, updates, deletes, removed
+
+def db_replay_spool(entries: list[sale_spool.SpoolEntry]) -> dict:
+    """
+    Applies spooled messages in ONE transaction, each as a delta against the rows
+    already stored for its (chat_id, message_id): new lines are inserted, changed
+    lines updated, lines no longer in the message deleted. Rollups get exactly the
+    difference, so replaying or editing a message never double counts.
+
+    Returns line counts + "touched": teams whose messages already had rows, were
+    edited or superseded an unflushed entry (their live shift counters need a rebuild).
+    """
+    result = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "touched": set()}
+    if not entries:
+        return result
+
+    chat_ids, message_ids = _message_keys(entries)
+    with db_cursor() as cur:
         cur.execute(
             """
-            INSERT INTO sales (team, page, amount, ts, chatter_id, chatter_name, chatter_username)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            SELECT s.chat_id, s.message_id, s.line_no, s.team, s.page, s.amount, s.ts, s.chatter_id
+            FROM sales s
+            JOIN unnest(%s::bigint[], %s::bigint[]) AS m (chat_id, message_id)
+              ON s.chat_id = m.chat_id AND s.message_id = m.message_id
+            ORDER BY s.id
+            FOR UPDATE OF s
             """,
-            (team, page, amount, ts_iso, chatter_id, chatter_name, chatter_username),
+            (chat_ids, message_ids),
         )
+        stored = defaultdict(dict)  # (chat_id, message_id) -> line_no -> (team, page, amount, ts, chatter_id)
+        for chat_id, message_id, line_no, team, page, amount, ts, chatter_id in cur.fetchall():
+            stored[(chat_id, message_id)][line_no] = (team, page, amount, ts, chatter_id)
+
+        inserts, updates, deletes, removed = _spool_delta(entries, stored, result)
+        added = []  # rollup rows of the updated lines, as stored after the UPDATE
+
+        if deletes:
+            execute_values(
+                cur,
+                """
+                DELETE FROM sales AS s
+                USING (VALUES %s) AS v (chat_id, message_id, line_no)
+                WHERE s.chat_id = v.chat_id AND s.message_id = v.message_id AND s.line_no = v.line_no
+                """,
+                deletes,
+                page_size=len(deletes),
+            )
+        if updates:
+            # RETURNING hands the rollups the NUMERIC amounts Postgres stored, not the spool's floats
+            added = execute_values(
+                cur,
+                """
+                UPDATE sales AS s
+                SET page = v.page, amount = v.amount
+                FROM (VALUES %s) AS v (chat_id, message_id, line_no, page, amount)
+                WHERE s.chat_id = v.chat_id AND s.message_id = v.message_id AND s.line_no = v.line_no
+                RETURNING s.team, s.page, s.amount, s.ts, s.chatter_id
+                """,
+                updates,
+                page_size=len(updates),
+                fetch=True,
+            )
+        rollups.apply_sales(cur, removed, sign=-1)
+        rollups.apply_sales(cur, added)
+        _add_team_pages(cur, added)
+
+        inserted = _insert_sales(cur, inserts) if inserts else []
+
+    result.update(inserted=len(inserted), updated=len(updates), deleted=len(deletes))
+    return result
+
+def db_message_has_sales(chat_id: int, message_id: int) -> bool:
+    """One attempt, short pool wait, no retry: callers treat any failure as "maybe"."""
+    with get_db_pool().cursor(timeout=SALE_PROBE_WAIT_SECONDS) as cur:
+        cur.execute("SELECT 1 FROM sales WHERE chat_id=%s AND message_id=%s LIMIT 1", (chat_id, message_id))
+        return cur.fetchone() is not None
 
 def db_add_team_page(team: str, page: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO team_pages (team, page)
@@ -472,13 +788,14 @@ def db_add_team_page(team: str, page: str):
             (team, page)
         )
 
+@db_read
 def db_get_team_pages(team: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("SELECT page FROM team_pages WHERE team=%s", (team,))
         return [str(r[0]) for r in cur.fetchall()]
 
 def db_upsert_page_goal(page: str, goal: float):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO page_goals (page, goal)
@@ -490,7 +807,7 @@ def db_upsert_page_goal(page: str, goal: float):
         )
 
 def db_upsert_shift_goal(page: str, goal: float):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO shift_goals (page, goal)
@@ -502,15 +819,15 @@ def db_upsert_shift_goal(page: str, goal: float):
         )
 
 def db_clear_page_goals():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("DELETE FROM page_goals")
 
 def db_clear_shift_goals():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("DELETE FROM shift_goals")
 
 def db_upsert_override(page: str, shift_total=None, page_total=None):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             "INSERT INTO manual_overrides (page, shift_total, page_total) VALUES (%s, 0, 0) "
             "ON CONFLICT (page) DO NOTHING",
@@ -522,17 +839,17 @@ def db_upsert_override(page: str, shift_total=None, page_total=None):
             cur.execute("UPDATE manual_overrides SET page_total=%s WHERE page=%s", (page_total, page))
 
 def db_clear_override_shift(page: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("UPDATE manual_overrides SET shift_total=0 WHERE page=%s", (page,))
         cur.execute("DELETE FROM manual_overrides WHERE page=%s AND shift_total=0 AND page_total=0", (page,))
 
 def db_clear_override_page(page: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("UPDATE manual_overrides SET page_total=0 WHERE page=%s", (page,))
         cur.execute("DELETE FROM manual_overrides WHERE page=%s AND shift_total=0 AND page_total=0", (page,))
 
 def db_set_report_group(team: str, chat_id: int, thread_id):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO report_groups (team, chat_id, thread_id)
@@ -544,8 +861,9 @@ def db_set_report_group(team: str, chat_id: int, thread_id):
             (team, chat_id, thread_id)
         )
 
+@db_read
 def db_get_report_groups():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("SELECT team, chat_id, thread_id FROM report_groups")
         out = []
         for (t, cid, th) in cur.fetchall():
@@ -553,7 +871,7 @@ def db_get_report_groups():
         return out
 
 def db_set_global_report_dest(chat_id: int, thread_id):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             INSERT INTO global_report_dest (id, chat_id, thread_id)
@@ -565,8 +883,9 @@ def db_set_global_report_dest(chat_id: int, thread_id):
             (chat_id, thread_id)
         )
 
+@db_read
 def db_get_global_report_dest():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("SELECT chat_id, thread_id FROM global_report_dest WHERE id=1")
         row = cur.fetchone()
         if not row:
@@ -574,49 +893,487 @@ def db_get_global_report_dest():
         chat_id, thread_id = row
         return int(chat_id), (int(thread_id) if thread_id is not None else None)
 
+@db_read
+def db_get_goalboard_posts(start: datetime):
+    """
+    {(team, chat_id, thread_id): {part_idx: message_id}} posted during the shift starting at `start`.
+    """
+    out = defaultdict(dict)
+    with db_cursor() as cur:
+        cur.execute(
+            "SELECT team, chat_id, thread_id, part, message_id FROM goalboard_posts WHERE shift_start=%s",
+            (start,)
+        )
+        for team, cid, th, part, mid in cur.fetchall():
+            out[(str(team), int(cid), int(th) or None)][int(part)] = int(mid)
+    return out
+
+def db_save_goalboard_posts(start: datetime, posts: dict):
+    """
+    Replaces the stored parts for every destination in `posts`; drops older shifts.
+    """
+    rows = [
+        (team, cid, th or 0, part, start, mid)
+        for (team, cid, th), parts in posts.items()
+        for part, mid in parts.items()
+    ]
+    with db_cursor() as cur:
+        cur.execute("DELETE FROM goalboard_posts WHERE shift_start < %s", (start,))
+        for team, cid, th in posts:
+            cur.execute(
+                "DELETE FROM goalboard_posts WHERE team=%s AND chat_id=%s AND thread_id=%s",
+                (team, cid, th or 0)
+            )
+        if rows:
+            execute_values(
+                cur,
+                """
+                INSERT INTO goalboard_posts (team, chat_id, thread_id, part, shift_start, message_id)
+                VALUES %s
+                """,
+                rows,
+            )
+
+@db_read
 def db_list_all_teams() -> list[str]:
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("SELECT DISTINCT name FROM teams ORDER BY name ASC")
         return [str(r[0]) for r in cur.fetchall()]
 
 def db_reset_daily_sales(team: str):
     start = day_start_ph(now_ph())
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
-            "DELETE FROM sales WHERE team=%s AND ts >= %s",
+            f"DELETE FROM sales WHERE team=%s AND ts >= %s RETURNING {rollups.SALE_RETURNING}",
             (team, start)
         )
+        rollups.apply_sales(cur, cur.fetchall(), sign=-1)
 
-def load_from_db():
+@db_read
+def db_get_live_shift_rows(start: datetime, team: str | None = None, replaced=()):
+    """
+    [(team, page, total)] for the shift from the rollup. Rows stored for the
+    `replaced` spool entries' messages come back negated, since the spooled
+    set will replace them.
+    """
+    with db_cursor() as cur:
+        rows = rollups.shift_rows(cur, start, team)
+        if replaced:
+            chat_ids, message_ids = _message_keys(replaced)
+            cur.execute(
+                """
+                SELECT s.team, s.page, -s.amount
+                FROM sales s
+                JOIN unnest(%s::bigint[], %s::bigint[]) AS m (chat_id, message_id)
+                  ON s.chat_id = m.chat_id AND s.message_id = m.message_id
+                WHERE s.ts >= %s AND (%s::text IS NULL OR s.team = %s)
+                """,
+                (chat_ids, message_ids, start, team, team),
+            )
+            rows += [(str(t), str(p), float(v)) for (t, p, v) in cur.fetchall()]
+        return rows
+
+@db_read
+def db_get_goalboard_batch(teams: list[str], start: datetime):
+    """
+    Shift totals + team pages for ALL requested teams in two set-based queries
+    (one pool checkout). Returns {team: (rows, pages)} for every team.
+    """
+    with db_cursor() as cur:
+        totals = rollups.shift_totals_many(cur, teams, start)
+
+        pages = {team: [] for team in totals}
+        cur.execute("SELECT team, page FROM team_pages WHERE team = ANY(%s)", (list(pages),))
+        for team, page in cur.fetchall():
+            pages[str(team)].append(str(page))
+
+    return {team: (totals[team], pages[team]) for team in totals}
+
+@db_read
+def db_get_period_totals(team: str, cutoff: datetime, now: datetime):
+    with db_cursor() as cur:
+        return rollups.period_totals(cur, team, cutoff, now)
+
+@db_read
+def db_get_lifetime_totals(team: str):
+    with db_cursor() as cur:
+        return rollups.lifetime_totals(cur, team)
+
+def _fetch_access(cur):
+    cur.execute("SELECT chat_id, name FROM teams")
+    teams = cur.fetchall()
+
+    cur.execute("SELECT chat_id, user_id, level FROM admins")
+    return teams, cur.fetchall()
+
+@db_read
+def db_fetch_access():
+    """Reads teams/admins only; apply_access_state() swaps them into memory."""
+    with db_cursor() as cur:
+        return _fetch_access(cur)
+
+@db_read
+def db_fetch_state():
+    """
+    Reads teams/admins/goals/overrides. Runs on the DB executor;
+    apply_db_state() then swaps them into memory on the event loop.
+    """
+    with db_cursor() as cur:
+        teams, admins = _fetch_access(cur)
+
+        cur.execute("SELECT page, goal FROM shift_goals")
+        shift = cur.fetchall()
+
+        cur.execute("SELECT page, goal FROM page_goals")
+        page = cur.fetchall()
+
+        cur.execute("SELECT page, shift_total, page_total FROM manual_overrides")
+        overrides = cur.fetchall()
+
+    return teams, admins, shift, page, overrides
+
+def apply_access_state(teams, admins):
+    """Replaces GROUP_TEAMS / CHAT_ADMINS (call with STATE_LOCK held after startup)."""
     GROUP_TEAMS.clear()
     CHAT_ADMINS.clear()
+
+    for chat_id, name in teams:
+        GROUP_TEAMS[int(chat_id)] = str(name)
+
+    for chat_id, user_id, level in admins:
+        CHAT_ADMINS[int(chat_id)][int(user_id)] = int(level)
+
+def apply_db_state(state):
+    """Startup load of everything db_fetch_state() read."""
+    teams, admins, shift, page, overrides = state
+
+    apply_access_state(teams, admins)
     shift_goals.clear()
     page_goals.clear()
     manual_shift_totals.clear()
     manual_page_totals.clear()
 
-    with db.cursor() as cur:
-        cur.execute("SELECT chat_id, name FROM teams")
-        for chat_id, name in cur.fetchall():
-            GROUP_TEAMS[int(chat_id)] = str(name)
+    for p, goal in shift:
+        shift_goals[str(p)] = float(goal)
 
-        cur.execute("SELECT chat_id, user_id, level FROM admins")
-        for chat_id, user_id, level in cur.fetchall():
-            CHAT_ADMINS[int(chat_id)][int(user_id)] = int(level)
+    for p, goal in page:
+        page_goals[str(p)] = float(goal)
 
-        cur.execute("SELECT page, goal FROM shift_goals")
-        for page, goal in cur.fetchall():
-            shift_goals[str(page)] = float(goal)
+    for p, s, t in overrides:
+        p = str(p)
+        manual_shift_totals[p] = float(s)
+        manual_page_totals[p] = float(t)
 
-        cur.execute("SELECT page, goal FROM page_goals")
-        for page, goal in cur.fetchall():
-            page_goals[str(page)] = float(goal)
+def load_from_db():
+    global CATALOG
+    apply_db_state(db_fetch_state())
+    CATALOG = db_reload_catalog(None)
+
+# ----------------- PAGE CATALOG -----------------
+CATALOG_POLL_SECONDS = int(os.getenv("CATALOG_POLL_SECONDS", "30"))
+
+@db_read
+def db_reload_catalog(current: page_catalog.Catalog | None) -> page_catalog.Catalog:
+    with db_cursor() as cur:
+        return page_catalog.reload_if_changed(cur, current)
+
+def db_add_catalog_tag(tag: str, page: str) -> int:
+    with db_cursor() as cur:
+        return page_catalog.add_tag(cur, tag, page)
+
+def db_retire_catalog_tag(tag: str) -> int | None:
+    with db_cursor() as cur:
+        return page_catalog.retire_tag(cur, tag)
+
+async def refresh_catalog(context: ContextTypes.DEFAULT_TYPE = None):
+    """Picks up tags added / retired by any process (one version SELECT when unchanged)."""
+    global CATALOG
+    fresh = await run_db(db_reload_catalog, CATALOG)
+    if fresh is not CATALOG:
+        print(f"📘 page catalog v{CATALOG.version} -> v{fresh.version} ({len(fresh)} tags)")
+        CATALOG = fresh
+
+# ----------------- SALE SPOOL (WRITE-BEHIND) -----------------
+SALE_SPOOL_PATH = os.getenv("SALE_SPOOL_PATH", "sale_spool.db")
+SPOOL_FLUSH_SECONDS = float(os.getenv("SPOOL_FLUSH_SECONDS", "1"))
+SPOOL_BATCH = int(os.getenv("SPOOL_BATCH", "200"))  # messages per flush transaction
+SPOOL_MAX_BACKOFF = 60.0
+
+spool: sale_spool.SaleSpool | None = None
+# one thread owns the SQLite connection; never shares db_executor, so acks keep
+# flowing while every DB thread is stuck on a dead Postgres
+spool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+# held while moving entries spool -> Postgres (and by readers that need both sides consistent)
+spool_flush_lock = asyncio.Lock()
+SPOOL_STATS = {
+    "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0,
+    "failures": 0, "backoff": 0.0, "next_try": 0.0,
+}
 
-        cur.execute("SELECT page, shift_total, page_total FROM manual_overrides")
-        for page, s, p in cur.fetchall():
-            page = str(page)
-            manual_shift_totals[page] = float(s)
-            manual_page_totals[page] = float(p)
+def _spool_call(fn, *args):
+    global spool
+    if spool is None:
+        spool = sale_spool.SaleSpool(SALE_SPOOL_PATH)
+    return fn(spool, *args)
+
+async def run_spool(fn, *args):
+    """Runs sale_spool.SaleSpool.<fn>(spool, *args) on the spool thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(spool_executor, partial(_spool_call, fn, *args))
+
+def _spool_shift_rows(entries, start: datetime, team: str | None = None):
+    """[(team, page, amount)] of spooled lines sold in the shift starting at `start`."""
+    return [
+        (e.team, page, float(amount))
+        for e in entries
+        if (team is None or e.team == team) and datetime.fromisoformat(e.ts) >= start
+        for _, page, amount in e.lines
+    ]
+
+async def flush_spool(context: ContextTypes.DEFAULT_TYPE = None) -> bool:
+    """
+    Replays spooled messages into Postgres, SPOOL_BATCH per transaction, oldest first.
+    Entries are dropped from the spool only after their transaction commits.
+    Returns True once the spool is empty. The periodic job backs off while Postgres is down.
+    """
+    if context is not None and pytime.monotonic() < SPOOL_STATS["next_try"]:
+        return False
+
+    touched = set()
+    try:
+        async with spool_flush_lock:
+            return await _flush_spool_locked(touched)
+    finally:
+        # edited / superseded messages changed counted lines: rebuild those teams' live counters
+        for team in sorted(touched):
+            await rebuild_live_shift(team)
+
+async def _flush_spool_locked(touched: set) -> bool:
+    while True:
+        entries = await run_spool(sale_spool.SaleSpool.pending, SPOOL_BATCH)
+        if not entries:
+            SPOOL_STATS["backoff"] = 0.0
+            return True
+
+        ids = [e.id for e in entries]
+        try:
+            result = await run_db(db_replay_spool, entries)
+        except Exception as e:
+            backoff = min(SPOOL_MAX_BACKOFF, max(SPOOL_FLUSH_SECONDS, SPOOL_STATS["backoff"] * 2))
+            SPOOL_STATS.update(failures=SPOOL_STATS["failures"] + 1, backoff=backoff,
+                               next_try=pytime.monotonic() + backoff)
+            await run_spool(sale_spool.SaleSpool.failed, ids, repr(e)[:500])
+            print(f"⚠️ Spool flush failed, {len(ids)} message(s) kept; retry in {backoff:.0f}s: {e!r}")
+            return False
+
+        await run_spool(sale_spool.SaleSpool.done, ids)
+        for key in ("inserted", "updated", "deleted", "unchanged"):
+            SPOOL_STATS[key] += result[key]
+        touched |= result["touched"]
+
+# ----------------- LIVE SHIFT COUNTERS -----------------
+LIVE_RECONCILE_SECONDS = int(os.getenv("LIVE_RECONCILE_SECONDS", "300"))
+
+class LiveShiftCounters:
+    """
+    Per-team, per-page sales totals for the CURRENT shift, held in memory so
+    /goalboard and /redpages never query Postgres.
+
+    Warmed from sales_shift_totals (+ unflushed spool entries) at startup, bumped
+    after every spooled sale, reset at shift boundaries and reconciled periodically.
+    Writes are tracked per team, so one team's sales never hold up another team's reload.
+    Only touched from the event loop.
+    """
+    def __init__(self):
+        self.start: datetime | None = None
+        self.totals = defaultdict(lambda: defaultdict(float))  # team -> page -> total
+        self.epoch = 0                   # bumped when a new shift starts
+        self.seq = defaultdict(int)      # team -> bumped on every change to that team
+        self.writing = defaultdict(int)  # team -> sale writes in flight (may be committed, not yet counted)
+
+    def _roll(self, start: datetime) -> bool:
+        """Moves to a newer shift (fresh, empty counters). False if `start` is older."""
+        if self.start is None or start > self.start:
+            self.start = start
+            self.totals = defaultdict(lambda: defaultdict(float))
+            self.epoch += 1
+        return start == self.start
+
+    def version(self, team: str) -> tuple[int, int]:
+        """Changes whenever `team`'s counters change (or a new shift starts)."""
+        return self.epoch, self.seq[team]
+
+    def snapshot(self, start: datetime) -> tuple[int, dict]:
+        """(epoch, per-team seq) as of now; hand it back to load() after reading the DB."""
+        self._roll(start)
+        return self.epoch, dict(self.seq)
+
+    def rows(self, team: str, now: datetime) -> list[tuple[str, float]]:
+        self._roll(shift_start(now))
+        return list(self.totals.get(team, {}).items())
+
+    def add(self, team: str, sales: list[tuple[str, float]], ts: datetime):
+        """Counts spooled (page, amount) lines sold at `ts` (ignored if ts is from an older shift)."""
+        if not self._roll(shift_start(ts)):
+            return
+        team_totals = self.totals[team]
+        for page, amount in sales:
+            team_totals[page] += float(amount)
+        self.seq[team] += 1
+
+    @contextmanager
+    def write(self, team: str):
+        """Wrap spool write + add() so reconciliation never races an in-flight sale of `team`."""
+        self.writing[team] += 1
+        try:
+            yield
+        finally:
+            self.writing[team] -= 1
+
+    def load(self, start: datetime, rows, seen: tuple[int, dict] | None = None,
+             teams: set[str] | None = None) -> tuple[int, set[str]]:
+        """
+        Replaces counters (all teams, or just `teams`) with rows [(team, page, total)]
+        (a (team, page) may repeat; its totals are summed).
+
+        With `seen` (a snapshot() taken before the rows were read), a team whose
+        counters moved since, or that has a sale write in flight, is left alone.
+        Returns (how many (team, page) values differed, teams left alone).
+        """
+        epoch, seqs = seen if seen is not None else (None, None)
+        self._roll(start)
+        fresh = defaultdict(lambda: defaultdict(float))
+        for t, page, total in rows:
+            fresh[t][page] += float(total)
+
+        wanted = teams if teams is not None else set(self.totals) | set(fresh)
+        if seen is not None and epoch != self.epoch:
+            return 0, set(wanted)  # a new shift started mid-read
+
+        diffs, busy = 0, set()
+        for t in wanted:
+            if seen is not None and (self.writing[t] or self.seq[t] != seqs.get(t, 0)):
+                busy.add(t)
+                continue
+            old, new = self.totals.get(t, {}), fresh.get(t, {})
+            diffs += sum(1 for p in set(old) | set(new) if abs(old.get(p, 0.0) - new.get(p, 0.0)) > 0.005)
+            if new:
+                self.totals[t] = new
+            else:
+                self.totals.pop(t, None)
+            self.seq[t] += 1
+        return diffs, busy
+
+LIVE_SHIFT = LiveShiftCounters()
+LIVE_REBUILD_MAX_DELAY = 10.0
+_LIVE_REBUILD_WANTED = defaultdict(int)  # team -> rebuild requests that could not run yet
+_LIVE_REBUILD_TASKS: dict[str, asyncio.Task] = {}
+
+async def refresh_live_shift(team: str | None = None, reason: str = "reconcile", tries: int = 3) -> set[str]:
+    """
+    Re-reads the current shift from sales_shift_totals + unflushed spool entries into LIVE_SHIFT.
+    A team whose sale write overlapped the read is skipped (and retried), so nothing is
+    double counted. Returns the teams that still could not be reloaded.
+    """
+    teams = {team} if team is not None else None
+    busy = set(teams or ())
+    for attempt in range(tries):
+        if attempt:
+            await asyncio.sleep(0.2)
+        start = shift_start(now_ph())
+        seen = LIVE_SHIFT.snapshot(start)
+        async with spool_flush_lock:  # no entry moves spool -> DB between the two reads
+            pending = await run_spool(sale_spool.SaleSpool.pending, -1)
+            rows = await run_db(db_get_live_shift_rows, start, team, pending)
+        rows += _spool_shift_rows(pending, start, team)
+
+        diffs, busy = LIVE_SHIFT.load(start, rows, seen, teams)
+        if diffs and reason == "reconcile":
+            print(f"⚠️ Live shift counters drifted from DB ({diffs} value(s)); reloaded.")
+        if not busy:
+            return busy
+        teams = busy  # only retry the teams that were still writing
+
+    print(f"⏳ Live shift {reason} deferred for {', '.join(sorted(busy))} (sales still landing); retrying.")
+    return busy
+
+async def rebuild_live_shift(team: str):
+    """
+    Rebuilds one team's counters after its stored sales changed underneath them.
+    If that team's sales keep landing, the rebuild is retried in the background until it runs.
+    """
+    if await refresh_live_shift(team, reason="rebuild"):
+        _schedule_live_rebuild(team)
+
+def _schedule_live_rebuild(team: str):
+    _LIVE_REBUILD_WANTED[team] += 1
+    if team not in _LIVE_REBUILD_TASKS:
+        _LIVE_REBUILD_TASKS[team] = asyncio.create_task(_retry_live_rebuild(team))
+
+async def _retry_live_rebuild(team: str):
+    delay = 0.5
+    try:
+        while True:
+            await asyncio.sleep(delay)
+            wanted = _LIVE_REBUILD_WANTED[team]
+            try:
+                busy = await refresh_live_shift(team, reason="rebuild", tries=1)
+            except Exception as e:
+                print(f"⚠️ Live shift rebuild for {team} failed: {e!r}")
+                busy = {team}
+            # done only if no new request arrived while this pass was reading
+            if not busy and _LIVE_REBUILD_WANTED[team] == wanted:
+                _LIVE_REBUILD_WANTED.pop(team, None)
+                return
+            delay = min(LIVE_REBUILD_MAX_DELAY, delay * 2)
+    finally:
+        _LIVE_REBUILD_TASKS.pop(team, None)
+
+async def reconcile_live_shift(context: ContextTypes.DEFAULT_TYPE):
+    for team in await refresh_live_shift():
+        _schedule_live_rebuild(team)
+
+# ----------------- GOALBOARD RENDER CACHE -----------------
+# Bumped whenever goals, overrides or teams change (anything /goalboard shows
+# that is not in LIVE_SHIFT).
+DATA_VERSION = 0
+
+def bump_data_version():
+    global DATA_VERSION
+    DATA_VERSION += 1
+
+class GoalboardRenderCache:
+    """
+    /goalboard replies keyed by (team, shift start, pace checkpoint, live counter
+    version, DATA_VERSION): repeat calls inside one pace window reuse the text
+    until a sale or a goal/override change lands.
+    """
+    def __init__(self, max_entries: int = 512):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(team: str, start: datetime, check_idx: int):
+        return (team, start, check_idx, LIVE_SHIFT.version(team), DATA_VERSION)
+
+    def get(self, key):
+        msg = self.entries.get(key)
+        if msg is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return msg
+
+    def put(self, key, msg: str):
+        self.entries[key] = msg
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+GOALBOARD_CACHE = GoalboardRenderCache()
 
 # ----------------- ACCESS CONTROL -----------------
 async def require_owner(update: Update) -> bool:
@@ -655,25 +1412,185 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     print("❌ HANDLER ERROR:", repr(e))
     traceback.print_exc()
 
-async def safe_send(bot, *, chat_id: int, thread_id: int | None, text: str, parse_mode: str | None = None):
+# ----------------- DELIVERY ENGINE (RATE-LIMITED) -----------------
+# Telegram: ~30 msgs/sec per bot overall, ~20 msgs/min into one group.
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25"))       # msgs/sec, all chats
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", str(18 / 60)))   # msgs/sec, one chat
+TG_CHAT_BURST = 3
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "8"))  # sends in flight
+DELIVERY_MAX_ATTEMPTS = 5
+
+class TokenBucket:
+    """
+    `rate` tokens/sec, holds at most `burst`. acquire() waits for one token.
+    """
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = pytime.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = pytime.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+GLOBAL_BUCKET = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_RATE)
+CHAT_BUCKETS: dict[int, TokenBucket] = {}  # chat_id -> bucket (kept across runs)
+LAST_DELIVERY_STATS: dict = {}
+
+def chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = CHAT_BUCKETS.get(chat_id)
+    if bucket is None:
+        bucket = CHAT_BUCKETS[chat_id] = TokenBucket(TG_CHAT_RATE, TG_CHAT_BURST)
+    return bucket
+
+class Delivery:
     """
-    Sends message and logs Flood control / too-long / bad requests.
+    One outbound operation. Deliveries to the same chat go out in list order.
+      • message_id=None             -> send a new message
+      • message_id + text           -> edit that message in place
+      • message_id + text=None      -> delete that message
+    on_done(message_id) is called once the operation succeeded.
     """
+    __slots__ = ("chat_id", "thread_id", "text", "parse_mode", "message_id", "on_done", "attempts")
+
+    def __init__(
+        self,
+        chat_id: int,
+        thread_id: int | None,
+        text: str | None,
+        parse_mode: str | None = None,
+        message_id: int | None = None,
+        on_done=None,
+    ):
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.message_id = message_id
+        self.on_done = on_done
+        self.attempts = 0
+
+    @property
+    def action(self) -> str:
+        if self.message_id is None:
+            return "sent"
+        return "edited" if self.text is not None else "deleted"
+
+async def _perform(bot, d: Delivery) -> int | None:
+    if d.action == "sent":
+        msg = await bot.send_message(
+            chat_id=d.chat_id,
+            text=d.text,
+            parse_mode=d.parse_mode,
+            message_thread_id=d.thread_id if d.thread_id else None,
+        )
+        return msg.message_id
+
+    if d.action == "deleted":
+        try:
+            await bot.delete_message(chat_id=d.chat_id, message_id=d.message_id)
+        except BadRequest as e:
+            # already gone / too old to delete: nothing left to clean up
+            print(f"⚠️ Delete skipped ({d.chat_id}/{d.message_id}): {e}")
+        return d.message_id
+
     try:
-        await bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            parse_mode=parse_mode,
-            message_thread_id=thread_id if thread_id else None,
+        await bot.edit_message_text(
+            chat_id=d.chat_id,
+            message_id=d.message_id,
+            text=d.text,
+            parse_mode=d.parse_mode,
         )
-    except RetryAfter as e:
-        log_exc("⏳ RetryAfter (flood control)", e)
     except BadRequest as e:
-        log_exc("⚠️ BadRequest", e)
-    except (TimedOut, NetworkError) as e:
-        log_exc("🌐 Network/TimedOut", e)
-    except Exception as e:
-        log_exc("❌ Send failed", e)
+        err = str(e).lower()
+        if "not modified" in err:
+            return d.message_id
+        if "not found" in err or "can't be edited" in err:
+            # the old post was deleted by someone: post it fresh instead
+            d.message_id = None
+            return await _perform(bot, d)
+        raise
+    return d.message_id
+
+async def deliver(bot, deliveries: list[Delivery], label: str = "delivery") -> dict:
+    """
+    Sends everything concurrently across chats while staying inside the global
+    and per-chat token buckets. Each chat is drained in order; RetryAfter and
+    network errors requeue the message at the head of its chat queue (after the
+    requested wait) instead of dropping it. Logs + returns per-run stats.
+    """
+    queues = defaultdict(deque)
+    for d in deliveries:
+        queues[d.chat_id].append(d)
+
+    stats = {
+        "label": label,
+        "queued": len(deliveries),
+        "sent": 0,
+        "edited": 0,
+        "deleted": 0,
+        "retried": 0,
+        "failed": 0,
+    }
+    in_flight = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+    t0 = pytime.monotonic()
+
+    async def drain(chat_id: int, queue: deque):
+        bucket = chat_bucket(chat_id)
+        while queue:
+            d = queue[0]
+            await bucket.acquire()
+            await GLOBAL_BUCKET.acquire()
+
+            retry_in = None
+            try:
+                async with in_flight:
+                    message_id = await _perform(bot, d)
+            except RetryAfter as e:
+                log_exc("⏳ RetryAfter (flood control)", e)
+                retry_in = float(e.retry_after)
+            except BadRequest as e:
+                log_exc("⚠️ BadRequest", e)
+            except (TimedOut, NetworkError) as e:
+                log_exc("🌐 Network/TimedOut", e)
+                retry_in = float(2 ** d.attempts)
+            except Exception as e:
+                log_exc("❌ Send failed", e)
+            else:
+                stats[d.action] += 1
+                queue.popleft()
+                if d.on_done:
+                    d.on_done(message_id)
+                continue
+
+            d.attempts += 1
+            if retry_in is None or d.attempts >= DELIVERY_MAX_ATTEMPTS:
+                stats["failed"] += 1
+                queue.popleft()
+                continue
+
+            # requeue: stays at the head of this chat's queue so parts keep their order
+            stats["retried"] += 1
+            await asyncio.sleep(retry_in)
+
+    await asyncio.gather(*(drain(cid, q) for cid, q in queues.items()))
+
+    stats["seconds"] = round(pytime.monotonic() - t0, 2)
+    LAST_DELIVERY_STATS.clear()
+    LAST_DELIVERY_STATS.update(stats)
+    print(
+        f"📬 {label}: {stats['queued']} queued -> sent {stats['sent']}, edited {stats['edited']}, "
+        f"deleted {stats['deleted']} (retried {stats['retried']}, failed {stats['failed']}) "
+        f"in {stats['seconds']}s across {len(queues)} chat(s)"
+    )
+    return stats
 
 # ----------------- BASIC -----------------
 async def chatid(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -692,8 +1609,9 @@ async def registerteam(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Format: /registerteam Team 1")
 
     chat_id_ = update.effective_chat.id
-    GROUP_TEAMS[chat_id_] = team_name
-    db_register_team(chat_id_, team_name)
+    async with STATE_LOCK:
+        await run_db(db_register_team, chat_id_, team_name)
+        GROUP_TEAMS[chat_id_] = team_name
 
     return await update.message.reply_text(
         f"✅ Registered this group!\nTeam: {team_name}\nChat ID: {chat_id_}\nNext: /registeradmin 1"
@@ -706,14 +1624,14 @@ async def unregisterteam(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id_ = update.effective_chat.id
-    if chat_id_ not in GROUP_TEAMS:
-        return await update.message.reply_text("This group is not registered.")
+    async with STATE_LOCK:
+        if chat_id_ not in GROUP_TEAMS:
+            return await update.message.reply_text("This group is not registered.")
 
-    team = GROUP_TEAMS.pop(chat_id_, None)
-    if chat_id_ in CHAT_ADMINS:
-        del CHAT_ADMINS[chat_id_]
+        await run_db(db_delete_team, chat_id_)
+        team = GROUP_TEAMS.pop(chat_id_, None)
+        CHAT_ADMINS.pop(chat_id_, None)
 
-    db_delete_team(chat_id_)
     await update.message.reply_text(f"🗑️ Team unregistered.\nRemoved team: {team}\nChat ID: {chat_id_}")
 
 async def registeradmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -736,8 +1654,9 @@ async def registeradmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         target_user = update.effective_user
 
-    CHAT_ADMINS[chat_id_][target_user.id] = level
-    db_upsert_admin(chat_id_, target_user.id, level)
+    async with STATE_LOCK:
+        await run_db(db_upsert_admin, chat_id_, target_user.id, level)
+        CHAT_ADMINS[chat_id_][target_user.id] = level
 
     name = clean(target_user.username or target_user.first_name or str(target_user.id))
     await update.message.reply_text(f"✅ Registered bot-admin: {name} (level {level})")
@@ -765,11 +1684,12 @@ async def unregisteradmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         return await update.message.reply_text("Use: reply then /unregisteradmin\nor: /unregisteradmin <user_id>")
 
-    if target_id not in CHAT_ADMINS.get(chat_id_, {}):
-        return await update.message.reply_text("That user is not a bot-admin in this group.")
+    async with STATE_LOCK:
+        if target_id not in CHAT_ADMINS.get(chat_id_, {}):
+            return await update.message.reply_text("That user is not a bot-admin in this group.")
 
-    del CHAT_ADMINS[chat_id_][target_id]
-    db_delete_admin(chat_id_, target_id)
+        await run_db(db_delete_admin, chat_id_, target_id)
+        CHAT_ADMINS[chat_id_].pop(target_id, None)
     await update.message.reply_text(f"🗑️ Removed bot-admin access for: {target_label}")
 
 async def listadmins(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -806,7 +1726,7 @@ async def registergoal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     thread_id = update.effective_message.message_thread_id if update.effective_message else None
 
     try:
-        db_set_report_group(team, chat_id_, thread_id)
+        await run_db(db_set_report_group, team, chat_id_, thread_id)
     except Exception as e:
         log_exc("❌ DB error while saving report destination", e)
         return await update.message.reply_text(f"❌ DB error while saving report destination:\n{e}")
@@ -829,7 +1749,7 @@ async def registergoalall(update: Update, context: ContextTypes.DEFAULT_TYPE):
     thread_id = update.effective_message.message_thread_id if update.effective_message else None
 
     try:
-        db_set_global_report_dest(chat_id_, thread_id)
+        await run_db(db_set_global_report_dest, chat_id_, thread_id)
     except Exception as e:
         log_exc("❌ DB error while saving GLOBAL destination", e)
         return await update.message.reply_text(f"❌ DB error while saving GLOBAL destination:\n{e}")
@@ -848,15 +1768,45 @@ async def resetdaily(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await require_owner(update):
         return
 
-    db_reset_daily_sales(team)
+    # spooled sales must be in Postgres first, or they would reappear after the reset
+    if not await flush_spool():
+        return await update.message.reply_text(
+            "⚠️ Some sales are still waiting to be saved (database unreachable). Try again shortly."
+        )
+
+    await run_db(db_reset_daily_sales, team)
+    await rebuild_live_shift(team)
     await update.message.reply_text(
         f"🧹 Daily reset complete for {team}.\nDeleted TODAY’s sales only (00:00 PH → now)."
     )
 
 # ----------------- SALES HANDLER -----------------
+SALE_PROBE_WAIT_SECONDS = 1.0
+
+async def _message_had_sales(chat_id: int, message_id: int) -> bool:
+    """
+    Whether an edit that now has no sale lines must still be spooled (to delete
+    the lines it had). Called BEFORE the chat lock, so a slow or dead Postgres
+    never holds up that chat's acks: the spool is checked first (an entry that
+    flushes meanwhile is then already in Postgres), then one best-effort read,
+    skipped while the flusher is backing off. When unsure the answer is True;
+    spooling an empty set is always safe.
+    """
+    if await run_spool(sale_spool.SaleSpool.has, chat_id, message_id):
+        return True
+    if SPOOL_STATS["backoff"]:
+        return True
+    try:
+        return await run_db(db_message_has_sales, chat_id, message_id)
+    except Exception as e:
+        print(f"⚠️ Could not check stored lines of edited message {message_id}; spooling it: {e!r}")
+        return True
+
 async def handle_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.message.text:
+    msg = update.effective_message
+    if not msg or not msg.text:
         return
+    edited = update.edited_message is not None
 
     team = get_team(update.effective_chat.id)
     if team is None:
@@ -868,44 +1818,62 @@ async def handle_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chatter_name = (u.full_name if u else None) or (u.first_name if u else None) or None
     chatter_username = ("@" + u.username) if (u and u.username) else None
 
-    saved = False
-    unknown_tags = set()
-    ts_iso = now_ph().isoformat()
-
-    for raw in update.message.text.splitlines():
-        line = raw.strip()
-        line = line.lstrip("*•- ").strip()
-        if not line.startswith("+"):
-            continue
-
-        parts = line[1:].split(maxsplit=1)
-        if len(parts) < 2:
-            continue
-
-        try:
-            amount = float(parts[0])
-        except ValueError:
-            continue
-
-        canonical_page = normalize_page(parts[1])
-        if not canonical_page:
-            bad_token = parts[1].strip().split()[0]
-            unknown_tags.add(bad_token)
-            continue
-
-        db_add_sale(team, canonical_page, float(amount), ts_iso, chatter_id, chatter_name, chatter_username)
-        db_add_team_page(team, canonical_page)  # ✅ auto-available
-        saved = True
+    # ✅ one pass over the whole message (see sale_parser.py)
+    parsed = sale_parser.parse_sales(msg.text, CATALOG.index)
+    sales = parsed.pairs()
+    unknown_tags = parsed.unknown_tags
+
+    # ✅ an edit with no sale lines only matters if the message had some (checked outside the lock)
+    had_sales = edited and not sales and await _message_had_sales(update.effective_chat.id, msg.message_id)
+
+    # ✅ sales of one chat are spooled strictly in arrival order (an edit never
+    # overtakes its original); other chats proceed concurrently. Replies go out after.
+    ack = None
+    async with SALE_CHAT_LOCKS[update.effective_chat.id]:
+        # ✅ an edit keeps the time the message was first posted
+        ts = msg.date.astimezone(PH_TZ) if edited else now_ph()
+        ts_iso = ts.isoformat()
+
+        if edited:
+            # ✅ the new set of lines replaces the old one (even if it is now empty);
+            # flush_spool() applies the difference and rebuilds this team's live counters
+            lines = [(s.line_no, s.page, s.amount) for s in parsed.sales]
+            if lines or had_sales or await run_spool(
+                sale_spool.SaleSpool.has, update.effective_chat.id, msg.message_id
+            ):
+                await run_spool(
+                    sale_spool.SaleSpool.append,
+                    update.effective_chat.id, msg.message_id, team, ts_iso,
+                    chatter_id, chatter_name, chatter_username, lines, True,
+                )
+            if sales:
+                ack = "✏️ Sale updated"
+        elif sales:
+            # ✅ acknowledge once the message is durably spooled; flush_spool() writes it
+            # to Postgres (one transaction, pages auto-available) even across DB outages
+            lines = [(s.line_no, s.page, s.amount) for s in parsed.sales]
+            with LIVE_SHIFT.write(team):
+                await run_spool(
+                    sale_spool.SaleSpool.append,
+                    update.effective_chat.id, msg.message_id, team, ts_iso,
+                    chatter_id, chatter_name, chatter_username, lines,
+                )
+                LIVE_SHIFT.add(team, sales, ts)
+            ack = "✅ Sale recorded"
 
-    if saved:
-        await update.message.reply_text("✅ Sale recorded")
+    if ack:
+        await msg.reply_text(ack)
 
     if unknown_tags:
-        allowed = "\n".join(sorted(ALLOWED_PAGES.keys()))
-        bad = "\n".join(sorted(unknown_tags))
-        await update.message.reply_text(
+        # ✅ nearest tags per typo instead of the whole list (full list: /pages)
+        lines = []
+        for bad in sorted(unknown_tags):
+            close = CATALOG.index.suggest(bad)
+            lines.append(f"{bad} → did you mean: {', '.join(close)}?" if close else f"{bad} → no close match")
+        await msg.reply_text(
             "⚠️ Unknown/invalid page tag(s):\n"
-            f"{bad}\n\nUse ONLY these approved tags:\n{allowed}"
+            + "\n".join(lines)
+            + "\n\nSee /pages for all approved tags."
         )
 
 # ----------------- DISPLAY COMMANDS -----------------
@@ -913,26 +1881,15 @@ async def pages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team = await require_team(update)
     if team is None:
         return
-    lines = [f"{tag} → {ALLOWED_PAGES[tag]}" for tag in sorted(ALLOWED_PAGES.keys())]
-    await update.message.reply_text(f"📘 Approved Pages (use tags) — {team}\n\n" + "\n".join(lines))
+    # ✅ listing is rendered once per catalog version
+    await update.message.reply_text(f"📘 Approved Pages (use tags) — {team}\n\n" + CATALOG.listing)
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team = await require_team(update)
     if team is None:
         return
 
-    with db.cursor() as cur:
-        cur.execute(
-            """
-            SELECT page, SUM(amount) as total
-            FROM sales
-            WHERE team=%s
-            GROUP BY page
-            ORDER BY total DESC
-            """,
-            (team,)
-        )
-        rows = cur.fetchall()
+    rows = await run_db(db_get_lifetime_totals, team)
 
     if not rows:
         return await update.message.reply_text("No sales yet.")
@@ -969,8 +1926,9 @@ async def setgoal(update: Update, context: ContextTypes.DEFAULT_TYPE):
             continue
 
         shift_goals[page] = goal
-        db_upsert_shift_goal(page, goal)
-        db_add_team_page(team, page)  # ✅ ensure visible for this team
+        await run_db(db_upsert_shift_goal, page, goal)
+        await run_db(db_add_team_page, team, page)  # ✅ ensure visible for this team
+        bump_data_version()
         results.append(f"✓ {page} = ${goal:.2f}")
 
     msg = "🎯 Shift Goals Updated:\n" + ("\n".join(results) if results else "(no valid entries)")
@@ -986,21 +1944,20 @@ async def goalboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     now = now_ph()
     start = shift_start(now)
-    label = current_shift_label(now)
+    check_idx, _, _ = pace_checkpoint(now, start)
 
-    check_idx, target_ratio, checkpoint_time = pace_checkpoint(now, start)
+    rows = LIVE_SHIFT.rows(team, now)  # ✅ in-memory, no DB round trip
 
-    with db.cursor() as cur:
-        cur.execute(
-            """
-            SELECT page, SUM(amount) AS total
-            FROM sales
-            WHERE team=%s AND ts >= %s
-            GROUP BY page
-            """,
-            (team, start)
-        )
-        rows = cur.fetchall()
+    key = GOALBOARD_CACHE.key(team, start, check_idx)
+    msg = GOALBOARD_CACHE.get(key)
+    if msg is None:
+        msg = _render_goalboard_progress(team, start, rows, now)
+        GOALBOARD_CACHE.put(key, msg)
+    await update.message.reply_text(msg)
+
+def _render_goalboard_progress(team: str, start: datetime, rows, now: datetime) -> str:
+    label = current_shift_label(now)
+    check_idx, target_ratio, checkpoint_time = pace_checkpoint(now, start)
 
     totals = defaultdict(float)
     for page, total in rows:
@@ -1011,7 +1968,7 @@ async def goalboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
             totals[page] = float(val)
 
     if not totals:
-        return await update.message.reply_text(
+        return (
             f"🎯 GOAL PROGRESS — {team}\n"
             f"🕒 Shift: {label}\n"
             f"✅ Shift started: {start.strftime('%b %d, %Y %I:%M %p')} (PH)\n"
@@ -1047,7 +2004,7 @@ async def goalboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             msg += f"⚪ {page}: ${amt:.2f} (no shift goal)\n"
 
-    await update.message.reply_text(msg)
+    return msg
 
 async def redpages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team = await require_team(update)
@@ -1058,17 +2015,7 @@ async def redpages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     start = shift_start(now)
     label = current_shift_label(now)
 
-    with db.cursor() as cur:
-        cur.execute(
-            """
-            SELECT page, SUM(amount) AS total
-            FROM sales
-            WHERE team=%s AND ts >= %s
-            GROUP BY page
-            """,
-            (team, start)
-        )
-        rows = cur.fetchall()
+    rows = LIVE_SHIFT.rows(team, now)  # ✅ in-memory, no DB round trip
 
     totals = defaultdict(float)
     for page, total in rows:
@@ -1123,8 +2070,9 @@ async def pagegoal(update: Update, context: ContextTypes.DEFAULT_TYPE):
             continue
 
         page_goals[page] = goal
-        db_upsert_page_goal(page, goal)
-        db_add_team_page(team, page)  # ✅ ensure it shows for this team
+        await run_db(db_upsert_page_goal, page, goal)
+        await run_db(db_add_team_page, team, page)  # ✅ ensure it shows for this team
+        bump_data_version()
         results.append(f"✓ {page} = ${goal:.2f}")
 
     msg = "📊 Page Goals Updated (15/30 days):\n" + ("\n".join(results) if results else "(no valid entries)")
@@ -1170,7 +2118,8 @@ async def clearshiftgoals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     shift_goals.clear()
-    db_clear_shift_goals()
+    await run_db(db_clear_shift_goals)
+    bump_data_version()
     await update.message.reply_text("🧹 Cleared all SHIFT goals.")
 
 async def clearpagegoals(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1181,7 +2130,8 @@ async def clearpagegoals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     page_goals.clear()
-    db_clear_page_goals()
+    await run_db(db_clear_page_goals)
+    bump_data_version()
     await update.message.reply_text("🧹 Cleared all PAGE goals (15/30 days).")
 
 async def quota_period(update: Update, context: ContextTypes.DEFAULT_TYPE, days: int, title: str):
@@ -1191,20 +2141,10 @@ async def quota_period(update: Update, context: ContextTypes.DEFAULT_TYPE, days:
     if not await require_registered_admin(update, 1):
         return
 
-    cutoff = now_ph() - timedelta(days=days)
+    now = now_ph()
+    cutoff = now - timedelta(days=days)
 
-    with db.cursor() as cur:
-        cur.execute(
-            """
-            SELECT page, SUM(amount) AS total
-            FROM sales
-            WHERE team=%s AND ts >= %s
-            GROUP BY page
-            ORDER BY total DESC
-            """,
-            (team, cutoff)
-        )
-        rows = cur.fetchall()
+    rows = await run_db(db_get_period_totals, team, cutoff, now)
 
     totals = defaultdict(float)
     for page, total in rows:
@@ -1264,9 +2204,11 @@ async def editgoalboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     manual_shift_totals[page] = amount
     manual_page_totals[page] = amount
-    db_upsert_override(page, shift_total=amount, page_total=amount)
+    await run_db(db_upsert_override, page, shift_total=amount, page_total=amount)
 
-    db_add_team_page(team, page)
+    await run_db(db_add_team_page, team, page)
+    bump_data_version()
+    await rebuild_live_shift(team)
 
     await update.message.reply_text(
         f"✅ Updated totals\nGoalboard (shift): {page} = ${amount:.2f}\nQuotas (15/30): {page} = ${amount:.2f}"
@@ -1297,9 +2239,10 @@ async def editpagegoals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Amount must be a number.")
 
     manual_page_totals[page] = amount
-    db_upsert_override(page, page_total=amount)
+    await run_db(db_upsert_override, page, page_total=amount)
 
-    db_add_team_page(team, page)
+    await run_db(db_add_team_page, team, page)
+    bump_data_version()
 
     await update.message.reply_text(f"✅ Updated quotas\n{page} = ${amount:.2f} (15/30 days)")
 
@@ -1321,7 +2264,8 @@ async def cleargoalboardoverride(update: Update, context: ContextTypes.DEFAULT_T
         return await update.message.reply_text("Invalid page/tag. Use a valid page name or hashtag tag.")
 
     manual_shift_totals[page] = 0.0
-    db_clear_override_shift(page)
+    await run_db(db_clear_override_shift, page)
+    bump_data_version()
     await update.message.reply_text(f"✅ Cleared goalboard override for {page}.")
 
 async def clearpageoverride(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1342,12 +2286,14 @@ async def clearpageoverride(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Invalid page/tag. Use a valid page name or hashtag tag.")
 
     manual_page_totals[page] = 0.0
-    db_clear_override_page(page)
+    await run_db(db_clear_override_page, page)
+    bump_data_version()
     await update.message.reply_text(f"✅ Cleared quota override for {page}.")
 
 # ----------------- OWNER: LIST TEAMS / DELETE TEAM -----------------
+@db_read
 def db_list_team_details():
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute(
             """
             SELECT name, COUNT(*) AS groups
@@ -1359,7 +2305,7 @@ def db_list_team_details():
         return [(str(n), int(c)) for (n, c) in cur.fetchall()]
 
 def db_delete_team_by_name(team_name: str):
-    with db.cursor() as cur:
+    with db_cursor() as cur:
         cur.execute("DELETE FROM teams WHERE name=%s", (team_name,))
         cur.execute("DELETE FROM report_groups WHERE team=%s", (team_name,))
         cur.execute("DELETE FROM team_pages WHERE team=%s", (team_name,))
@@ -1372,7 +2318,7 @@ async def listteams(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await require_owner(update):
         return
 
-    items = db_list_team_details()
+    items = await run_db(db_list_team_details)
     if not items:
         return await update.message.reply_text("No teams registered yet.")
 
@@ -1393,7 +2339,7 @@ async def deleteteam(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     arg = clean(" ".join(context.args)).strip()
 
-    teams = db_list_team_details()
+    teams = await run_db(db_list_team_details)
     if not teams:
         return await update.message.reply_text("No teams registered yet.")
 
@@ -1416,29 +2362,109 @@ async def deleteteam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not target:
         return await update.message.reply_text("Team not found. Use /listteams to see the list.")
 
-    db_delete_team_by_name(target)
-    load_from_db()
+    async with STATE_LOCK:
+        await run_db(db_delete_team_by_name, target)
+        # ✅ only teams/admins: goals and overrides are not guarded by STATE_LOCK
+        apply_access_state(*await run_db(db_fetch_access))
+    bump_data_version()
     await update.message.reply_text(f"🗑️ Deleted team registration: {target}\n(History sales are kept.)")
 
+# ----------------- OWNER: PAGE CATALOG -----------------
+async def addpage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await require_owner(update):
+        return
+
+    raw = update.message.text.split(maxsplit=1)
+    raw = raw[1].strip() if len(raw) > 1 else ""
+    tag, sep, page = raw.partition("=")
+    tag, page = " ".join(tag.split()), clean(page)
+    if not sep or not tag.startswith("#") or len(tag) < 2 or not page:
+        return await update.message.reply_text("Format: /addpage #tag = Page Name")
+
+    existing = CATALOG.index.lookup(tag)
+    version = await run_db(db_add_catalog_tag, tag, page)
+    await refresh_catalog()
+
+    msg = f"✅ Added {tag} → {page} (catalog v{version})"
+    if existing and existing != page:
+        msg += f"\n(was {existing})"
+    await update.message.reply_text(msg)
+
+async def retirepage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await require_owner(update):
+        return
+
+    tag = " ".join(context.args)
+    if not tag.startswith("#"):
+        return await update.message.reply_text("Format: /retirepage #tag")
+
+    version = await run_db(db_retire_catalog_tag, tag)
+    if version is None:
+        return await update.message.reply_text(f"No active tag {tag}. See /pages.")
+
+    await refresh_catalog()
+    await update.message.reply_text(
+        f"🗑️ Retired {tag} (catalog v{version}).\n(Sales already recorded under it are kept.)"
+    )
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await require_owner(update):
+        return
+
+    msg = "📈 BOT STATS\n\n"
+    d = LAST_DELIVERY_STATS
+    if d:
+        msg += (
+            f"📬 Last delivery ({d['label']}):\n"
+            f"• queued {d['queued']}: sent {d['sent']}, edited {d['edited']}, deleted {d['deleted']}\n"
+            f"• retried {d['retried']}, failed {d['failed']}\n"
+            f"• took {d['seconds']}s\n"
+        )
+    else:
+        msg += "📬 No scheduled delivery yet.\n"
+
+    msg += f"\n📘 Page catalog: v{CATALOG.version}, {len(CATALOG)} active tags\n"
+
+    sp = await run_spool(sale_spool.SaleSpool.stats)
+    msg += (
+        f"\n📥 Sale spool: {sp['pending']} message(s) pending"
+        + (f" (oldest {sp['oldest_ts'][:19]}, {sp['max_attempts']} attempt(s))" if sp["pending"] else "")
+        + f"\n• lines inserted {SPOOL_STATS['inserted']}, updated {SPOOL_STATS['updated']}, "
+        f"deleted {SPOOL_STATS['deleted']}, unchanged {SPOOL_STATS['unchanged']}\n"
+        f"• failed flushes {SPOOL_STATS['failures']}\n"
+    )
+    if sp["pending"] and sp["last_error"]:
+        msg += f"• last error: {sp['last_error'][:200]}\n"
+
+    pm = get_db_pool().metrics()
+    msg += (
+        f"\n🗄️ DB pool: {pm['in_use']} in use / {pm['size']} open (max {pm['max']}), {pm['waiting']} waiting\n"
+        f"• wait p50 {pm['wait_ms_p50']}ms, p95 {pm['wait_ms_p95']}ms, max {pm['wait_ms_max']}ms "
+        f"(last {min(pm['acquired'], 1000)} checkouts)\n"
+        f"• timeouts {pm['timeouts']}, reconnects {pm['reconnects']}, discarded {pm['discarded']}\n"
+    )
+
+    c = GOALBOARD_CACHE
+    lookups = c.hits + c.misses
+    hit_rate = (c.hits / lookups * 100.0) if lookups else 0.0
+    msg += (
+        f"\n🧩 Goalboard render cache:\n"
+        f"• hits {c.hits}, misses {c.misses} ({hit_rate:.1f}% hit)\n"
+        f"• entries {len(c.entries)}/{c.max_entries}\n"
+    )
+    await update.message.reply_text(msg)
+
 # ----------------- SCHEDULED GOALBOARD (TABLE) -----------------
-def _build_goalboard_table_lines(team: str, start: datetime):
-    now = now_ph()
+def _build_goalboard_table_lines(team: str, start: datetime, rows, team_pages, now: datetime | None = None):
+    """
+    Pure render: rows = [(page, shift_total)], team_pages = pages registered for the team.
+    Fetch both with db_get_goalboard_batch() first.
+    """
+    now = now or now_ph()
     label = current_shift_label(now)
 
     check_idx, target_ratio, checkpoint_time = pace_checkpoint(now, start)
 
-    with db.cursor() as cur:
-        cur.execute(
-            """
-            SELECT page, COALESCE(SUM(amount), 0) AS total
-            FROM sales
-            WHERE team=%s AND ts >= %s
-            GROUP BY page
-            """,
-            (team, start)
-        )
-        rows = cur.fetchall()
-
     totals = defaultdict(float)
     for page, total in rows:
         totals[str(page)] = float(total)
@@ -1449,7 +2475,7 @@ def _build_goalboard_table_lines(team: str, start: datetime):
             totals[page] = float(val)
 
     # ✅ ONLY show pages that exist for this team
-    team_pages = set(db_get_team_pages(team))
+    team_pages = set(team_pages)
     team_pages |= set(totals.keys())
     team_pages |= set(shift_goals.keys())
 
@@ -1580,61 +2606,117 @@ def _chunk_team_table_messages(team: str, header_text: str, lines: list[str]) ->
 
     return msgs
 
+def _build_goalboard_batch_messages(
+    teams: list[str], start: datetime, batch, now: datetime | None = None
+) -> list[tuple[str, list[str]]]:
+    """
+    Renders every team's (chunked) table from one db_get_goalboard_batch() result.
+    """
+    out = []
+    for team in teams:
+        rows, team_pages = batch[team]
+        header_text, lines = _build_goalboard_table_lines(team, start, rows, team_pages, now)
+        out.append((team, _chunk_team_table_messages(team, header_text, lines)))
+    return out
+
+async def build_goalboard_messages(teams: list[str], start: datetime, now: datetime) -> list[tuple[str, list[str]]]:
+    """Chunked GOALBOARD messages for many teams, fetched in one batch."""
+    batch = await run_db(db_get_goalboard_batch, teams, start)
+    return _build_goalboard_batch_messages(teams, start, batch, now)
+
+def _plan_goalboard_deliveries(team: str, chat_id: int, thread_id, msgs: list[str], posted: dict, saved: dict):
+    """
+    Edit-in-place plan for one team at one destination:
+    parts already posted this shift are edited, new parts are sent,
+    parts that no longer exist (fewer chunks now) are deleted.
+    `saved[(team, chat_id, thread_id)]` collects the resulting {part: message_id}.
+    """
+    parts = saved[(team, chat_id, thread_id)] = {i: mid for i, mid in posted.items() if i < len(msgs)}
+
+    out = []
+    for i, m in enumerate(msgs):
+        out.append(Delivery(
+            chat_id,
+            thread_id,
+            m,
+            ParseMode.MARKDOWN if "```" in m else None,
+            message_id=posted.get(i),
+            on_done=partial(parts.__setitem__, i),
+        ))
+    for i, mid in sorted(posted.items()):
+        if i >= len(msgs):
+            out.append(Delivery(chat_id, thread_id, None, message_id=mid))
+    return out
+
 async def send_scheduled_goalboard(context: ContextTypes.DEFAULT_TYPE):
     now = now_ph()
     start = shift_start(now)
 
-    global_dest = db_get_global_report_dest()
+    global_dest = await run_db(db_get_global_report_dest)
 
     # -------- GLOBAL MODE (ALL TEAMS -> one topic) --------
     if global_dest:
         dest_chat_id, dest_thread_id = global_dest
-        teams = db_list_all_teams()
+        teams = await run_db(db_list_all_teams)
         if not teams:
             return
 
-        for team in teams:
-            header_text, lines = _build_goalboard_table_lines(team, start)
-            msgs = _chunk_team_table_messages(team, header_text, lines)
-
-            for m in msgs:
-                await safe_send(
-                    context.application.bot,
-                    chat_id=dest_chat_id,
-                    thread_id=dest_thread_id,
-                    text=m,
-                    parse_mode=ParseMode.MARKDOWN if "```" in m else None
-                )
+        rendered = await build_goalboard_messages(teams, start, now)
+        posted = await run_db(db_get_goalboard_posts, start)
+        saved = {}
+        deliveries = []
+        for team, msgs in rendered:
+            deliveries += _plan_goalboard_deliveries(
+                team, dest_chat_id, dest_thread_id, msgs,
+                posted.get((team, dest_chat_id, dest_thread_id), {}), saved
+            )
+        await deliver(context.application.bot, deliveries, label="scheduled goalboard (global)")
+        await run_db(db_save_goalboard_posts, start, saved)
         return
 
     # -------- PER-TEAM MODE --------
-    report_groups = db_get_report_groups()
+    report_groups = await run_db(db_get_report_groups)
     if not report_groups:
         return
 
+    teams = [team for team, _, _ in report_groups]
+    rendered = dict(await build_goalboard_messages(teams, start, now))
+
+    posted = await run_db(db_get_goalboard_posts, start)
+    saved = {}
+    deliveries = []
     for team, chat_id, thread_id in report_groups:
-        header_text, lines = _build_goalboard_table_lines(team, start)
-        msgs = _chunk_team_table_messages(team, header_text, lines)
-
-        for m in msgs:
-            await safe_send(
-                context.application.bot,
-                chat_id=chat_id,
-                thread_id=thread_id,
-                text=m,
-                parse_mode=ParseMode.MARKDOWN if "```" in m else None
-            )
+        deliveries += _plan_goalboard_deliveries(
+            team, chat_id, thread_id, rendered[team],
+            posted.get((team, chat_id, thread_id), {}), saved
+        )
+    await deliver(context.application.bot, deliveries, label="scheduled goalboard (per-team)")
+    await run_db(db_save_goalboard_posts, start, saved)
 
-# ----------------- START -----------------
-def main():
-    init_db()
-    load_from_db()
+# ----------------- APPLICATION -----------------
+# updates handled at the same time; DB work stays bounded by the pool (DB_POOL_MAX)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(
+    token: str = BOT_TOKEN, concurrency: int = UPDATE_CONCURRENCY, request=None, base_url: str | None = None
+):
+    """
+    The bot with every handler and job registered. `request` / `base_url` swap the
+    HTTP layer / Bot API server (bench.py drives the bot against a fake Telegram).
+    """
+    builder = ApplicationBuilder().token(token).concurrent_updates(concurrency)
+    if request is not None:
+        builder = builder.request(request)
+    if base_url is not None:
+        builder = builder.base_url(base_url)
+    app = builder.build()
     app.add_error_handler(error_handler)
 
     # sales input
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_sales))
+    app.add_handler(MessageHandler(
+        (filters.UpdateType.MESSAGE | filters.UpdateType.EDITED_MESSAGE) & filters.TEXT & ~filters.COMMAND,
+        handle_sales,
+    ))
 
     # basic
     app.add_handler(CommandHandler("chatid", chatid))
@@ -1650,6 +2732,9 @@ def main():
     app.add_handler(CommandHandler("resetdaily", resetdaily))
     app.add_handler(CommandHandler("listteams", listteams))
     app.add_handler(CommandHandler("deleteteam", deleteteam))
+    app.add_handler(CommandHandler("stats", stats))
+    app.add_handler(CommandHandler("addpage", addpage))
+    app.add_handler(CommandHandler("retirepage", retirepage))
 
     # everyone
     app.add_handler(CommandHandler("pages", pages))
@@ -1680,8 +2765,124 @@ def main():
             name=f"scheduled_goalboard_{h:02d}00_ph"
         )
 
-    print("BOT RUNNING…")
+    # live shift counters: periodic check against the DB rollup
+    app.job_queue.run_repeating(
+        reconcile_live_shift,
+        interval=LIVE_RECONCILE_SECONDS,
+        first=LIVE_RECONCILE_SECONDS,
+        name="live_shift_reconcile"
+    )
+
+    # sale spool -> Postgres (backs off while the DB is unreachable)
+    app.job_queue.run_repeating(
+        flush_spool,
+        interval=SPOOL_FLUSH_SECONDS,
+        first=0,
+        name="sale_spool_flush"
+    )
+
+    # page catalog hot reload (tags added / retired by /addpage, /retirepage or another process)
+    app.job_queue.run_repeating(
+        refresh_catalog,
+        interval=CATALOG_POLL_SECONDS,
+        first=CATALOG_POLL_SECONDS,
+        name="page_catalog_reload"
+    )
+    return app
+
+def warm_start():
+    init_db()
+    load_from_db()
+
+    # ✅ warm in-memory shift counters (served by /goalboard and /redpages)
+    start = shift_start(now_ph())
+    pending = _spool_call(sale_spool.SaleSpool.pending, -1)
+    LIVE_SHIFT.load(start, db_get_live_shift_rows(start, None, pending) + _spool_shift_rows(pending, start))
+
+def close_resources():
+    spool_executor.shutdown(wait=True)
+    db_executor.shutdown(wait=True)
+    if spool is not None:
+        spool.close()
+    if db_pool is not None:
+        db_pool.closeall()
+
+# ----------------- WEBHOOK MODE -----------------
+def webhook_router(application, path: str = WEBHOOK_PATH, secret: str | None = WEBHOOK_SECRET) -> APIRouter:
+    """
+    POST `path`: Telegram pushes one update per request. Checked against the secret
+    token, queued for the application and answered at once; handlers run concurrently.
+    """
+    if not secret:
+        raise RuntimeError("WEBHOOK_SECRET not set (required in webhook mode)")
+    expected = secret.encode()
+    router = APIRouter()
+
+    @router.post(path, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), expected):
+            raise HTTPException(status_code=403, detail="Invalid secret token")
+        try:
+            data = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return Response(status_code=200)
+
+    return router
+
+@asynccontextmanager
+async def webhook_lifespan(application, url: str | None = None, secret: str | None = WEBHOOK_SECRET):
+    """
+    Runs the bot for the lifetime of an ASGI app: warm start, start the
+    application (handlers + jobs), point Telegram at `url`, clean shutdown.
+    """
+    warm_start()
+    await application.initialize()
+    await application.start()
+    if url:
+        await application.bot.set_webhook(url=url, secret_token=secret, allowed_updates=Update.ALL_TYPES)
+        print(f"✅ Webhook set: {url}")
+    try:
+        yield
+    finally:
+        await application.stop()
+        await application.shutdown()
+        close_resources()
+
+def webhook_url(base: str | None = WEBHOOK_URL, path: str = WEBHOOK_PATH) -> str | None:
+    return base.rstrip("/") + path if base else None
+
+def create_webhook_app(application) -> FastAPI:
+    """Stand-alone ASGI app for the worker: the webhook route + /health."""
+    web = FastAPI(
+        title="Sales Bot webhook",
+        lifespan=lambda _: webhook_lifespan(application, webhook_url()),
+    )
+    web.include_router(webhook_router(application))
+
+    @web.get("/health")
+    def health():
+        return {"ok": True}
+
+    return web
+
+# ----------------- START -----------------
+def main():
+    app = build_application()
+
+    if WEBHOOK_URL:
+        import uvicorn
+
+        print(f"BOT RUNNING (webhook)… (up to {UPDATE_CONCURRENCY} updates at a time)")
+        uvicorn.run(create_webhook_app(app), host="0.0.0.0", port=int(os.getenv("PORT", "8080")))
+        return
+
+    warm_start()
+    print(f"BOT RUNNING… (up to {UPDATE_CONCURRENCY} updates at a time)")
     app.run_polling(close_loop=False)
+    close_resources()
 
 if __name__ == "__main__":
     main()